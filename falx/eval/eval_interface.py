@@ -6,6 +6,7 @@ import copy
 import os
 
 from falx.table import synthesizer as table_synthesizer
+from falx.table.compiler import compile_program
 
 from falx.utils import synth_utils
 from falx.utils import eval_utils
@@ -95,7 +96,7 @@ class FalxEvalInterface(object):
 
                 for p in candidate_progs:
 
-                    output = p.eval(inputs).to_dict(orient="records")
+                    output = compile_program(p)(inputs).to_dict(orient="records")
 
                     field_mappings = synth_utils.align_table_schema(sym_data.values, output, find_all_alignments=True)
                     assert(len(field_mappings) > 0)
@@ -141,7 +142,7 @@ class FalxEvalInterface(object):
                     progs = [layer_candidate_progs[i][layer_id_choices[i]] for i in range(len(layer_id_choices))]
 
                     # apply each program on inputs to get output table for each layer
-                    outputs = [p.eval(inputs).to_dict(orient="records") for p in progs]
+                    outputs = [compile_program(p)(inputs).to_dict(orient="records") for p in progs]
 
                     all_field_mappings = [synth_utils.align_table_schema(sym_data[k].values, output, find_all_alignments=True) 
                             for k, output in enumerate(outputs)]
@@ -3,8 +3,13 @@ import itertools
 from pprint import pprint
 import numpy as np
 import copy
+import time
 
 from falx.table import synthesizer as table_synthesizer
+from falx.table.compiler import compile_program
+from falx.table.sqlite_backend import eval_sqlite
+from falx.table.chunked import iter_records
+from falx.table.language import eval_cache_scope
 
 from falx.utils import synth_utils
 from falx.utils import eval_utils
@@ -43,11 +48,30 @@ class FalxInterface(object):
             "gather_max_val_list_size": 3,
             "gather_max_key_list_size": 3,
             "consider_non_consecutive_gather_keys": False,
-            "allow_comp_without_new_val": False
+            "allow_comp_without_new_val": False,
+            # how argument values deduced from the output are used: "prioritize", "restrict" or "off"
+            "param_deduction": "prioritize",
+            # backend used to verify candidate programs: "pandas", "columnar" (see table/columnar.py)
+            # or "sqlite" (see table/sqlite_backend.py, also used to evaluate solutions on the full inputs)
+            "eval_backend": "pandas",
+            # check candidates on the input rows kept by provenance analysis instead of the full inputs
+            # (only for programs of row-wise operators, see synthesizer.SAMPLE_SAFE_OPS, others are checked on the full inputs)
+            "sample_verification": True
         },
 
         "disable_provenance_analysis": False,
 
+        # number of worker processes used to explore sketches in parallel (1: sequential search)
+        "num_workers": 1,
+
+        # order in which the table synthesizer explores the search space, one of "enumerative, best_first"
+        # (best_first expands the cheapest partial program across all sketches first, it is always sequential)
+        "search_strategy": "enumerative",
+
+        # evaluate solutions on the full inputs in chunks of this many rows (None: evaluate the whole table at once),
+        # used for large inputs (see table/chunked.py)
+        "eval_chunk_size": None,
+
         # set the visualization backend, one of "vegalite, ggplot2, matplotlib"
         # ggplot2 and matplotlib have some feature restrictions
         "vis_backend": "vegalite"
@@ -82,6 +106,9 @@ class FalxInterface(object):
         assert config["solution_limit"] >= 1
         assert config["time_limit_sec"] > 0
         assert config["max_prog_size"] >= 0
+        assert config["num_workers"] >= 1
+        assert config["search_strategy"] in ["enumerative", "best_first"]
+        assert config["eval_chunk_size"] is None or config["eval_chunk_size"] >= 1
 
         return config
 
@@ -104,10 +131,32 @@ class FalxInterface(object):
                       "grammar_base_file": "dsl/tidyverse.tyrell.base",
                       "block_sketches": [], "block_program_symbols": [], "vis_backend": "vegalite" }
         """
+        # value ids and evaluation caches are shared within one synthesis session, 
+        # sessions (e.g., concurrent requests of the server) have their own ids and caches
+        with synth_utils.value_interner_scope(), eval_cache_scope():
+            return FalxInterface.synthesize_in_session(inputs, raw_trace, extra_consts, group_results, config)
+
+    @staticmethod
+    def synthesize_in_session(inputs, raw_trace, extra_consts=[], group_results=False, config={}):
+        """the body of synthesize, run in the synthesis session (see synthesize for arguments)"""
 
         # update synthesizer config
         config = FalxInterface.update_config(config)
 
+        # the time limit is shared by all abstract designs (and all layers)
+        start_time = time.time()
+        def remaining_time():
+            return config["time_limit_sec"] - (time.time() - start_time)
+
+        # solutions are evaluated on the full inputs with the configured backend
+        def evaluate(p):
+            if config["eval_chunk_size"] is not None:
+                # records are converted chunk by chunk, the result is not collected as a dataframe
+                return list(iter_records(p, inputs, config["eval_chunk_size"]))
+            if config["grammar"]["eval_backend"] == "sqlite":
+                return eval_sqlite(p, inputs).to_dict(orient="records")
+            return compile_program(p)(inputs).to_dict(orient="records")
+
         example_trace = visual_trace.load_trace(raw_trace)
 
         # apply inverse semantics to obtain symbolic output table and vis programs
@@ -127,6 +176,10 @@ class FalxInterface(object):
         candidates = []
         for sym_data, chart in abstract_designs:
 
+            if remaining_time() <= 0:
+                logger.info("# Time limit exceeded, skip remaining designs")
+                break
+
             # split case based on single layered chart or multi layered chart
             if not isinstance(sym_data, (list,)):
                 # single-layer chart
@@ -139,13 +192,15 @@ class FalxInterface(object):
                 candidate_progs = synthesizer.enumerative_synthesis(
                                     inputs, sym_data.instantiate(), 
                                     max_prog_size=config["max_prog_size"],
-                                    time_limit_sec=config["time_limit_sec"],
+                                    time_limit_sec=remaining_time(),
                                     solution_sketch_limit=config["solution_sketch_limit"],
                                     solution_limit=config["solution_limit"],
-                                    disable_provenance_analysis=config["disable_provenance_analysis"])
+                                    disable_provenance_analysis=config["disable_provenance_analysis"],
+                                    num_workers=config["num_workers"],
+                                    search_strategy=config["search_strategy"])
 
                 for p in candidate_progs:
-                    output = p.eval(inputs).to_dict(orient="records")
+                    output = evaluate(p)
 
                     field_mappings = synth_utils.align_table_schema(sym_data.values, output, find_all_alignments=True)
                     assert(len(field_mappings) > 0)
@@ -172,23 +227,28 @@ class FalxInterface(object):
                         synthesizer.enumerative_synthesis(
                             inputs, d.instantiate(), 
                             max_prog_size=config["max_prog_size"], 
-                            time_limit_sec=config["time_limit_sec"],
+                            time_limit_sec=max(remaining_time(), 0),
                             solution_sketch_limit=config["solution_sketch_limit"],
                             solution_limit=config["solution_limit"],
-                            disable_provenance_analysis=config["disable_provenance_analysis"]))
+                            disable_provenance_analysis=config["disable_provenance_analysis"],
+                            num_workers=config["num_workers"],
+                            search_strategy=config["search_strategy"]))
             
+                # apply each program on inputs to get output table for each layer (once per program), 
+                # and align it with the symbolic output of the layer
+                layer_outputs = [[evaluate(p) for p in l] 
+                                    for l in layer_candidate_progs]
+                layer_field_mappings = [[synth_utils.align_table_schema(sym_data[k].values, output, find_all_alignments=True) 
+                                            for output in l] for k, l in enumerate(layer_outputs)]
+
                 # iterating over combinations for different layers
                 layer_id_lists = [list(range(len(l))) for l in layer_candidate_progs]
                 for layer_id_choices in itertools.product(*layer_id_lists):
 
                     #layer_prog[i] is the transformation program for the i-th layer
                     progs = [layer_candidate_progs[i][layer_id_choices[i]] for i in range(len(layer_id_choices))]
-
-                    # apply each program on inputs to get output table for each layer
-                    outputs = [p.eval(inputs).to_dict(orient="records") for p in progs]
-
-                    all_field_mappings = [synth_utils.align_table_schema(sym_data[k].values, output, find_all_alignments=True) 
-                            for k, output in enumerate(outputs)]
+                    outputs = [layer_outputs[i][layer_id_choices[i]] for i in range(len(layer_id_choices))]
+                    all_field_mappings = [layer_field_mappings[i][layer_id_choices[i]] for i in range(len(layer_id_choices))]
 
                     mapping_id_lists = [list(range(len(l))) for l in all_field_mappings]
                     for mapping_id_choices in itertools.product(*mapping_id_lists):
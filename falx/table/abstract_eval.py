@@ -1,6 +1,9 @@
 import pandas as pd
+import numpy as np
+from collections import Counter
 
 from falx.table.language import *
+from falx.table.split_index import TableSplitIndex
 from falx.utils.synth_utils import remove_duplicate_columns, check_table_inclusion
 
 def backward_eval(node, out_df, is_outer_most=True):
@@ -17,31 +20,116 @@ def backward_eval(node, out_df, is_outer_most=True):
 		it represents that the output of node at path_k should satisfy the premise that output includes df_k
 		The premise chain starts with the current node
 	"""
+	return list(PremiseCache().chains(node, out_df, is_outer_most))
 
-	#this is the premise to the current node:
-	# we require that the output of the current node includes out_df (path is empty because we need no routing)
-	current_premise = (out_df, [])
 
-	all_premesis_chains = []
-	if node["op"] != "table_ref":
+class PremiseCache(object):
+	"""premise chains of sketches (see backward_eval), generated lazily and shared by sketches.
+		Premise chains only depend on the premise and the operators of the sketch (from the outermost one),
+		so chains are cached by the key of the premise (see premise_key) and the operator sequence,
+		and candidate premises of each backward step are cached by the key of the premise and the operator.
+		Candidates of a step with the same key are merged, since they lead to the same chains.
+	"""
+	def __init__(self):
+		# (premise key, operators, is_outer_most) -> (premise, LazyChains)
+		self.entries = {}
+		# (premise key, operator, is_outer_most) -> (premise, candidate premises of the child)
+		self.steps = {}
+		# id(premise) -> (premise, premise key)
+		self.keys = {}
+		self.hits = 0
+		self.misses = 0
+
+	def chains(self, node, out_df, is_outer_most=True):
+		"""premise chains of the node from the premise out_df, in the form of backward_eval results (as a LazyChains)"""
+		ops = []
+		current_node = node
+		while current_node["op"] != "table_ref":
+			ops.append(current_node["op"])
+			current_node = current_node["children"][0]
+
+		key = (self.premise_key(out_df), tuple(ops), is_outer_most)
+		entry = self.entries.get(key)
+		if entry is None:
+			self.misses += 1
+			entry = self.entries[key] = (out_df, LazyChains(self.iter_chains(node, out_df, is_outer_most)))
+		else:
+			self.hits += 1
+		return entry[1]
+
+	def iter_chains(self, node, out_df, is_outer_most):
+		#this is the premise to the current node:
+		# we require that the output of the current node includes out_df (path is empty because we need no routing)
+		current_premise = (out_df, [])
+
+		if node["op"] == "table_ref":
+			# no children from the node
+			yield [current_premise]
+			return
+
 		# evaluate all possible premise the direct child node
-		inp_df_list = backward_eval_one_step(node["op"], out_df, is_outer_most)
-		for inp_df in inp_df_list:
-			# recursively calculate all premises from children
-			all_premesis_chains_from_child = backward_eval(node["children"][0], inp_df, False)
-			for premise_chain in all_premesis_chains_from_child:
-				# also include the premise from the current node 
-				# so that we get all premise chains starting from the current node
-				combined_with_current = [current_premise]
-				# updated paths from children by including the path to children
-				for premise in premise_chain:
-					combined_with_current += [(premise[0], [0] + premise[1])]
-				all_premesis_chains.append(combined_with_current)
-	else:
-		# no children from the node
-		all_premesis_chains.append([current_premise])
-	
-	return all_premesis_chains
+		for inp_df in self.step(node["op"], out_df, is_outer_most):
+			# premise chains from children, updated by including the path to children
+			for premise_chain in self.chains(node["children"][0], inp_df, False):
+				yield [current_premise] + [(premise[0], [0] + premise[1]) for premise in premise_chain]
+
+	def step(self, op, out_df, is_outer_most):
+		"""distinct candidate premises of the child (see backward_eval_one_step)"""
+		key = (self.premise_key(out_df), op, is_outer_most)
+		if key not in self.steps:
+			candidates = {}
+			for inp_df in backward_eval_one_step(op, out_df, is_outer_most):
+				candidates.setdefault(self.premise_key(inp_df), inp_df)
+			self.steps[key] = (out_df, list(candidates.values()))
+		return self.steps[key][1]
+
+	def premise_key(self, df):
+		entry = self.keys.get(id(df))
+		if entry is None or entry[0] is not df:
+			entry = self.keys[id(df)] = (df, premise_key(df))
+		return entry[1]
+
+	def stats(self):
+		return {"hits": self.hits, "misses": self.misses, "steps": len(self.steps)}
+
+
+class LazyChains(object):
+	"""premise chains produced by a generator on demand, 
+		chains are kept so that later iterations (e.g., by other sketches) replay them"""
+	def __init__(self, gen):
+		self.gen = gen
+		self.items = []
+
+	def __iter__(self):
+		i = 0
+		while True:
+			if i < len(self.items):
+				yield self.items[i]
+				i += 1
+				continue
+			if self.gen is None:
+				return
+			try:
+				self.items.append(next(self.gen))
+			except StopIteration:
+				self.gen = None
+
+	def __len__(self):
+		for _ in self:
+			pass
+		return len(self.items)
+
+
+def premise_key(df):
+	"""canonical key of a premise table: its columns and the multiset of its rows 
+		(values are compared together with their types, e.g., 1 and True are different),
+		premises with the same key are included by the same tables"""
+	try:
+		rows = Counter([tuple([(type(v), v) for v in r]) for r in df.itertuples(index=False, name=None)])
+		return (tuple(df.columns), frozenset(rows.items()))
+	except TypeError:
+		# unhashable values, the premise is only equal to itself
+		return ("id", id(df))
 
 
 def backward_eval_one_step(op, out_df, is_outer_most=False):
@@ -71,6 +159,7 @@ def backward_eval_one_step(op, out_df, is_outer_most=False):
 			candidates += [out_df]
 
 		# if the united column is in the output
+		split_index = TableSplitIndex(out_df)
 		for i, c in enumerate(out_df.columns):
 			if schema[i] != "string":
 				continue
@@ -82,12 +171,10 @@ def backward_eval_one_step(op, out_df, is_outer_most=False):
 				
 
 
-			col_vals = [str(v) for v in val_column.to_list()]
-
-			if all(["_" in v for v in col_vals]):
+			if split_index.column(i).contains["_"]:
 				#out_df[[x for x in out_df.columns if x != c]]
 				if not out_df.empty:
-					t = Separate(Table(0), i).eval([out_df])
+					t = Separate(Table(0), i).transform(out_df, split_index)
 					candidates += [t]
 				else:
 					candidates += [out_df]
@@ -114,16 +201,18 @@ def backward_eval_one_step(op, out_df, is_outer_most=False):
 			candidates.append(t)
 
 		# if both of the separated columns are in the output
+		# (string forms of the columns are computed once for all pairs and separators)
+		split_index = TableSplitIndex(out_df)
 		for sep_col_indexes in itertools.combinations(range(len(cols)), 2):
 			if not all([schema[i] == "string" for i in sep_col_indexes]):
 				continue
 			sep_cols = [cols[i] for i in sep_col_indexes]
 
 			for sep in ["-", "_", " "]:
-				t = Unite(Table(0), sep_col_indexes[0], sep_col_indexes[1], sep).eval([out_df])
+				t = Unite(Table(0), sep_col_indexes[0], sep_col_indexes[1], sep).transform(out_df, split_index)
 				candidates.append(t)
 			for sep in ["-", "_", " "]:
-				t = Unite(Table(0), sep_col_indexes[1], sep_col_indexes[0], sep).eval([out_df])
+				t = Unite(Table(0), sep_col_indexes[1], sep_col_indexes[0], sep).transform(out_df, split_index)
 				candidates.append(t)
 
 		return candidates
@@ -203,6 +292,120 @@ def backward_eval_one_step(op, out_df, is_outer_most=False):
 
 		return candidates
 
+def infer_args_one_step(op, arg_id, args, domain, in_df, out_dfs):
+	"""deduce arguments of an operator from output examples (the inverse of the operator on its arguments)
+	Args:
+		op: the operator
+		arg_id: the id of the argument to deduce (1 is the first argument after the subprogram)
+		args: current arguments of the operator (possibly holes), arguments before arg_id are filled
+		domain: all values of the argument (from infer_domain)
+		in_df: the evaluation result of the subprogram
+		out_dfs: output data_frame requirements (e.g., premises from different premise chains), 
+			the output of the operator should include one of them
+	Returns:
+		values in the domain that are consistent with some example, 
+		or None if nothing can be deduced for the operator / argument
+	"""
+	if op not in ARG_INVERSES:
+		return None
+	return ARG_INVERSES[op](arg_id, args, domain, in_df, out_dfs)
+
+
+def infer_gather_args(arg_id, args, domain, in_df, out_dfs):
+	# input column headers that appear as output values are gathered into the key column
+	if arg_id != 1:
+		return None
+	gathered_sets = []
+	for out_df in out_dfs:
+		out_vals = set([str(v) for v in table_values(out_df)])
+		gathered = set([i for i, c in enumerate(in_df.columns) if str(c) in out_vals])
+		if len(gathered) > 0:
+			gathered_sets.append(gathered)
+	if len(gathered_sets) == 0:
+		return None
+	return [v for v in domain if any([gathered.issubset(set(v)) for gathered in gathered_sets])]
+
+
+def infer_spread_args(arg_id, args, domain, in_df, out_dfs):
+	# output headers that are values of the key column
+	if arg_id != 1:
+		return None
+	out_headers = set([str(c) for out_df in out_dfs for c in out_df.columns])
+	keys = [i for i in range(len(in_df.columns)) 
+				if len(out_headers & set([str(v) for v in in_df.iloc[:, i].tolist()])) > 0]
+	if len(keys) == 0:
+		return None
+	return [v for v in domain if v in keys]
+
+
+def infer_unite_args(arg_id, args, domain, in_df, out_dfs):
+	# output strings that join values of two input columns
+	col_vals = [set([str(v) for v in in_df.iloc[:, i].tolist()]) for i in range(len(in_df.columns))]
+	out_strs = set([v for out_df in out_dfs for v in table_values(out_df) if isinstance(v, str) and "_" in v])
+	pairs = set()
+	for v in out_strs:
+		for k, ch in enumerate(v):
+			if ch != "_":
+				continue
+			left = [i for i, vals in enumerate(col_vals) if v[:k] in vals]
+			if len(left) == 0:
+				continue
+			right = [j for j, vals in enumerate(col_vals) if v[k + 1:] in vals]
+			pairs.update([(i, j) for i in left for j in right if i != j])
+	if len(pairs) == 0:
+		return None
+	if arg_id == 1:
+		return [v for v in domain if v in [i for i, j in pairs]]
+	elif arg_id == 2:
+		return [v for v in domain if (args[0], v) in pairs]
+	return None
+
+
+def infer_mutate_args(arg_id, args, domain, in_df, out_dfs):
+	# new numbers in the output that are sums / differences of two input columns
+	def number_set(vals):
+		return set([round(float(v), 5) for v in vals 
+					if isinstance(v, (int, float, np.number)) and not isinstance(v, (bool, np.bool_))])
+
+	new_nums = set([v for out_df in out_dfs for v in number_set(table_values(out_df))]) - number_set(table_values(in_df))
+	if len(new_nums) == 0:
+		return None
+
+	num_cols = [i for i in range(len(in_df.columns)) if pd.api.types.is_numeric_dtype(in_df.iloc[:, i]) 
+					and not pd.api.types.is_bool_dtype(in_df.iloc[:, i])]
+	triples = set()
+	for i in num_cols:
+		for j in num_cols:
+			for op in ["+", "-"]:
+				res = in_df.iloc[:, i] + in_df.iloc[:, j] if op == "+" else in_df.iloc[:, i] - in_df.iloc[:, j]
+				if len(number_set(res.tolist()) & new_nums) > 0:
+					triples.add((i, op, j))
+	if len(triples) == 0:
+		return None
+
+	if arg_id == 1:
+		return [v for v in domain if v in [t[0] for t in triples]]
+	elif arg_id == 2:
+		return [v for v in domain if v in [t[1] for t in triples if t[0] == args[0]]]
+	elif arg_id == 3:
+		return [v for v in domain if (args[0], args[1], v) in triples]
+	return None
+
+
+def table_values(df):
+	"""all cell values of the dataframe"""
+	return [v for i in range(len(df.columns)) for v in df.iloc[:, i].tolist()]
+
+
+# inverse functions used by infer_args_one_step, indexed by operators
+# (each takes arg_id, args, domain, in_df, out_dfs, and returns consistent values in the domain or None)
+ARG_INVERSES = {
+	"gather": infer_gather_args,
+	"spread": infer_spread_args,
+	"unite": infer_unite_args,
+	"mutate": infer_mutate_args,
+}
+
 if __name__ == '__main__':
 
 	inputs = [[
@@ -0,0 +1,282 @@
+import itertools
+
+import pandas as pd
+
+from falx.table.language import (Table, Select, Unite, Filter, Separate, Spread, Gather,
+	GroupSummary, CumSum, Mutate, MutateCustom, get_fresh_col)
+from falx.table.split_index import SPLIT_PATTERN
+
+# default number of input rows in a chunk
+CHUNK_SIZE = 100000
+
+# aggregation functions whose results on chunks can be combined, with the function used to combine them
+# (mean is combined from sums and counts)
+COMBINABLE_AGGR_FUNCS = {"sum": "sum", "count": "sum", "min": "min", "max": "max", "mean": "sum"}
+
+
+def eval_chunked(node, inputs, chunk_size=CHUNK_SIZE):
+	"""evaluate a concrete program chunk by chunk (see iter_chunks), the result is the same as node.eval(inputs)"""
+	chunks = list(iter_chunks(node, inputs, chunk_size))
+	if len(chunks) == 1:
+		return chunks[0]
+	return pd.concat(chunks)
+
+
+def iter_records(node, inputs, chunk_size=CHUNK_SIZE):
+	"""records of the result of a concrete program, converted chunk by chunk (see iter_chunks), 
+		the result is not collected as a whole table"""
+	for chunk in iter_chunks(node, inputs, chunk_size):
+		yield from chunk.to_dict(orient="records")
+
+
+def iter_chunks(node, inputs, chunk_size=CHUNK_SIZE):
+	"""evaluate a concrete program on inputs in chunks of at most chunk_size input rows, and yield the result in chunks.
+		Row-local operators (select, unite, separate, filter, gather, mutate, mutate_custom) are applied on each chunk,
+		cumsum keeps running totals and group_sum keeps running totals or partial aggregates of groups,
+		only spread (and group_sum with aggregation functions that cannot be combined) collects its whole input,
+		and gather evaluates its input once for each gathered column (to follow the melt order).
+		Inputs can be lists of records, dataframes or iterators of dataframes (e.g., pd.read_csv(..., chunksize=n),
+		which are consumed by the evaluation).
+		Chunks are labeled with row positions in the whole table (the same as the index of node.eval(inputs)),
+		and the result is either a sequence of non-empty chunks or one empty chunk.
+	"""
+	return CHUNK_KERNELS.get(type(node), chunks_materialized)(node, inputs, chunk_size)
+
+
+def chunks_table(node, inputs, chunk_size):
+	inp = inputs[node.data_id]
+	if isinstance(inp, (list,)):
+		columns = list(inp[0].keys())
+		# column types of chunks follow the whole table (e.g., a chunk of missing values in a number column)
+		dtypes = {c: pd.Series([r.get(c) for r in inp]).dtype for c in columns}
+		chunks = (pd.DataFrame.from_dict(inp[i:i + chunk_size])[columns] for i in range(0, len(inp), chunk_size))
+		return relabel(chunk.astype({c: dtypes[c] for c in columns if chunk[c].dtype != dtypes[c]}) for chunk in chunks)
+	elif isinstance(inp, pd.DataFrame):
+		# the labels of the input table are kept
+		return slices(inp, chunk_size)
+	return non_empty(relabel(inp))
+
+
+def chunks_row_local(node, inputs, chunk_size):
+	# the operator keeps row labels of its input
+	for chunk in iter_chunks(node.q, inputs, chunk_size):
+		yield node.transform(chunk)
+
+
+def chunks_filter(node, inputs, chunk_size):
+	chunks = (node.transform(chunk) for chunk in iter_chunks(node.q, inputs, chunk_size))
+	return relabel(non_empty(chunks))
+
+
+def chunks_gather(node, inputs, chunk_size):
+	return relabel(non_empty(chunks_melt_order(node, inputs, chunk_size)))
+
+
+def chunks_melt_order(node, inputs, chunk_size):
+	# the melted table lists all rows of the first gathered column, then all rows of the second one, etc.,
+	# so the input is evaluated once for each gathered column, and rows of the column are yielded with their chunks
+	# (inputs that can only be consumed once are evaluated once, and rows of the other columns are kept until the end)
+	if not is_reusable(node.q, inputs):
+		yield from chunks_melt_buffered(node, inputs, chunk_size)
+		return
+	for k in range(len(node.value_columns)):
+		for chunk in iter_chunks(node.q, inputs, chunk_size):
+			n = len(chunk)
+			yield node.transform(chunk).iloc[k * n:(k + 1) * n]
+
+
+def chunks_melt_buffered(node, inputs, chunk_size):
+	rest = [[] for _ in node.value_columns[1:]]
+	for chunk in iter_chunks(node.q, inputs, chunk_size):
+		ret = node.transform(chunk)
+		n = len(chunk)
+		yield ret.iloc[:n]
+		for k, blocks in enumerate(rest):
+			blocks.append(ret.iloc[(k + 1) * n:(k + 2) * n])
+	for blocks in rest:
+		yield from blocks
+
+
+def chunks_separate(node, inputs, chunk_size):
+	is_split = False
+	for chunk in iter_chunks(node.q, inputs, chunk_size):
+		if len(chunk) == 0:
+			yield node.transform(chunk)
+			continue
+		ret = chunk.copy()
+		col = ret.columns[node.col_index]
+		# the same as Separate.transform, columns of other types are only split if they contain strings
+		splitted = ret[col].astype(object).str.split(SPLIT_PATTERN.pattern, n=1, expand=True)
+		new_col_names = get_fresh_col(list(ret.columns), n=2)
+		ret[new_col_names[0]] = splitted[0]
+		if 1 in splitted.columns:
+			ret[new_col_names[1]] = splitted[1]
+			is_split = True
+		else:
+			ret[new_col_names[1]] = None
+		yield ret.drop(columns=[col])
+	if not is_split:
+		# no value is split (Separate.transform fails in this case)
+		raise KeyError(1)
+
+
+def chunks_cumsum(node, inputs, chunk_size):
+	# the last cumulative sum, prepended to the next chunk so that values are added in the same order
+	total = None
+	for chunk in iter_chunks(node.q, inputs, chunk_size):
+		ret = node.transform(chunk)
+		if total is not None:
+			col = chunk[chunk.columns[node.target]]
+			ret["cumsum"] = pd.concat([pd.Series([total]), col]).cumsum().iloc[1:].to_numpy()
+		sums = ret["cumsum"].dropna()
+		if len(sums) > 0:
+			total = sums.iloc[-1]
+		yield ret
+
+
+def chunks_group_summary(node, inputs, chunk_size):
+	if node.aggr_func == "cumsum":
+		return relabel(chunks_group_cumsum(node, inputs, chunk_size))
+	if node.aggr_func in COMBINABLE_AGGR_FUNCS:
+		return chunks_group_aggregate(node, inputs, chunk_size)
+	return chunks_materialized(node, inputs, chunk_size)
+
+
+def chunks_group_cumsum(node, inputs, chunk_size):
+	# the last cumulative sums of groups (indexed by group keys), prepended to the next chunk as in chunks_cumsum
+	totals = None
+	for chunk in iter_chunks(node.q, inputs, chunk_size):
+		if len(chunk) == 0:
+			yield node.transform(chunk)
+			continue
+		# group keys and the target are referred to by positions (the target may also be a group key)
+		num_keys = len(node.group_cols)
+		keys = list(range(num_keys))
+		df = chunk.iloc[:, list(node.group_cols) + [node.aggr_col]].set_axis(keys + [num_keys], axis=1)
+		df = df.reset_index(drop=True)
+		num_head = 0
+		if totals is not None:
+			head = totals[totals.index.isin(group_index(df, keys))].reset_index().set_axis(keys + [num_keys], axis=1)
+			num_head = len(head)
+			df = pd.concat([head, df], ignore_index=True)
+		# rows with missing keys are not grouped (their values are missing)
+		cumsum = df.groupby(keys)[num_keys].transform(pd.Series.cumsum).reindex(df.index)
+		cumsum = cumsum.iloc[num_head:].set_axis(chunk.index)
+
+		last = cumsum.groupby([df[k].iloc[num_head:].set_axis(chunk.index) for k in keys]).last()
+		totals = last if totals is None else combine_partials([totals, last], "last")
+
+		target = chunk.columns[node.aggr_col]
+		res = chunk.copy()
+		res[target] = cumsum
+		yield res.rename(columns={target: f'cumsum_{target}'}).reset_index()
+
+
+def chunks_group_aggregate(node, inputs, chunk_size):
+	chunks = iter_chunks(node.q, inputs, chunk_size)
+	first = next(chunks)
+	chunks = itertools.chain([first], chunks)
+	if len(first) == 0 or not pd.api.types.is_numeric_dtype(first[first.columns[node.aggr_col]]):
+		# partial aggregates are only combined for numbers
+		yield from chunks_materialized(node, inputs, chunk_size, chunks)
+		return
+
+	aggr_funcs = ["sum", "count"] if node.aggr_func == "mean" else [node.aggr_func]
+	combine_func = COMBINABLE_AGGR_FUNCS[node.aggr_func]
+
+	# partial aggregates of groups in chunks, combined once they have more than chunk_size groups
+	partials, num_partial_rows = [], 0
+	for chunk in chunks:
+		group_keys = [chunk.columns[idx] for idx in node.group_cols]
+		target = chunk.columns[node.aggr_col]
+		partials.append(chunk.groupby(group_keys)[target].agg(aggr_funcs))
+		num_partial_rows += len(partials[-1])
+		if len(partials) > 1 and num_partial_rows > chunk_size:
+			partials = [combine_partials(partials, combine_func)]
+			num_partial_rows = len(partials[0])
+
+	res = combine_partials(partials, combine_func)
+	if node.aggr_func == "mean":
+		res = (res["sum"] / res["count"]).round(2).to_frame(target)
+	else:
+		res.columns = [target]
+	res.columns.name = first.columns.name
+	res = res.rename(columns={target: f'{node.aggr_func}_{target}'}).reset_index()
+	yield from slices(res, chunk_size)
+
+
+def chunks_materialized(node, inputs, chunk_size, chunks=None):
+	# the operator is applied on the whole input
+	if chunks is None:
+		chunks = iter_chunks(node.q, inputs, chunk_size)
+	chunks = list(chunks)
+	df = chunks[0] if len(chunks) == 1 else pd.concat(chunks)
+	del chunks
+	yield from slices(node.transform(df), chunk_size)
+
+
+def combine_partials(partials, combine_func):
+	if len(partials) == 1:
+		return partials[0]
+	df = pd.concat(partials)
+	return df.groupby(level=list(range(df.index.nlevels))).agg(combine_func)
+
+
+def group_index(df, group_keys):
+	"""group keys of rows of df, in the form of the index of df.groupby(group_keys) results"""
+	if len(group_keys) == 1:
+		return pd.Index(df[group_keys[0]])
+	return pd.MultiIndex.from_frame(df[group_keys])
+
+
+def is_reusable(node, inputs):
+	"""whether the input table of a program can be evaluated more than once (iterators of chunks are consumed)"""
+	while not isinstance(node, Table):
+		node = node.q
+	return isinstance(inputs[node.data_id], (list, pd.DataFrame))
+
+
+def slices(df, chunk_size):
+	"""split a dataframe into chunks (an empty dataframe is one chunk)"""
+	if len(df) == 0:
+		yield df
+	for i in range(0, len(df), chunk_size):
+		yield df.iloc[i:i + chunk_size]
+
+
+def non_empty(chunks):
+	"""drop empty chunks, but keep the last one if all chunks are empty"""
+	is_empty, last = True, None
+	for chunk in chunks:
+		if len(chunk) > 0:
+			is_empty = False
+			yield chunk
+		last = chunk
+	if is_empty and last is not None:
+		yield last
+
+
+def relabel(chunks):
+	"""label rows of chunks by their positions in the whole table"""
+	offset = 0
+	for chunk in chunks:
+		labels = pd.RangeIndex(offset, offset + len(chunk))
+		if not chunk.index.equals(labels):
+			chunk = chunk.set_axis(labels, axis=0)
+		offset += len(chunk)
+		yield chunk
+
+
+CHUNK_KERNELS = {
+	Table: chunks_table,
+	Select: chunks_row_local,
+	Unite: chunks_row_local,
+	Filter: chunks_filter,
+	Separate: chunks_separate,
+	Spread: chunks_materialized,
+	Gather: chunks_gather,
+	GroupSummary: chunks_group_summary,
+	CumSum: chunks_cumsum,
+	Mutate: chunks_row_local,
+	MutateCustom: chunks_row_local,
+}
@@ -0,0 +1,155 @@
+import itertools
+from math import comb
+
+
+def iter_gather_value_columns(schema, config, deadline=None):
+	"""Lazily generate candidate value columns of gather, in the same order as the domain of Gather was
+		originally built: forward candidates (value columns of 2 .. gather_max_val_list_size columns) and
+		backward candidates (all columns except 1 .. gather_max_key_list_size key columns) are interleaved,
+		and only candidates of the same type are considered.
+		If config["consider_non_consecutive_gather_keys"] is off, only consecutive runs are generated:
+		they are constructed directly and placed by their ranks in the interleaved sequence (see fw_rank, bw_rank),
+		so that other column combinations are never enumerated.
+	"""
+	col_num = len(schema)
+	# at least leave one column as the key column, and at most gather_max_val_list_size columns
+	max_val_list_size = min(col_num - 1, config["gather_max_val_list_size"])
+	# leave at least two columns as values columns, and don't exceed col_num - gather_max_val_list_size
+	# (since such query is already covered by forward candidates) or gather_max_key_list_size
+	max_key_list_size = min(col_num - 2,
+							col_num - config["gather_max_val_list_size"] - 1,
+							config["gather_max_key_list_size"])
+
+	# columns of each type, as bitmasks
+	type_masks = {}
+	for i, s in enumerate(schema):
+		type_masks[s] = type_masks.get(s, 0) | (1 << i)
+	masks = list(type_masks.values())
+
+	if config["consider_non_consecutive_gather_keys"]:
+		fw = iter_forward_candidates(col_num, masks, max_val_list_size, deadline)
+		bw = iter_backward_candidates(col_num, masks, max_key_list_size, deadline)
+		for b, f in itertools.zip_longest(bw, fw):
+			if b is not None:
+				yield b
+			if f is not None:
+				yield f
+		return
+
+	ranked = []
+	for size in range(2, max_val_list_size + 1):
+		for start in range(col_num - size + 1):
+			run = (1 << (start + size)) - (1 << start)
+			if any([run & m == run for m in masks]):
+				ranked.append((2 * fw_rank(tuple(range(start, start + size)), col_num, masks) + 1, run))
+	for size in range(col_num - max_key_list_size, col_num):
+		if size < 2:
+			continue
+		for start in range(col_num - size + 1):
+			run = (1 << (start + size)) - (1 << start)
+			if any([run & m == run for m in masks]):
+				keys = tuple([i for i in range(col_num) if not (run >> i) & 1])
+				ranked.append((2 * bw_rank(keys, col_num, masks), run))
+	ranked.sort()
+
+	for _, run in ranked:
+		if deadline is not None:
+			deadline.check()
+		yield bits_to_tuple(run)
+
+
+def iter_forward_candidates(col_num, masks, max_size, deadline=None):
+	"""column combinations of 2 .. max_size columns of the same type (sizes ascending, then lexicographic)"""
+	for size in range(2, max_size + 1):
+		if deadline is not None:
+			deadline.check()
+		for l in itertools.combinations(range(col_num), size):
+			bits = tuple_to_bits(l)
+			if any([bits & m == bits for m in masks]):
+				yield l
+
+
+def iter_backward_candidates(col_num, masks, max_key_size, deadline=None):
+	"""complements of key column combinations of 1 .. max_key_size columns (sizes ascending, then lexicographic),
+		such that the remaining columns have the same type"""
+	full = (1 << col_num) - 1
+	for size in range(1, max_key_size + 1):
+		if deadline is not None:
+			deadline.check()
+		for l in itertools.combinations(range(col_num), size):
+			rest = full & ~tuple_to_bits(l)
+			if any([rest & m == rest for m in masks]):
+				yield bits_to_tuple(rest)
+
+
+def fw_rank(cols, col_num, masks):
+	"""the position of cols (a sorted tuple of columns of the same type) in iter_forward_candidates"""
+	size = len(cols)
+	rank = sum([comb(popcount(m), s) for s in range(2, size) for m in masks])
+	for m in masks:
+		rank += count_lex_smaller(cols, m, 0)
+	return rank
+
+
+def bw_rank(keys, col_num, masks):
+	"""the position of the complement of keys in iter_backward_candidates,
+		the complement has the same type t if and only if keys include all columns of other types"""
+	full = (1 << col_num) - 1
+	size = len(keys)
+	rank = 0
+	for m in masks:
+		num_mandatory = col_num - popcount(m)
+		rank += sum([comb(popcount(m), s - num_mandatory) for s in range(1, size) if s >= num_mandatory])
+		rank += count_lex_smaller(keys, full, full & ~m)
+	return rank
+
+
+def count_lex_smaller(cols, allowed, mandatory):
+	"""the number of sorted tuples of len(cols) columns that are lexicographically smaller than cols,
+		whose columns are all in the allowed bitmask, and that include all columns in the mandatory bitmask"""
+	size = len(cols)
+	count = 0
+	prev = -1
+	for j, c in enumerate(cols):
+		for x in range(prev + 1, c):
+			if mandatory & range_bits(prev + 1, x):
+				# a mandatory column would be skipped
+				break
+			if not (allowed >> x) & 1:
+				continue
+			# the remaining columns are larger than x: all mandatory ones, the others are chosen freely
+			num_mandatory = popcount(mandatory >> (x + 1))
+			num_free = popcount((allowed & ~mandatory) >> (x + 1))
+			if size - j - 1 >= num_mandatory:
+				count += comb(num_free, size - j - 1 - num_mandatory)
+		if mandatory & range_bits(prev + 1, c) or not (allowed >> c) & 1:
+			break
+		prev = c
+	return count
+
+
+def range_bits(lo, hi):
+	"""bitmask of columns lo .. hi - 1"""
+	return (1 << hi) - (1 << lo) if hi > lo else 0
+
+
+def popcount(bits):
+	return bin(bits).count("1")
+
+
+def tuple_to_bits(cols):
+	bits = 0
+	for c in cols:
+		bits |= 1 << c
+	return bits
+
+
+def bits_to_tuple(bits):
+	cols = []
+	i = 0
+	while bits:
+		if bits & 1:
+			cols.append(i)
+		bits >>= 1
+		i += 1
+	return tuple(cols)
@@ -0,0 +1,440 @@
+import re
+import numbers
+
+import numpy as np
+import pandas as pd
+
+from falx.table.language import (Table, Select, Unite, Filter, Separate, Spread, Gather,
+	GroupSummary, CumSum, Mutate, MutateCustom, session_cache, get_fresh_col)
+
+# columnar evaluation results of concrete subprograms (see language.EVAL_CACHE)
+COLUMNAR_CACHE = session_cache()
+
+
+class Column(object):
+	"""A column stored as a numpy array: numbers and booleans are stored as they are (data),
+		other values are dictionary encoded (codes index into dictionary, a sorted array of distinct values
+		if the values are comparable, or distinct values in the order of appearance otherwise)."""
+	__slots__ = ["data", "codes", "dictionary", "_encoding"]
+
+	def __init__(self, data=None, codes=None, dictionary=None):
+		self.data = data
+		self.codes = codes
+		self.dictionary = dictionary
+		self._encoding = None
+
+	@staticmethod
+	def from_values(values):
+		"""create a column from a list of python values, the type is inferred in the same way as pandas"""
+		if len(values) > 0 and all([isinstance(v, (bool, np.bool_)) for v in values]):
+			return Column(data=np.array(values, dtype=bool))
+		if all([is_number(v) for v in values]) and len(values) > 0:
+			if all([isinstance(v, (numbers.Integral)) for v in values]):
+				return Column(data=np.array(values, dtype=np.int64))
+			return Column(data=np.array(values, dtype=np.float64))
+		if any([is_number(v) for v in values]) and all([is_number(v) or v is None for v in values]):
+			# missing values in a number column are NaN
+			return Column(data=np.array([np.nan if v is None else v for v in values], dtype=np.float64))
+		return Column.from_codes(np.arange(len(values)), object_array(values))
+
+	@staticmethod
+	def from_codes(codes, dictionary):
+		"""create a dictionary encoded column, dictionary entries are deduplicated (and sorted)"""
+		vals = list(dictionary)
+		try:
+			distinct = sorted(set(vals))
+		except TypeError:
+			distinct = list(dict.fromkeys(vals))
+		pos = {v: i for i, v in enumerate(distinct)}
+		remap = np.array([pos[v] for v in vals], dtype=np.int64)
+		return Column(codes=remap[codes] if len(vals) > 0 else np.array(codes, dtype=np.int64),
+					  dictionary=object_array(distinct))
+
+	def __len__(self):
+		return len(self.data) if self.data is not None else len(self.codes)
+
+	def is_encoded(self):
+		return self.data is None
+
+	def values(self):
+		"""decoded values of the column"""
+		return self.data if self.data is not None else self.dictionary[self.codes]
+
+	def encoded(self):
+		"""(codes, dictionary) of the column, numbers are encoded on demand,
+			the order of codes is the same as the order of values"""
+		if self.data is None:
+			return self.codes, self.dictionary
+		if self._encoding is None:
+			dictionary, codes = np.unique(self.data, return_inverse=True)
+			self._encoding = (codes, dictionary)
+		return self._encoding
+
+	def take(self, indices):
+		if self.data is not None:
+			return Column(data=self.data[indices])
+		return Column(codes=self.codes[indices], dictionary=self.dictionary)
+
+	def is_null(self):
+		if self.data is not None:
+			return np.isnan(self.data) if self.data.dtype.kind == "f" else np.zeros(len(self.data), dtype=bool)
+		return np.array([v is None or (isinstance(v, float) and np.isnan(v)) for v in self.dictionary],
+						dtype=bool)[self.codes]
+
+	def equals_const(self, const):
+		"""elementwise comparison with a constant"""
+		if self.data is not None:
+			if not is_number(const):
+				return np.zeros(len(self.data), dtype=bool)
+			return self.data == const
+		return np.array([v == const for v in self.dictionary], dtype=bool)[self.codes]
+
+
+class ColumnTable(object):
+	"""A table represented as a list of column names and a list of Columns (the row index is always 0..n-1)"""
+	def __init__(self, names, columns, num_rows):
+		self.names = list(names)
+		self.columns = list(columns)
+		self.num_rows = num_rows
+
+	@staticmethod
+	def from_records(records):
+		keys = list(records[0].keys())
+		return ColumnTable(keys, [Column.from_values([r.get(k) for r in records]) for k in keys], len(records))
+
+	@staticmethod
+	def from_dataframe(df):
+		columns = []
+		for i in range(len(df.columns)):
+			series = df.iloc[:, i]
+			if pd.api.types.is_numeric_dtype(series):
+				columns.append(Column(data=series.to_numpy()))
+			else:
+				columns.append(Column.from_codes(np.arange(len(series)), object_array(series.tolist())))
+		return ColumnTable(df.columns, columns, len(df))
+
+	def to_dataframe(self):
+		df = pd.DataFrame({i: c.values() for i, c in enumerate(self.columns)}, index=range(self.num_rows))
+		df.columns = self.names
+		return df
+
+	def to_records(self):
+		vals = [c.values().tolist() for c in self.columns]
+		return [{name: vals[k][i] for k, name in enumerate(self.names)} for i in range(self.num_rows)]
+
+	def take(self, indices):
+		"""select rows with the given indices (or boolean mask)"""
+		num_rows = int(np.sum(indices)) if indices.dtype == bool else len(indices)
+		return ColumnTable(self.names, [c.take(indices) for c in self.columns], num_rows)
+
+
+def eval_columnar(node, inputs):
+	"""evaluate a concrete program with the columnar backend,
+		the result is the same as node.eval(inputs) (see ColumnTable.to_dataframe)"""
+	return COLUMNAR_CACHE.get_or_eval(node, inputs, lambda: COLUMNAR_KERNELS[type(node)](node, inputs))
+
+
+def eval_table(node, inputs):
+	inp = inputs[node.data_id]
+	if isinstance(inp, (list,)):
+		return ColumnTable.from_records(inp)
+	return ColumnTable.from_dataframe(inp)
+
+
+def eval_select(node, inputs):
+	t = eval_columnar(node.q, inputs)
+	return ColumnTable([t.names[i] for i in node.cols], [t.columns[i] for i in node.cols], t.num_rows)
+
+
+def eval_unite(node, inputs):
+	t = eval_columnar(node.q, inputs)
+	new_col = get_fresh_col(t.names)[0]
+	c1, c2 = t.names[node.col1], t.names[node.col2]
+
+	# concatenate distinct pairs of values, and then encode rows by pairs
+	codes1, dict1 = t.columns[node.col1].encoded()
+	codes2, dict2 = t.columns[node.col2].encoded()
+	pair_codes = codes1 * len(dict2) + codes2
+	pairs, codes = np.unique(pair_codes, return_inverse=True)
+	str1 = object_array([str(v) for v in dict1])
+	str2 = object_array([str(v) for v in dict2])
+	united = str1[pairs // max(len(dict2), 1)] + node.sep + str2[pairs % max(len(dict2), 1)]
+
+	keep = [i for i, c in enumerate(t.names) if c not in [c1, c2]]
+	return ColumnTable([t.names[i] for i in keep] + [new_col],
+					   [t.columns[i] for i in keep] + [Column.from_codes(codes, united)], t.num_rows)
+
+
+def eval_filter(node, inputs):
+	t = eval_columnar(node.q, inputs)
+	mask = t.columns[node.col_index].equals_const(node.const)
+	if node.op == "!=":
+		mask = ~mask
+	elif node.op != "==":
+		raise ValueError("[Filter] unsupported operator {}".format(node.op))
+
+	# the index is kept as the first column (see reset_index)
+	res = t.take(mask)
+	return ColumnTable([reset_index_name(t.names)] + res.names, [Column(data=np.arange(t.num_rows)[mask])] + res.columns,
+					   res.num_rows)
+
+
+def eval_separate(node, inputs):
+	t = eval_columnar(node.q, inputs)
+	column = t.columns[node.col_index]
+	if not column.is_encoded() or not any([isinstance(v, str) for v in column.dictionary]):
+		raise AttributeError("Can only use .str accessor with string values")
+
+	# split distinct values only once (at the first separator)
+	parts = []
+	for v in column.dictionary:
+		if isinstance(v, str):
+			splitted = re.split(r"\s|_|-|/", v, maxsplit=1)
+			parts.append(splitted if len(splitted) == 2 else [v, None])
+		elif v is None:
+			parts.append([None, None])
+		else:
+			parts.append([np.nan, np.nan])
+	if all([p[1] is None or (isinstance(p[1], float) and np.isnan(p[1])) for p in parts]):
+		# no value is splitted, the second column does not exist in pandas
+		raise KeyError(1)
+
+	new_col_names = get_fresh_col(t.names, n=2)
+	new_cols = [Column.from_codes(column.codes, object_array([p[k] for p in parts])) for k in range(2)]
+	keep = [i for i, c in enumerate(t.names) if c != t.names[node.col_index]]
+	return ColumnTable([t.names[i] for i in keep] + new_col_names, [t.columns[i] for i in keep] + new_cols, t.num_rows)
+
+
+def eval_spread(node, inputs):
+	t = eval_columnar(node.q, inputs)
+	key_col, val_col = t.names[node.key], t.names[node.val]
+	index_ids = [i for i, c in enumerate(t.names) if c not in [key_col, val_col]]
+	if len(index_ids) == 0:
+		raise ValueError("Must pass non-zero number of levels/codes")
+
+	# rows of the result are distinct (sorted) combinations of index columns,
+	# and columns are distinct (sorted) keys
+	index_codes = np.stack([t.columns[i].encoded()[0] for i in index_ids], axis=1)
+	row_keys, row_ids = np.unique(index_codes, axis=0, return_inverse=True)
+	row_ids = row_ids.reshape(-1)
+	key_codes, key_dict = t.columns[node.key].encoded()
+	present_keys, key_ids = np.unique(key_codes, return_inverse=True)
+
+	cells = row_ids * len(present_keys) + key_ids
+	if len(np.unique(cells)) != len(cells):
+		raise ValueError("Index contains duplicate entries, cannot reshape")
+
+	val_column = t.columns[node.val]
+	num_cells = len(row_keys) * len(present_keys)
+	missing = len(cells) < num_cells
+	vals = val_column.values()
+	if missing:
+		dtype = np.float64 if vals.dtype.kind in "iuf" else object
+		filled = np.full(num_cells, np.nan, dtype=dtype)
+	else:
+		filled = np.empty(num_cells, dtype=vals.dtype)
+	filled[cells] = vals
+
+	key_names = list(key_dict[present_keys])
+	key_columns = [Column.from_codes(np.arange(len(row_keys)), filled[k::len(present_keys)]) if filled.dtype == object
+				   else Column(data=filled[k::len(present_keys)]) for k in range(len(present_keys))]
+
+	index_names = [t.names[i] for i in index_ids]
+	if any([k in index_names for k in key_names]):
+		# index columns cannot be restored, only keys are kept
+		return ColumnTable(key_names, key_columns, len(row_keys))
+
+	first_rows = np.unique(row_ids, return_index=True)[1]
+	index_columns = [t.columns[i].take(first_rows) for i in index_ids]
+	return ColumnTable(index_names + key_names, index_columns + key_columns, len(row_keys))
+
+
+def eval_gather(node, inputs):
+	t = eval_columnar(node.q, inputs)
+	value_vars = [t.names[idx] for idx in node.value_columns]
+	key_ids = [i for i, c in enumerate(t.names) if c not in value_vars]
+	value_ids = [t.names.index(c) for c in value_vars]
+	n, k = t.num_rows, len(value_ids)
+
+	id_columns = [t.columns[i].take(np.tile(np.arange(n), k)) for i in key_ids]
+	key_column = Column.from_codes(np.repeat(np.arange(k), n), object_array(value_vars))
+
+	value_columns = [t.columns[i] for i in value_ids]
+	dtypes = [c.data.dtype for c in value_columns if not c.is_encoded()]
+	if len(dtypes) == k and (len(set([d.kind == "b" for d in dtypes])) == 1):
+		# numbers or booleans are concatenated as they are
+		value_column = Column(data=np.concatenate([c.data for c in value_columns]))
+	else:
+		vals = np.concatenate([c.values().astype(object) for c in value_columns])
+		value_column = Column.from_codes(np.arange(len(vals)), vals)
+
+	# (as in pandas, id columns named KEY or VALUE are replaced by the new columns)
+	new_columns = {"KEY": key_column, "VALUE": value_column}
+	id_columns = [new_columns.get(t.names[i], c) for i, c in zip(key_ids, id_columns)]
+	return ColumnTable([t.names[i] for i in key_ids] + ["KEY", "VALUE"],
+					   id_columns + [key_column, value_column], n * k)
+
+
+def eval_group_summary(node, inputs):
+	t = eval_columnar(node.q, inputs)
+	group_ids = list(node.group_cols)
+	target_id = node.aggr_col if node.aggr_col >= 0 else len(t.names) + node.aggr_col
+	target = t.names[target_id]
+	new_name = f"{node.aggr_func}_{target}"
+
+	# rows with missing group keys are not grouped
+	valid = np.ones(t.num_rows, dtype=bool)
+	for i in group_ids:
+		valid &= ~t.columns[i].is_null()
+	group_codes = np.stack([t.columns[i].encoded()[0] for i in group_ids], axis=1)
+	group_keys, groups = np.unique(group_codes[valid], axis=0, return_inverse=True)
+	groups = groups.reshape(-1)
+	num_groups = len(group_keys)
+
+	target_column = t.columns[target_id]
+	vals = target_column.values()[valid]
+	if node.aggr_func == "cumsum":
+		if target_column.is_encoded():
+			res = Column.from_values(object_group_cumsum(target_column.values(), valid, groups))
+		else:
+			res = np.full(t.num_rows, np.nan)
+			res[valid] = group_cumsum(vals, groups, num_groups)
+			if not np.isnan(res).any() and vals.dtype.kind in "iub":
+				res = res.astype(np.int64)
+			res = Column(data=res)
+		names = [new_name if c == target else c for c in t.names]
+		columns = [res if c == target else t.columns[i] for i, c in enumerate(t.names)]
+		return ColumnTable([reset_index_name(names)] + names, [Column(data=np.arange(t.num_rows))] + columns, t.num_rows)
+
+	nulls = target_column.is_null()[valid]
+	counts = np.bincount(groups[~nulls], minlength=num_groups)
+	if node.aggr_func == "count":
+		aggr = counts.astype(np.int64)
+	elif target_column.is_encoded():
+		if node.aggr_func != "sum":
+			raise TypeError("[GroupSummary] cannot aggregate non-numeric values with {}".format(node.aggr_func))
+		# values are added in python (e.g., strings are concatenated), groups without values sum to 0
+		sums = [0] * num_groups
+		started = [False] * num_groups
+		for g, v in zip(groups[~nulls], vals[~nulls]):
+			sums[g] = sums[g] + v if started[g] else v
+			started[g] = True
+		aggr = Column.from_values(sums)
+	elif node.aggr_func in ["sum", "mean"]:
+		sums = np.zeros(num_groups, dtype=np.int64 if vals.dtype.kind in "iub" else np.float64)
+		np.add.at(sums, groups[~nulls], vals[~nulls])
+		if node.aggr_func == "sum":
+			aggr = sums
+		else:
+			with np.errstate(invalid="ignore", divide="ignore"):
+				aggr = np.round(sums / counts, 2)
+	else:
+		raise ValueError("[GroupSummary] unsupported aggregation function {}".format(node.aggr_func))
+
+	first_rows = np.arange(t.num_rows)[valid][np.unique(groups, return_index=True)[1]]
+	aggr = aggr if isinstance(aggr, Column) else Column(data=aggr)
+	return ColumnTable([t.names[i] for i in group_ids] + [new_name],
+					   [t.columns[i].take(first_rows) for i in group_ids] + [aggr], num_groups)
+
+
+def eval_cumsum(node, inputs):
+	t = eval_columnar(node.q, inputs)
+	vals = t.columns[node.target].values()
+	res = Column(data=nan_cumsum(vals))
+	if "cumsum" in t.names:
+		# the existing column is replaced
+		return ColumnTable(t.names, [res if c == "cumsum" else t.columns[i] for i, c in enumerate(t.names)],
+						   t.num_rows)
+	return ColumnTable(t.names + ["cumsum"], t.columns + [res], t.num_rows)
+
+
+def eval_mutate(node, inputs):
+	t = eval_columnar(node.q, inputs)
+	new_col = get_fresh_col(t.names)[0]
+	v1, v2 = t.columns[node.col1].values(), t.columns[node.col2].values()
+	if node.op == "+":
+		res = v1 + v2
+	elif node.op == "-":
+		res = v1 - v2
+	else:
+		raise ValueError("[Mutate] unsupported operator {}".format(node.op))
+	res = Column(data=res) if res.dtype != object else Column.from_values(res.tolist())
+	return ColumnTable(t.names + [new_col], t.columns + [res], t.num_rows)
+
+
+def eval_mutate_custom(node, inputs):
+	t = eval_columnar(node.q, inputs)
+	if node.op != "==":
+		raise ValueError("[MutateCustom] unsupported operator {}".format(node.op))
+	new_col = get_fresh_col(t.names)[0]
+	res = Column(data=t.columns[node.col].equals_const(node.const))
+	return ColumnTable(t.names + [new_col], t.columns + [res], t.num_rows)
+
+
+# kernels of the columnar backend, indexed by operator classes
+COLUMNAR_KERNELS = {
+	Table: eval_table,
+	Select: eval_select,
+	Unite: eval_unite,
+	Filter: eval_filter,
+	Separate: eval_separate,
+	Spread: eval_spread,
+	Gather: eval_gather,
+	GroupSummary: eval_group_summary,
+	CumSum: eval_cumsum,
+	Mutate: eval_mutate,
+	MutateCustom: eval_mutate_custom,
+}
+
+# utility functions
+
+def is_number(v):
+	return isinstance(v, (numbers.Number, np.number)) and not isinstance(v, (bool, np.bool_))
+
+def object_array(values):
+	"""a 1-d object array of the values (np.array would create nested arrays for tuple values)"""
+	arr = np.empty(len(values), dtype=object)
+	for i, v in enumerate(values):
+		arr[i] = v
+	return arr
+
+def reset_index_name(names):
+	"""name of the column created by reset_index in pandas"""
+	for name in ["index", "level_0"]:
+		if name not in names:
+			return name
+	raise ValueError("cannot insert level_0, already exists")
+
+def nan_cumsum(vals):
+	"""cumulative sum that skips missing values (the same as pandas cumsum)"""
+	if vals.dtype.kind != "f":
+		return np.cumsum(vals)
+	nulls = np.isnan(vals)
+	res = np.cumsum(np.where(nulls, 0, vals))
+	res[nulls] = np.nan
+	return res
+
+def object_group_cumsum(vals, valid, groups):
+	"""cumulative sum of non-numeric values within each group (rows that are not valid are not grouped)"""
+	res = [np.nan] * len(vals)
+	totals = {}
+	for i, g in zip(np.arange(len(vals))[valid], groups):
+		totals[g] = totals[g] + vals[i] if g in totals else vals[i]
+		res[i] = totals[g]
+	return res
+
+def group_cumsum(vals, groups, num_groups):
+	"""cumulative sum within each group (in the order of rows), missing values are skipped"""
+	order = np.argsort(groups, kind="stable")
+	sorted_vals = vals[order].astype(np.float64)
+	sorted_groups = groups[order]
+	nulls = np.isnan(sorted_vals)
+	totals = np.cumsum(np.where(nulls, 0, sorted_vals))
+	# subtract the running total before the first row of each group
+	starts = np.searchsorted(sorted_groups, np.arange(num_groups))
+	base = np.where(starts > 0, totals[np.maximum(starts - 1, 0)], 0)
+	sorted_res = totals - base[sorted_groups]
+	sorted_res[nulls] = np.nan
+	res = np.empty(len(vals), dtype=np.float64)
+	res[order] = sorted_res
+	return res
@@ -0,0 +1,171 @@
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from falx.table.language import Table, Unite, Separate, Select, Gather, CumSum, Mutate, MutateCustom, get_fresh_col
+from falx.table.split_index import split_column
+from falx.table.program import Program
+
+# compiled programs, indexed by the canonical form of the program
+COMPILE_CACHE_SIZE = 512
+COMPILED_PROGRAMS = OrderedDict()
+
+
+def compile_program(node):
+	"""compile a concrete program into a callable that evaluates it on inputs (see CompiledProgram),
+		compiled programs are cached, so compiling the same program again is free"""
+	if isinstance(node, Program):
+		node = node.to_node()
+	key = node.canonical_form()
+	prog = COMPILED_PROGRAMS.get(key)
+	if prog is not None:
+		COMPILED_PROGRAMS.move_to_end(key)
+		return prog
+
+	prog = CompiledProgram(node)
+	COMPILED_PROGRAMS[key] = prog
+	if len(COMPILED_PROGRAMS) > COMPILE_CACHE_SIZE:
+		COMPILED_PROGRAMS.popitem(last=False)
+	return prog
+
+
+class CompiledProgram(object):
+	"""A concrete program compiled into a sequence of stages, calling it gives the same result as node.eval(inputs).
+		Consecutive operators that only add, drop or replace columns (select, unite, separate, cumsum, mutate,
+		mutate_custom) or stack columns (gather) are fused into one stage that works on a list of columns,
+		so that no intermediate dataframe is built (or copied) inside the stage (e.g., unite followed by gather
+		stacks the united column directly).
+		Other operators are applied on dataframes with their transform methods (see Node).
+		Unlike node.eval, intermediate results are not stored in the evaluation cache,
+		so it is suitable for running a synthesized program on the full dataset.
+	"""
+	def __init__(self, node):
+		self.node = node
+		chain = []
+		while not isinstance(node, Table):
+			chain.append(node)
+			node = node.q
+		self.table = node
+
+		# each stage is a pair (fused, operators)
+		self.stages = []
+		for op in reversed(chain):
+			fused = type(op) in COLUMN_KERNELS
+			if fused and len(self.stages) > 0 and self.stages[-1][0]:
+				self.stages[-1][1].append(op)
+			else:
+				self.stages.append((fused, [op]))
+
+	def __call__(self, inputs):
+		df = self.table.load(inputs)
+		for fused, ops in self.stages:
+			if fused:
+				df = eval_fused(ops, df)
+			else:
+				df = ops[0].transform(df)
+		return df
+
+	def __repr__(self):
+		return " | ".join(["+".join([type(op).__name__ for op in ops]) for _, ops in self.stages])
+
+
+def eval_fused(ops, df):
+	"""apply a chain of column operators on df"""
+	names = list(df.columns)
+	cols = [df.iloc[:, i] for i in range(len(names))]
+	for k, op in enumerate(ops):
+		if len(set(names)) < len(names):
+			# columns are accessed by names in these operators, fall back to dataframes if names are ambiguous
+			if k > 0:
+				df = to_dataframe(names, cols)
+			for op in ops[k:]:
+				df = op.transform(df)
+			return df
+		names, cols = COLUMN_KERNELS[type(op)](op, names, cols)
+	return to_dataframe(names, cols)
+
+
+def to_dataframe(names, cols):
+	df = pd.concat(cols, axis=1)
+	df.columns = names
+	return df
+
+
+def drop_columns(names, cols, dropped):
+	kept = [i for i, name in enumerate(names) if name not in dropped]
+	return [names[i] for i in kept], [cols[i] for i in kept]
+
+
+# column kernels: the same as Node.transform, on a list of column names and a list of series
+
+def select_columns(op, names, cols):
+	return [names[i] for i in op.cols], [cols[i] for i in op.cols]
+
+
+def unite_columns(op, names, cols):
+	new_col = get_fresh_col(names)[0]
+	united = cols[op.col1].astype(str) + op.sep + cols[op.col2].astype(str)
+	names, cols = drop_columns(names, cols, [names[op.col1], names[op.col2]])
+	return names + [new_col], cols + [united]
+
+
+def separate_columns(op, names, cols):
+	# enable splitting by "_", "-", and whitespace (but only split once)
+	new_col_names = get_fresh_col(names, n=2)
+	new_cols = list(split_column(cols[op.col_index]))
+	names, cols = drop_columns(names, cols, [names[op.col_index]])
+	return names + new_col_names, cols + new_cols
+
+
+def gather_columns(op, names, cols):
+	value_names = [names[i] for i in op.value_columns]
+	key_names = [name for name in names if name not in value_names]
+	if "KEY" in key_names or "VALUE" in key_names:
+		# melt does not rename columns that clash with the new ones, follow it on the dataframe
+		df = op.transform(to_dataframe(names, cols))
+		return list(df.columns), [df.iloc[:, i] for i in range(len(df.columns))]
+
+	# the same layout as pd.melt: key columns are repeated for each gathered column, and gathered columns are stacked
+	n, k = len(cols[0]) if len(cols) > 0 else 0, len(value_names)
+	key_cols = [pd.Series(np.tile(cols[names.index(name)].to_numpy(), k), name=name) for name in key_names]
+	var_col = pd.Series(pd.Index(value_names).repeat(n), name="KEY")
+	value_cols = [cols[names.index(name)] for name in value_names]
+	# stacked values have the common type of gathered columns (the type of an empty table of these columns)
+	dtype = pd.concat([c.iloc[:0] for c in value_cols], axis=1).values.dtype
+	value_col = pd.Series(np.concatenate([c.to_numpy(dtype=dtype) for c in value_cols]), name="VALUE")
+	return key_names + ["KEY", "VALUE"], key_cols + [var_col, value_col]
+
+
+def cumsum_columns(op, names, cols):
+	cumsum = cols[op.target].cumsum()
+	if "cumsum" in names:
+		# the existing cumsum column is replaced
+		k = names.index("cumsum")
+		return names, cols[:k] + [cumsum] + cols[k + 1:]
+	return names + ["cumsum"], cols + [cumsum]
+
+
+def mutate_columns(op, names, cols):
+	assert (op.op in ["-", "+"])
+	new_col = get_fresh_col(names)[0]
+	if op.op == "+":
+		return names + [new_col], cols + [cols[op.col1] + cols[op.col2]]
+	return names + [new_col], cols + [cols[op.col1] - cols[op.col2]]
+
+
+def mutate_custom_columns(op, names, cols):
+	assert(op.op == "==")
+	new_col = get_fresh_col(names)[0]
+	return names + [new_col], cols + [cols[op.col] == op.const]
+
+
+COLUMN_KERNELS = {
+	Select: select_columns,
+	Unite: unite_columns,
+	Separate: separate_columns,
+	Gather: gather_columns,
+	CumSum: cumsum_columns,
+	Mutate: mutate_columns,
+	MutateCustom: mutate_custom_columns,
+}
@@ -0,0 +1,87 @@
+import numpy as np
+import pandas as pd
+
+
+class KeyProfile(object):
+	"""Keys and functional dependencies of a table, discovered level by level with partition refinement.
+		The partition of a column set groups rows with the same values in these columns,
+		the partition of X + [a] is obtained by refining the partition of X with column a,
+		so each column set costs one pass over its codes instead of a duplicated() call on all its columns.
+		A column set is unique (a key) if all its groups are singletons, supersets of keys are never expanded.
+		Values are compared in the same way as DataFrame.duplicated (e.g., missing values are equal).
+	"""
+	def __init__(self, df):
+		self.num_rows = len(df)
+		self.num_cols = len(df.columns)
+		self.codes = []
+		for i in range(self.num_cols):
+			codes, uniques = pd.factorize(df.iloc[:, i])
+			# missing values (code -1) are equal to each other
+			self.codes.append((codes + 1, len(uniques) + 1))
+		# single columns are compared in the same way as Series.duplicated (None and NaN are different)
+		self.unique_columns = [not df.iloc[:, i].duplicated().any() for i in range(self.num_cols)]
+
+		# number of groups of each explored column set (tuple of sorted column ids)
+		self.num_groups = {}
+		# minimal unique column sets
+		self.keys = []
+		# non unique column sets of the last explored level, with their partitions
+		self.level = {(): (np.zeros(self.num_rows, dtype=np.int64), 1 if self.num_rows > 0 else 0)}
+		self.levels = [[()]]
+
+	def refine(self, partition, col):
+		group_ids, num_groups = partition
+		codes, num_codes = self.codes[col]
+		new_ids, uniques = pd.factorize(group_ids * num_codes + codes)
+		return new_ids, len(uniques)
+
+	def explore_next_level(self, deadline=None):
+		"""explore column sets that are one column larger than the last level
+			(the profile is only updated once the whole level is explored, so that it can be cached even if 
+			the exploration is interrupted by the deadline)"""
+		next_level, keys, num_groups = {}, [], {}
+		for cols, partition in self.level.items():
+			for col in range(cols[-1] + 1 if len(cols) > 0 else 0, self.num_cols):
+				if deadline is not None:
+					deadline.check()
+				new_cols = cols + (col,)
+				# supersets of keys are keys, skip them unless all subsets at the last level are non unique
+				if any([new_cols[:k] + new_cols[k + 1:] not in self.level for k in range(len(new_cols) - 1)]):
+					continue
+				new_partition = self.refine(partition, col)
+				num_groups[new_cols] = new_partition[1]
+				if (self.unique_columns[col] if len(new_cols) == 1 else new_partition[1] == self.num_rows):
+					keys.append(new_cols)
+				else:
+					next_level[new_cols] = new_partition
+		self.keys += keys
+		self.num_groups.update(num_groups)
+		self.level = next_level
+		self.levels.append(list(next_level.keys()))
+
+	def non_unique_column_sets(self, max_size, deadline=None):
+		"""column sets (sorted by size, then lexicographically) of at most max_size columns
+			that contain duplicate rows"""
+		while len(self.levels) <= max_size and len(self.level) > 0:
+			self.explore_next_level(deadline)
+		return [cols for level in self.levels[1:max_size + 1] for cols in level]
+
+	def has_duplicates(self, cols, deadline=None):
+		"""check if the given columns contain duplicate rows"""
+		cols = tuple(sorted(set(cols)))
+		self.non_unique_column_sets(len(cols), deadline)
+		return not any([set(key).issubset(cols) for key in self.keys])
+
+	def functional_dependencies(self):
+		"""functional dependencies X -> a among explored column sets:
+			adding column a to X does not split any group of X"""
+		fds = []
+		for cols, num_groups in self.num_groups.items():
+			if len(cols) < 2:
+				continue
+			for k in range(len(cols)):
+				lhs = cols[:k] + cols[k + 1:]
+				if self.num_groups.get(lhs) == num_groups:
+					fds.append((lhs, cols[k]))
+		return fds
+
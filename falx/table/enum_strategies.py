@@ -1,6 +1,23 @@
 from pprint import pprint
+import math
+import numbers
 from falx.table.language import HOLE
 
+# prior cost of each operator used in best-first search (lower is more likely to be used)
+OPERATOR_PRIORS = {
+    "table_ref": 0.,
+    "gather": 1.,
+    "spread": 1.,
+    "unite": 1.5,
+    "separate": 1.5,
+    "mutate": 2.,
+    "mutate_custom": 2.,
+    "cumsum": 2.,
+    "group_sum": 2.,
+    "select": 2.,
+    "filter": 2.,
+}
+
 
 def disable_sketch(p, new_vals, has_sep, comp_without_new_val):
     """check if the program sketch is a bad sketch, 
@@ -60,4 +77,49 @@ def disable_sketch(p, new_vals, has_sep, comp_without_new_val):
     # No repetitive component except for separate.
     if contains_repetition(ast, except_list=["separate"]): return True
 
-    return False
\ No newline at end of file
+    return False
+
+def default_cost_model(p, context):
+    """the default cost model for best-first search, programs with lower costs are expanded first
+    Args:
+        p: an (abstract or concrete) program, as a Program
+        context: a dict that contains information about the search state
+            "output": the output table (records)
+            "premise_chains": premise chains of the sketch (None if the sketch is not analyzed yet)
+            "subquery_result": result of the most recently instantiated subquery (None if not evaluated)
+    Returns:
+        the cost of the program (a float)
+    """
+    ops = []
+    node = p
+    while node.op != "table_ref":
+        ops.append(node.op)
+        node = node.children[0]
+
+    cost = sum([OPERATOR_PRIORS.get(op, 2.) for op in ops])
+
+    # prefer programs that are closer to be concrete 
+    # (so that we finish a promising sketch before starting new ones)
+    cost += 0.1 * len(p.holes)
+
+    # more premise chains means that the sketch is less constrained by the output
+    if context.get("premise_chains") is not None:
+        cost += 0.2 * math.log2(1 + len(context["premise_chains"]))
+
+    # penalize intermediate tables that cover few output columns 
+    # (a column is covered if all its values appear in the table, either as cells or as headers)
+    subquery_result = context.get("subquery_result")
+    output = context.get("output")
+    if subquery_result is not None and output is not None and len(output) > 0:
+        def normalize(v):
+            if isinstance(v, numbers.Number) and not isinstance(v, bool):
+                return round(float(v), 5)
+            return str(v)
+
+        table_vals = set([normalize(v) for v in subquery_result.values.flatten()] 
+                         + [normalize(c) for c in subquery_result.columns])
+        out_cols = list(output[0].keys())
+        uncovered = [c for c in out_cols if not all([normalize(r[c]) in table_vals for r in output if c in r])]
+        cost += len(uncovered) / len(out_cols)
+
+    return cost
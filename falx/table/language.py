@@ -1,8 +1,17 @@
 import pandas as pd
 import numpy as np
 from abc import ABC, abstractmethod
+from collections import OrderedDict
+import functools
 import copy
 import itertools
+import threading
+import contextlib
+
+from falx.table.pivot import spread_table, spread_schema, table_profile, num_distinct_rows
+from falx.table.dependencies import KeyProfile
+from falx.table.column_sets import iter_gather_value_columns
+from falx.table.split_index import TableSplitIndex, SEPARATORS, SPLIT_PATTERN, split_column
 
 
 # two special symbols used in the language
@@ -12,7 +21,138 @@ UNKNOWN = "_UNK_"
 # restrict how many keys can be generated from spread
 SPREAD_MAX_KEYSIZE = 10
 
+# maximum number of subprogram results kept in the evaluation cache
+EVAL_CACHE_SIZE = 2048
+
+
+class EvalCache(object):
+	"""LRU cache of evaluation results of concrete subprograms.
+		Entries are keyed by the canonical form of the subprogram and the identity of the input tables, 
+		each entry keeps a reference to its inputs so that the identity cannot be reused while it is cached.
+		Cached dataframes are shared between callers, and should not be modified in-place.
+	"""
+	def __init__(self, maxsize=EVAL_CACHE_SIZE):
+		self.maxsize = maxsize
+		self.entries = OrderedDict()
+		self.hits = 0
+		self.misses = 0
+
+	def get_or_eval(self, node, inputs, eval_func):
+		key = (id(inputs), node.canonical_form())
+		entry = self.entries.get(key)
+		if entry is not None and entry[0] is inputs:
+			self.hits += 1
+			self.entries.move_to_end(key)
+			return entry[1]
+
+		self.misses += 1
+		result = eval_func()
+		if self.maxsize is not None and self.maxsize > 0:
+			self.entries[key] = (inputs, result)
+			if len(self.entries) > self.maxsize:
+				self.entries.popitem(last=False)
+		return result
+
+	def clear(self):
+		self.entries.clear()
+		self.hits = 0
+		self.misses = 0
+
+	def stats(self):
+		return {"hits": self.hits, "misses": self.misses, "size": len(self.entries)}
+
+
+class SessionCache(threading.local):
+	"""an EvalCache of the current synthesis session: each thread has its own cache, 
+		which is replaced by an empty one in a session (see eval_cache_scope), 
+		so that results (and inputs they keep alive) are dropped once the session ends. 
+		Methods and attributes of the cache are accessed through this object.
+	"""
+	def __init__(self, maxsize=EVAL_CACHE_SIZE):
+		self.cache = EvalCache(maxsize)
+
+	def __getattr__(self, name):
+		return getattr(self.cache, name)
+
+
+# caches replaced in synthesis sessions (see session_cache)
+SESSION_CACHES = []
+
+def session_cache(maxsize=EVAL_CACHE_SIZE):
+	"""create a cache that is scoped to synthesis sessions"""
+	cache = SessionCache(maxsize)
+	SESSION_CACHES.append(cache)
+	return cache
+
+@contextlib.contextmanager
+def eval_cache_scope():
+	"""run a synthesis session with empty caches (in the current thread), 
+		the caches of the session are dropped afterwards and the previous ones are restored"""
+	previous = [c.cache for c in SESSION_CACHES]
+	for c in SESSION_CACHES:
+		c.cache = EvalCache(c.cache.maxsize)
+	try:
+		yield
+	finally:
+		for c, cache in zip(SESSION_CACHES, previous):
+			c.cache = cache
+
+
+# evaluation cache shared by all programs (of the session)
+EVAL_CACHE = session_cache()
+
+# split indexes of subprogram results (see split_index.TableSplitIndex), used by unite and separate
+SPLIT_INDEXES = session_cache()
+
+# cardinality profiles of subprogram results (see pivot.table_profile), used in domain inference of spread
+SPREAD_PROFILES = session_cache()
+
+# keys of subprogram results (see dependencies.KeyProfile), used in domain inference of group_sum
+KEY_PROFILES = session_cache()
+
+
+def memoized_eval(eval_func):
+	"""decorator for Node.eval: reuse results of subprograms that are already evaluated on the same inputs"""
+	@functools.wraps(eval_func)
+	def wrapper(self, inputs):
+		return EVAL_CACHE.get_or_eval(self, inputs, lambda: eval_func(self, inputs))
+	return wrapper
+
+
+# upper bound of a table size that is not known without evaluation
+UNBOUNDED = float("inf")
+
+
+class TableShape(object):
+	"""Abstract value of a table, computed without evaluating the program (see Node.infer_shape).
+		num_cols, num_rows: (lower bound, upper bound) of the number of columns / rows (the upper bound may be UNBOUNDED)
+	"""
+	def __init__(self, num_cols, num_rows):
+		self.num_cols = num_cols
+		self.num_rows = num_rows
+
+	@staticmethod
+	def join(shape1, shape2):
+		"""the least abstract value that contains both shapes"""
+		return TableShape(
+			(min(shape1.num_cols[0], shape2.num_cols[0]), max(shape1.num_cols[1], shape2.num_cols[1])),
+			(min(shape1.num_rows[0], shape2.num_rows[0]), max(shape1.num_rows[1], shape2.num_rows[1])))
+
+	def may_contain(self, num_cols, num_rows):
+		"""check if a table of this shape may contain a table with num_cols (distinct) columns and num_rows rows
+			(i.e., whether the containment check in align_table_schema can succeed)"""
+		return num_cols <= self.num_cols[1] and num_rows <= self.num_rows[1]
+
+	def __repr__(self):
+		return f"TableShape(cols={self.num_cols}, rows={self.num_rows})"
+
+
 class Node(ABC):
+	"""A table operator. Operators on a subprogram (all but Table) also define transform(df), 
+		which applies the operator on df (the evaluation result of the subprogram) and is used by eval 
+		and other evaluators (see compiler.py and chunked.py); df should not be modified since it may be 
+		shared with the evaluation cache.
+	"""
 	def __init__(self):
 		super(AbstractExpression, self).__init__()
 
@@ -27,29 +167,33 @@ class Node(ABC):
 		pass
 
 	@abstractmethod
-	def infer_domain(self, arg_id, config):
+	def infer_domain(self, arg_id, inputs, config, deadline=None):
+		"""infer the domain of the arg_id-th argument,
+			deadline is an optional cancellation token, checked in expensive loops (see check_deadline)"""
 		pass
 
+	def iter_domain(self, arg_id, inputs, config, deadline=None):
+		"""lazily generate the domain of the arg_id-th argument (in the same order as infer_domain), 
+			so that the search can stop before the whole domain is built"""
+		yield from self.infer_domain(arg_id, inputs, config, deadline)
+
 	@abstractmethod
 	def infer_output_info(self, inputs):
 		pass
 
+	@abstractmethod
+	def infer_shape(self, inputs):
+		"""infer a TableShape that over-approximates outputs of all instantiations of the (abstract) program,
+			it only looks at the shape of input tables, no dataframe is built"""
+		pass
+
 	@staticmethod
 	def load_from_dict(ast):
 		"""given a dictionary represented AST, load it in to a program form"""
-		constructors = {
-			"select": Select, "unite": Unite,
-			"filter": Filter, "separate": Separate,
-			"spread": Spread, "gather": Gather,
-			"group_sum": GroupSummary,
-			"cumsum": CumSum,
-			"mutate": Mutate,
-			"mutate_custom": MutateCustom,
-		}
 		if ast["op"] == "table_ref":
 			return Table(ast["children"][0]["value"])
 		else:
-			node = constructors[ast["op"]](
+			node = OP_CONSTRUCTORS[ast["op"]](
 						Node.load_from_dict(ast["children"][0]), 
 						*[arg["value"] for arg in ast["children"][1:]])
 			return node
@@ -85,6 +229,19 @@ class Node(ABC):
 		stmts, _ = _recursive_translate(self.to_dict(), [])
 		return stmts
 
+	def canonical_form(self):
+		"""a hashable representation of the subtree, used as the key for caching 
+			(it is computed once, nodes are not supposed to be modified after construction)"""
+		if getattr(self, "_canonical_form", None) is None:
+			def _canonical(val):
+				if isinstance(val, dict):
+					if val["type"] == "node":
+						return (val["op"],) + tuple(_canonical(c) for c in val["children"])
+					return canonical_value(val["value"])
+				return canonical_value(val)
+			self._canonical_form = _canonical(self.to_dict())
+		return self._canonical_form
+
 	def is_abstract(self):
 		"""Check if the subtree is abstract (contains any holes)"""
 		def contains_hole(node):
@@ -115,7 +272,7 @@ class Table(Node):
 	def __init__(self, data_id):
 		self.data_id = data_id
 
-	def infer_domain(self, arg_id, inputs, config):
+	def infer_domain(self, arg_id, inputs, config, deadline=None):
 		assert False, "Table has no args to infer domain."
 
 	def infer_output_info(self, inputs):
@@ -129,7 +286,23 @@ class Table(Node):
 		schema = extract_table_schema(df)
 		return schema
 
+	def infer_shape(self, inputs):
+		# the shape only depends on the input table, cache it for the most recent inputs
+		cached = getattr(self, "_shape", None)
+		if cached is not None and cached[0] is inputs:
+			return cached[1]
+		inp = inputs[self.data_id]
+		schema = extract_record_schema(inp) if isinstance(inp, (list,)) else extract_table_schema(inp)
+		shape = TableShape((len(schema), len(schema)), (len(inp), len(inp)))
+		self._shape = (inputs, shape)
+		return shape
+
+	@memoized_eval
 	def eval(self, inputs):
+		return self.load(inputs)
+
+	def load(self, inputs):
+		"""the input table as a dataframe"""
 		inp = inputs[self.data_id]
 		if isinstance(inp, (list,)):
 			df = pd.DataFrame.from_dict(inp)[list(inp[0].keys())]
@@ -152,12 +325,13 @@ class Select(Node):
 		self.q = q
 		self.cols = cols
 
-	def infer_domain(self, arg_id, inputs, config):
+	def infer_domain(self, arg_id, inputs, config, deadline=None):
 		if arg_id == 1:
 			input_schema = self.q.infer_output_info(inputs)
 			col_num = len(input_schema)
 			col_list_candidates = []
 			for size in range(1, col_num + 1):
+				check_deadline(deadline)
 				col_list_candidates += list(itertools.combinations(list(range(col_num)), size))
 			return col_list_candidates
 		else:
@@ -167,8 +341,17 @@ class Select(Node):
 		schema = self.q.infer_output_info(inputs)
 		return [s for i, s in enumerate(schema) if i in self.cols]
 
+	def infer_shape(self, inputs):
+		shape = self.q.infer_shape(inputs)
+		if self.cols == HOLE:
+			return TableShape((1, shape.num_cols[1]), shape.num_rows)
+		return TableShape((len(self.cols), len(self.cols)), shape.num_rows)
+
+	@memoized_eval
 	def eval(self, inputs):
-		df = self.q.eval(inputs)
+		return self.transform(self.q.eval(inputs))
+
+	def transform(self, df):
 		return df[[df.columns[i] for i in self.cols]]
 
 	def backward_eval(self, output):
@@ -191,7 +374,7 @@ class Unite(Node):
 		self.col2 = col2
 		self.sep = sep
 
-	def infer_domain(self, arg_id, inputs, config):
+	def infer_domain(self, arg_id, inputs, config, deadline=None):
 		input_schema = self.q.infer_output_info(inputs)
 		str_cols = [i for i, s in enumerate(input_schema)]
 		if arg_id == 1:
@@ -207,12 +390,25 @@ class Unite(Node):
 		input_schema = self.q.infer_output_info(inputs)
 		return [s for i,s in enumerate(input_schema) if i not in [self.col1, self.col2]] + ["string"]
 
+	def infer_shape(self, inputs):
+		shape = self.q.infer_shape(inputs)
+		return TableShape((max(shape.num_cols[0] - 1, 0), max(shape.num_cols[1] - 1, 0)), shape.num_rows)
+
+	@memoized_eval
 	def eval(self, inputs):
 		df = self.q.eval(inputs)
+		return self.transform(df, SPLIT_INDEXES.get_or_eval(self.q, inputs, lambda: TableSplitIndex(df)))
+
+	def transform(self, df, split_index=None):
 		ret = df.copy()
 		new_col = get_fresh_col(list(ret.columns))[0]
 		c1, c2 = ret.columns[self.col1], ret.columns[self.col2]
-		ret[new_col] = ret[c1].astype(str) + self.sep + ret[c2].astype(str)
+		if split_index is not None and ret.columns.is_unique:
+			# reuse string forms of the columns
+			strs1, strs2 = split_index.column(self.col1).strs, split_index.column(self.col2).strs
+		else:
+			strs1, strs2 = ret[c1].astype(str), ret[c2].astype(str)
+		ret[new_col] = strs1 + self.sep + strs2
 		ret = ret.drop(columns=[c1, c2])
 		return ret
 
@@ -239,7 +435,7 @@ class Filter(Node):
 		self.op = op
 		self.const = const
 
-	def infer_domain(self, arg_id, inputs, config):
+	def infer_domain(self, arg_id, inputs, config, deadline=None):
 		if arg_id == 1:
 			col_num = len(self.q.infer_output_info(inputs))
 			return list(range(col_num))
@@ -253,8 +449,16 @@ class Filter(Node):
 	def infer_output_info(self, inputs):
 		return self.q.infer_output_info(inputs)
 
+	def infer_shape(self, inputs):
+		# the index of the input table is kept as the first column by reset_index
+		shape = self.q.infer_shape(inputs)
+		return TableShape((shape.num_cols[0] + 1, shape.num_cols[1] + 1), (0, shape.num_rows[1]))
+
+	@memoized_eval
 	def eval(self, inputs):
-		df = self.q.eval(inputs)
+		return self.transform(self.q.eval(inputs))
+
+	def transform(self, df):
 		col = df.columns[self.col_index]
 		if self.op == "==":
 			return df[df[col] == self.const].reset_index()
@@ -280,7 +484,7 @@ class Separate(Node):
 		self.q = q
 		self.col_index = col_index
 
-	def infer_domain(self, arg_id, inputs, config):
+	def infer_domain(self, arg_id, inputs, config, deadline=None):
 		if arg_id == 1:
 			try:
 				df = self.q.eval(inputs)
@@ -288,21 +492,18 @@ class Separate(Node):
 				print(f"[eval error in infer_domain] {e}")
 				return []
 			input_schema = self.q.infer_output_info(inputs)
+			split_index = SPLIT_INDEXES.get_or_eval(self.q, inputs, lambda: TableSplitIndex(df))
 			domain = []
 			#TODO: need to improve precisions of type inferene
-			# print(df)
-			# print(input_schema)
 			for i, s in enumerate(input_schema):
+				check_deadline(deadline)
 				if s != "string": 
 					continue
-				l = list(df[df.columns[i]])
-				separators = [" ", "-", "_", "/"]
-				contain_sep = False
-				for sep in separators:
-					if all([sep in str(x) for x in l]):
-						contain_sep = True
-						break
-				if contain_sep:
+				if not df.columns.is_unique:
+					l = list(df[df.columns[i]])
+					if any([all([sep in str(x) for x in l]) for sep in SEPARATORS]):
+						domain.append(i)
+				elif split_index.column(i).contains_separator():
 					domain.append(i)
 			return domain
 		else:
@@ -312,14 +513,24 @@ class Separate(Node):
 		input_schema = self.q.infer_output_info(inputs)
 		return [s for i, s in enumerate(input_schema) if i != self.col_index] + ["string", "string"]
 
+	def infer_shape(self, inputs):
+		shape = self.q.infer_shape(inputs)
+		return TableShape((shape.num_cols[0] + 1, shape.num_cols[1] + 1), shape.num_rows)
+
+	@memoized_eval
 	def eval(self, inputs):
 		df = self.q.eval(inputs)
+		return self.transform(df, SPLIT_INDEXES.get_or_eval(self.q, inputs, lambda: TableSplitIndex(df)))
 
+	def transform(self, df, split_index=None):
 		ret = df.copy()
 		col = ret.columns[self.col_index]
 
 		# enable splitting by "_", "-", and whitespace (but only split once)
-		splitted = ret[col].str.split(r"\s|_|-|/", n=1, expand=True)
+		if ret.columns.is_unique:
+			splitted = split_column(ret[col], split_index.column(self.col_index) if split_index is not None else None)
+		else:
+			splitted = ret[col].str.split(SPLIT_PATTERN.pattern, n=1, expand=True)
 		new_col_names = get_fresh_col(list(ret.columns), n=2)
 		ret[new_col_names[0]] = splitted[0]
 		ret[new_col_names[1]] = splitted[1]
@@ -340,7 +551,7 @@ class Spread(Node):
 		self.key = key
 		self.val = val
 
-	def infer_domain(self, arg_id, inputs, config):
+	def infer_domain(self, arg_id, inputs, config, deadline=None):
 		schema = self.q.infer_output_info(inputs)
 		if arg_id == 1:
 			if self.q.is_abstract():
@@ -353,14 +564,15 @@ class Spread(Node):
 				except Exception as e:
 					print(f"[eval error in infer_domain] {e}")
 					return []
+				profiles = SPREAD_PROFILES.get_or_eval(self.q, inputs, lambda: table_profile(df))
 				cols = []
-				for i, c in enumerate(df.columns):					
-					l = list(df[c])
-					vals_cnt = [l.count(x) for x in set(l)]
+				for i, c in enumerate(df.columns):
+					check_deadline(deadline)
+					vals_cnt = profiles[i].counts
 					# (1) all values should have the same cardinality
 					# (2) their cardinality should all be greater than 1
 					# (3) there should be at least two distrint value
-					if len(set(vals_cnt)) == 1 and vals_cnt[0] > 1 and vals_cnt[0] != len(l):
+					if len(vals_cnt) > 0 and vals_cnt.min() == vals_cnt.max() and vals_cnt[0] > 1 and vals_cnt[0] != len(df):
 						cols.append(i)
 				return cols
 		if arg_id == 2:
@@ -371,38 +583,31 @@ class Spread(Node):
 					print(f"[eval error in infer_domain] {e}")
 					return []
 
+				profiles = SPREAD_PROFILES.get_or_eval(self.q, inputs, lambda: table_profile(df))
+
 				val_col_domain = []
 				for i, vcol in enumerate(df.columns):
+					check_deadline(deadline)
 					if i == self.key:
 						continue
 
-					# values in the key column
-					key_values = list(df[df.columns[self.key]])
-					key_cnt = [key_values.count(x) for x in set(key_values)]
+					# the number of distinct values in the key column
+					num_keys = profiles[self.key].num_distinct
 					
 					# values in the id column (columns outside of key or val)
-					id_cols = [c for k, c in enumerate(df.columns) if k != i and k != self.key]
+					id_col_ids = [k for k in range(len(df.columns)) if k != i and k != self.key]
+					id_cols = [df.columns[k] for k in id_col_ids]
 
 					if len(id_cols) == 0:
 						continue
-					
-					id_value_tuples = [tuple(x) for x in df[id_cols].to_records(index=False)]
 
 					# restrict how many keys can be maximally generated from spread
-					if SPREAD_MAX_KEYSIZE != None and len(set(key_values)) > SPREAD_MAX_KEYSIZE:
+					if SPREAD_MAX_KEYSIZE != None and num_keys > SPREAD_MAX_KEYSIZE:
 						continue
 
-					# print("...>>>>>>>>")
-					# print(id_cols)
-					# print(key_values)
-					# print(set(key_values))
-					# print(key_cnt)
-					# print(set(id_value_tuples))
-					# print("{} {} {}".format(len(set(id_value_tuples)), key_cnt[0], len(set(key_values))))
-
 					# only add the value column into the domain 
 					# if #cardinality of key column * #distinct values in id column matches the # of rows tables
-					if len(set(id_value_tuples)) *  len(set(key_values)) == len(key_values):
+					if num_distinct_rows([profiles[k] for k in id_col_ids]) * num_keys == len(df):
 						# if it contains duplicate entries, remove them
 						id_key_content = df[id_cols + [df.columns[self.key]]]
 						if not id_key_content.duplicated().any():
@@ -419,14 +624,35 @@ class Spread(Node):
 			return None
 		else:
 			try:
-				schema = extract_table_schema(self.eval(inputs))
+				# the schema is derived from profiles of the subquery result, 
+				# only tables pivoted through a multi-index are evaluated
+				df = self.q.eval(inputs)
+				profiles = SPREAD_PROFILES.get_or_eval(self.q, inputs, lambda: table_profile(df))
+				schema = spread_schema(df, self.key, self.val, profiles)
+				if schema is None:
+					schema = extract_table_schema(self.eval(inputs))
 				return schema
 			except Exception as e:
 				#TODO: use this to indicate the domain would be empty
 				print(f"[eval error in infer_domain] {e}")
 				return []
 
+	def infer_shape(self, inputs):
+		# rows sharing the same values in the remaining columns are merged,
+		# columns depend on distinct keys in the table, which are unknown without evaluation
+		shape = self.q.infer_shape(inputs)
+		return TableShape((0, UNBOUNDED), (min(shape.num_rows[0], 1), shape.num_rows[1]))
+
+	@memoized_eval
 	def eval(self, inputs):
+		return self.transform(self.q.eval(inputs))
+
+	def transform(self, df):
+		# most tables are pivoted by the hash-based kernel, the others through a multi-index
+		ret = spread_table(df, self.key, self.val)
+		if ret is not None:
+			return ret
+
 		def multiindex_pivot(df, columns=None, values=None):
 			# a helper function for performing multi-index pivoting
 		    #https://github.com/pandas-dev/pandas/issues/23955
@@ -440,7 +666,6 @@ class Spread(Node):
 		    index = pd.MultiIndex.from_tuples(tuples_index, names=names)
 		    df.index = index
 		    return df
-		df = self.q.eval(inputs)
 		key_col, val_col = df.columns[self.key], df.columns[self.val]
 		index_cols = [c for c in list(df.columns) if c not in [key_col, val_col]]
 		ret = df.set_index(index_cols)
@@ -470,66 +695,15 @@ class Gather(Node):
 		self.q = q
 		self.value_columns = value_columns
 
-	def infer_domain(self, arg_id, inputs, config):
+	def infer_domain(self, arg_id, inputs, config, deadline=None):
+		return list(self.iter_domain(arg_id, inputs, config, deadline))
 
+	def iter_domain(self, arg_id, inputs, config, deadline=None):
 		if arg_id == 1:
+			# value columns of the same type, consecutive unless config["consider_non_consecutive_gather_keys"]
+			# (generated lazily, see column_sets.iter_gather_value_columns)
 			input_schema = self.q.infer_output_info(inputs)
-			col_num = len(input_schema)
-			col_list_candidates = []
-
-			# at least leave one column as the key column
-			# also, choose the maximum list size based on config if the list is too long
-			# 	(this prevents exponential enumeration when the table is too wide)
-			max_val_list_size = min(col_num - 1, config["gather_max_val_list_size"])
-
-			fw_col_lists = []
-			for size in range(2, max_val_list_size + 1):
-				for l in list(itertools.combinations(list(range(col_num)), size)):
-					# only consider these fields together if they have the same type
-					if len(set([input_schema[i] for i in l])) == 1:
-						fw_col_lists.append(l)
-
-			## this is the gahter neg case: enumerate keys (instead of columns)
-			# leave at least two columns as values columns that will be unpivoted
-			# also don't exceed col_num - config["gather_max_val_list_size"] 
-			#   (since such query is already covered in gather(..))
-			# also don't exceed config["gather_max_key_list_size"] to prevent explosion
-			max_key_list_size = min(col_num - 2, 
-									col_num - config["gather_max_val_list_size"] - 1, 
-									config["gather_max_key_list_size"])
-			
-			# only consider such gather_neg stype if the table size is greater than config["gather_max_key_list_size"]
-			bw_col_lists = []
-			if max_key_list_size > 0:			
-				for size in range(1, max_key_list_size + 1):
-					for l in list(itertools.combinations(list(range(col_num)), size)):
-						# only consider these fields together if they have the same type
-						if len(set([input_schema[i] for i in range(len(input_schema)) if i not in l])) == 1:
-							bw_col_lists.append(tuple([x for x in range(col_num) if x not in l]))
-
-			# col_list_candidates = [(1,2,3,4,5)]
-			# print(col_list_candidates)
-			col_list_candidates = []
-			for i in range(max(len(fw_col_lists), len(bw_col_lists))):
-				if i < len(bw_col_lists):
-					col_list_candidates.append(bw_col_lists[i])
-				if i < len(fw_col_lists):
-					col_list_candidates.append(fw_col_lists[i])
-
-			if not config["consider_non_consecutive_gather_keys"]:
-				# only consider consecutive columns in this setup, 
-				# this is a hueristic to help narrow down the search space
-				filtered = []
-				for lst in col_list_candidates:
-					is_consecutive = True
-					for i, v in enumerate(lst):
-						if lst[i] - lst[0] != i - 0:
-							is_consecutive = False
-					if is_consecutive == True:
-						filtered.append(lst)
-				col_list_candidates = filtered
-
-			return col_list_candidates
+			yield from iter_gather_value_columns(input_schema, config, deadline)
 		else:
 			assert False, "[Gather] No args to infer domain for id > 1."
 
@@ -544,8 +718,22 @@ class Gather(Node):
 
 		return [s for i, s in enumerate(input_schema) if i not in self.value_columns] + ["string"] + [val_field_type]
 
+	def infer_shape(self, inputs):
+		shape = self.q.infer_shape(inputs)
+		if self.value_columns == HOLE:
+			# 1 to n columns are gathered into two columns
+			max_rows = shape.num_rows[1] * shape.num_cols[1] if shape.num_rows[1] > 0 else 0
+			return TableShape((2, shape.num_cols[1] + 1), (shape.num_rows[0], max_rows))
+		k = len(self.value_columns)
+		return TableShape(
+			(max(shape.num_cols[0] - k, 0) + 2, max(shape.num_cols[1] - k, 0) + 2),
+			(shape.num_rows[0] * k, shape.num_rows[1] * k))
+
+	@memoized_eval
 	def eval(self, inputs):
-		df = self.q.eval(inputs)
+		return self.transform(self.q.eval(inputs))
+
+	def transform(self, df):
 		value_vars = [df.columns[idx] for idx in self.value_columns]
 		key_vars = [c for c in df.columns if c not in value_vars]
 		return pd.melt(df, id_vars=key_vars, value_vars=value_vars, 
@@ -565,7 +753,7 @@ class GroupSummary(Node):
 		self.aggr_col = aggr_col
 		self.aggr_func = aggr_func
 
-	def infer_domain(self, arg_id, inputs, config):
+	def infer_domain(self, arg_id, inputs, config, deadline=None):
 		schema = self.q.infer_output_info(inputs)
 		if arg_id == 1:
 			# approximation: only get fields with more than one values
@@ -576,14 +764,21 @@ class GroupSummary(Node):
 				print(f"[eval error in infer_domain] {e}")
 				return []
 
+			col_num = len(schema)
+			if len(set(df.columns)) == len(df.columns):
+				# a key group is valid for aggregation if there exists at least a key appear more than once,
+				# column sets without duplicates are found by the key profile of the table (cached with the table)
+				profile = KEY_PROFILES.get_or_eval(self.q, inputs, lambda: KeyProfile(df))
+				return profile.non_unique_column_sets(col_num - 1, deadline)
+
 			# use this list to store primitive table keys, 
 			# use them to elimiate column combinations that contain no duplicates
 			table_keys = []
 
-			col_num = len(schema)
 			col_list_candidates = []
 			for size in range(1, col_num + 1 - 1):
 				for gb_keys in itertools.combinations(list(range(col_num)), size):
+					check_deadline(deadline)
 					if any([set(banned).issubset(set(gb_keys)) for banned in table_keys]):
 						# current key group is subsumbed by a table key, so all fields will be distinct
 						continue
@@ -621,13 +816,36 @@ class GroupSummary(Node):
 		aggr_type = input_schema[self.aggr_col] if self.aggr_func != "count" else "number"
 		return [s for i, s in enumerate(input_schema) if i in self.group_cols] + [aggr_type]
 
+	def infer_shape(self, inputs):
+		shape = self.q.infer_shape(inputs)
+
+		# cumsum keeps all rows and columns, the group index is added as a column
+		cumsum_shape = TableShape((shape.num_cols[0] + 1, shape.num_cols[1] + 1), shape.num_rows)
+
+		group_rows = (min(shape.num_rows[0], 1), shape.num_rows[1])
+		if self.group_cols == HOLE:
+			# 1 to n - 1 group columns, plus the aggregated column
+			aggr_shape = TableShape((2, max(shape.num_cols[1], 2)), group_rows)
+		else:
+			num_cols = len(self.group_cols) + 1
+			aggr_shape = TableShape((num_cols, num_cols), group_rows)
+
+		if self.aggr_func == "cumsum":
+			return cumsum_shape
+		elif self.aggr_func == HOLE:
+			return TableShape.join(aggr_shape, cumsum_shape)
+		return aggr_shape
+
+	@memoized_eval
 	def eval(self, inputs):
-		df = self.q.eval(inputs)
+		return self.transform(self.q.eval(inputs))
+
+	def transform(self, df):
 		group_keys = [df.columns[idx] for idx in self.group_cols]
 		target = df.columns[self.aggr_col]
 
 		if self.aggr_func == "cumsum":
-			res = df
+			res = df.copy()
 			res[target] = df.groupby(group_keys)[target].transform(pd.Series.cumsum)
 		else:
 			res = df.groupby(group_keys).agg({target: self.aggr_func})
@@ -654,7 +872,7 @@ class CumSum(Node):
 		self.q = q
 		self.target = target
 
-	def infer_domain(self, arg_id, inputs, config):
+	def infer_domain(self, arg_id, inputs, config, deadline=None):
 		if arg_id == 1:
 			input_schema = self.q.infer_output_info(inputs)
 			return [i for i, s in enumerate(input_schema) if s == "number"]
@@ -666,8 +884,16 @@ class CumSum(Node):
 
 		return input_schema + ["number"]
 
+	def infer_shape(self, inputs):
+		# the result is stored in the "cumsum" column, which replaces the column if it already exists
+		shape = self.q.infer_shape(inputs)
+		return TableShape((shape.num_cols[0], shape.num_cols[1] + 1), shape.num_rows)
+
+	@memoized_eval
 	def eval(self, inputs):
-		df = self.q.eval(inputs)
+		return self.transform(self.q.eval(inputs))
+
+	def transform(self, df):
 		ret = df.copy()
 		#new_col = get_fresh_col(list(ret.columns))[0]
 		ret["cumsum"] = ret[ret.columns[self.target]].cumsum()
@@ -688,7 +914,7 @@ class Mutate(Node):
 		self.op = op
 		self.col2 = col2
 
-	def infer_domain(self, arg_id, inputs, config):
+	def infer_domain(self, arg_id, inputs, config, deadline=None):
 		if arg_id in [1, 3]:
 			input_schema = self.q.infer_output_info(inputs)
 			number_fields = [i for i, s in enumerate(input_schema) if s == "number"]
@@ -711,9 +937,15 @@ class Mutate(Node):
 		input_schema = self.q.infer_output_info(inputs)
 		return input_schema + ["number"]
 
+	def infer_shape(self, inputs):
+		return add_column_shape(self.q.infer_shape(inputs))
+
+	@memoized_eval
 	def eval(self, inputs):
+		return self.transform(self.q.eval(inputs))
+
+	def transform(self, df):
 		assert (self.op in ["-", "+"])
-		df = self.q.eval(inputs)
 		ret = df.copy()
 		new_col = get_fresh_col(list(ret.columns))[0]
 		c1, c2 = ret.columns[self.col1], ret.columns[self.col2]
@@ -746,7 +978,7 @@ class MutateCustom(Node):
 		self.op = op
 		self.const = const
 
-	def infer_domain(self, arg_id, inputs, config):
+	def infer_domain(self, arg_id, inputs, config, deadline=None):
 		if arg_id == 1:
 			input_schema = self.q.infer_output_info(inputs)
 			return [i for i, s in enumerate(input_schema) if s == "string"]
@@ -761,9 +993,16 @@ class MutateCustom(Node):
 		input_schema = self.q.infer_output_info(inputs)
 		return input_schema + ["number"]
 
+	def infer_shape(self, inputs):
+		# the new column is the result of the comparison
+		return add_column_shape(self.q.infer_shape(inputs))
+
+	@memoized_eval
 	def eval(self, inputs):
+		return self.transform(self.q.eval(inputs))
+
+	def transform(self, df):
 		assert(self.op == "==")
-		df = self.q.eval(inputs)
 		ret = df.copy()
 		new_col = get_fresh_col(list(ret.columns))[0]
 		c = ret.columns[self.col]
@@ -785,8 +1024,38 @@ class MutateCustom(Node):
 				value_to_dict(self.const, "constant")
 			]}
 
+# constructors of operators, indexed by their names in dict represented ASTs
+OP_CONSTRUCTORS = {
+	"select": Select, "unite": Unite,
+	"filter": Filter, "separate": Separate,
+	"spread": Spread, "gather": Gather,
+	"group_sum": GroupSummary,
+	"cumsum": CumSum,
+	"mutate": Mutate,
+	"mutate_custom": MutateCustom,
+}
+
 #utility functions
 
+def check_deadline(deadline):
+	"""check the cancellation token (if there is one), 
+		the token raises an exception to abort the search once the deadline is passed"""
+	if deadline is not None:
+		deadline.check()
+
+def canonical_value(val):
+	"""convert an argument value into a hashable form, 
+		floats and bools are tagged so that e.g., 1, 1.0 and True are not conflated"""
+	if isinstance(val, (list, tuple)):
+		return tuple(canonical_value(v) for v in val)
+	if isinstance(val, (bool, float)):
+		return (type(val).__name__, val)
+	return val
+
+def add_column_shape(shape):
+	"""the shape of a table obtained by adding a column to a table of the given shape"""
+	return TableShape((shape.num_cols[0] + 1, shape.num_cols[1] + 1), shape.num_rows)
+
 def get_fresh_col(used_columns, n=1):
 	"""get a fresh column name used in pandas evaluation"""
 	names = []
@@ -826,4 +1095,21 @@ def extract_table_schema(df):
 			sys.exit(-1)
 
 	schema = [dtype_mapping(s) for s in df.infer_objects().dtypes]
-	return schema
\ No newline at end of file
+	return schema
+
+def extract_record_schema(records):
+	"""Given a table represented as a list of records, extract its schema (the same as extract_table_schema) 
+		without building a dataframe """
+	def column_type(values):
+		values = [v for v in values if v is not None]
+		if len(values) > 0 and all([isinstance(v, (bool, np.bool_)) for v in values]):
+			# a column of booleans with missing values is an object column in pandas
+			return "bool" if len(values) == len(records) else "string"
+		if len(values) > 0 and all([isinstance(v, (int, float, np.number)) and not isinstance(v, (bool, np.bool_)) 
+									for v in values]):
+			return "number"
+		return "string"
+
+	if len(records) == 0:
+		return []
+	return [column_type([r.get(key) for r in records]) for key in records[0]]
@@ -0,0 +1,137 @@
+import numpy as np
+import pandas as pd
+
+
+def spread_table(df, key, val):
+	"""Spread (pivot) the key column (index) and the value column (index) of df,
+		rows sharing the same values in other columns are merged into one row.
+		Rows are grouped by codes of the remaining columns in one pass (no row tuples are built),
+		the result is the same as pivoting with a multi-index (see Spread.transform).
+		It returns None if the table is not supported, i.e., values in the remaining columns or the key column
+		cannot be ordered in the same way as tuples of them (missing values or values of different types).
+	"""
+	key_col, val_col = df.columns[key], df.columns[val]
+	index_cols = [c for c in df.columns if c not in [key_col, val_col]]
+	if len(df) == 0 or len(index_cols) == 0 or len(set(df.columns)) < len(df.columns):
+		return None
+
+	key_codes = sorted_codes(df[key_col])
+	index_codes = [sorted_codes(df[c]) for c in index_cols]
+	if key_codes is None or any([c is None for c in index_codes]):
+		return None
+
+	# rows of the result are distinct combinations of index values (sorted), and columns are sorted keys
+	if len(index_codes) == 1:
+		row_ids, num_rows = index_codes[0][0], len(index_codes[0][1])
+	else:
+		row_keys, row_ids = np.unique(np.stack([c[0] for c in index_codes], axis=1), axis=0, return_inverse=True)
+		row_ids, num_rows = row_ids.reshape(-1), len(row_keys)
+	key_ids, keys = key_codes
+
+	cells = row_ids * len(keys) + key_ids
+	if len(np.unique(cells)) < len(cells):
+		raise ValueError("Index contains duplicate entries, cannot reshape")
+
+	# missing cells are NaN (the value column is upcast in the same way as reindexing)
+	filled = pd.Series(df[val_col].to_numpy(), index=cells).reindex(range(num_rows * len(keys))).to_numpy()
+	ret = pd.DataFrame(filled.reshape(num_rows, len(keys)), columns=pd.Index(keys, name=key_col))
+
+	# the index is restored from one row per group, in the same way as a multi-index pivot 
+	# (index columns are cast to the common type of them)
+	first_rows = np.unique(row_ids, return_index=True)[1]
+	ret.index = pd.MultiIndex.from_tuples([tuple(r) for r in df[index_cols].iloc[first_rows].values], names=index_cols)
+	try:
+		return ret.reset_index()
+	except:
+		# keys conflict with names of index columns, index columns are dropped
+		return ret.reset_index(drop=True)
+
+
+def spread_schema(df, key, val, profiles):
+	"""the schema (see language.extract_table_schema) of spread_table(df, key, val), 
+		computed from cardinality profiles of df (see table_profile) without building the result,
+		it returns None if the table is not supported by spread_table (or the schema depends on the values),
+		and raises ValueError in the same way as spread_table"""
+	key_col, val_col = df.columns[key], df.columns[val]
+	index_ids = [i for i, c in enumerate(df.columns) if c not in [key_col, val_col]]
+	if len(df) == 0 or len(index_ids) == 0 or len(set(df.columns)) < len(df.columns):
+		return None
+	if not all([is_sortable(df.iloc[:, i]) for i in index_ids + [key]]):
+		return None
+	# values of a mixed column may have different types for different keys
+	if df[val_col].dtype.kind not in "iufb" and not is_sortable(df[val_col]):
+		return None
+
+	num_keys = profiles[key].num_distinct
+	num_groups = num_distinct_rows([profiles[i] for i in index_ids])
+	if num_distinct_rows([profiles[i] for i in index_ids + [key]]) < len(df):
+		raise ValueError("Index contains duplicate entries, cannot reshape")
+
+	# columns of index values keep their types, and missing cells turn boolean values into objects
+	if df[val_col].dtype.kind == "b":
+		# the number of rows of each key (keys are sorted in the result)
+		key_counts = np.bincount(sorted_codes(df[key_col])[0], minlength=num_keys)
+		val_types = ["bool" if cnt == num_groups else "string" for cnt in key_counts]
+	else:
+		val_types = ["string" if df[val_col].dtype.kind == "O" else "number"] * num_keys
+	index_types = ["string" if df.iloc[:, i].dtype.kind == "O" else 
+				   "bool" if df.iloc[:, i].dtype.kind == "b" else "number" for i in index_ids]
+	if len(set(df.columns[index_ids]) & set(df[key_col].tolist())) > 0:
+		# keys conflict with names of index columns, index columns are dropped
+		index_types = []
+	return index_types + val_types
+
+
+def is_sortable(series):
+	"""check if values in the column can be ordered (no missing values, and all values have the same type)"""
+	kind = series.dtype.kind
+	if kind == "f":
+		return not series.isna().any()
+	elif kind == "O":
+		return all([isinstance(v, str) for v in series.tolist()])
+	return kind in "iub"
+
+
+def sorted_codes(series):
+	"""codes of values in the column following the order of values, and the sorted distinct values,
+		or None if values cannot be ordered (missing values, or values of different types)"""
+	if not is_sortable(series):
+		return None
+	codes, uniques = pd.factorize(series, sort=True)
+	return codes, np.asarray(uniques)
+
+
+class ColumnProfile(object):
+	"""Cardinality profile of a column, used in domain inference of spread.
+		codes: codes of values (values are compared in the same way as in python sets,
+			e.g., each NaN in a float column is a distinct value)
+		counts: the number of occurrences of each distinct value
+	"""
+	def __init__(self, series):
+		if series.dtype.kind == "O" and series.isna().any():
+			# compare missing values in the same way as python (None equals None, NaN only equals itself)
+			value_ids = {}
+			self.codes = np.array([value_ids.setdefault(v, len(value_ids)) for v in series.tolist()], dtype=np.int64)
+		else:
+			self.codes = pd.factorize(series)[0]
+			missing = self.codes < 0
+			if missing.any():
+				self.codes = self.codes.copy()
+				self.codes[missing] = self.codes.max() + 1 + np.arange(int(missing.sum()))
+		self.counts = np.bincount(self.codes) if len(self.codes) > 0 else np.array([], dtype=np.int64)
+
+	@property
+	def num_distinct(self):
+		return len(self.counts)
+
+
+def table_profile(df):
+	"""cardinality profiles of all columns of df"""
+	return [ColumnProfile(df.iloc[:, i]) for i in range(len(df.columns))]
+
+
+def num_distinct_rows(profiles):
+	"""the number of distinct rows of the table formed by the profiled columns"""
+	if len(profiles) == 1:
+		return profiles[0].num_distinct
+	return len(np.unique(np.stack([p.codes for p in profiles], axis=1), axis=0))
@@ -0,0 +1,131 @@
+import weakref
+
+from falx.table.language import HOLE, Node, Table, OP_CONSTRUCTORS, canonical_value
+
+
+class ProgramTable(object):
+	"""the interning table of a search: live program nodes indexed by (op, children),
+		programs (and their cached strings / Node forms) are never shared by two tables"""
+
+	def __init__(self):
+		self.programs = weakref.WeakValueDictionary()
+
+	def make(self, op, children):
+		"""create a program node (or return the existing one if it is already created)"""
+		intern_key = (op, tuple(c if isinstance(c, Program) else canonical_value(c) for c in children))
+		prog = self.programs.get(intern_key)
+		if prog is None:
+			prog = Program(op, tuple(children), intern_key, self)
+			self.programs[intern_key] = prog
+		return prog
+
+	def __len__(self):
+		return len(self.programs)
+
+
+class Program(object):
+	"""Immutable, hash-consed program representation used in the search loop.
+		Children follow the layout of dict represented ASTs: for a table_ref node, children is (data_id,);
+		for other operators, children[0] is the subprogram and children[1:] are arguments (possibly HOLE).
+		Programs are created by a ProgramTable: structurally equal programs of the same table are the same object,
+		filling a hole rebuilds only the path to it (in the same table),
+		and the hash, hole positions, printed form and Node form are computed at most once per node.
+	"""
+	__slots__ = ["op", "children", "key", "holes", "depth", "table", "_hash", "_str", "_node", "__weakref__"]
+
+	def __init__(self, op, children, intern_key, table):
+		self.op = op
+		self.table = table
+		self.children = children
+		# key is the same as Node.canonical_form of the corresponding node
+		self.key = (op,) + tuple(c.key if isinstance(c, Program) else k
+									for c, k in zip(children, intern_key[1]))
+		self._hash = hash(intern_key)
+
+		holes = []
+		for i, c in enumerate(children):
+			if isinstance(c, Program):
+				holes += [(i,) + path for path in c.holes]
+			elif isinstance(c, str) and c == HOLE:
+				holes.append((i,))
+		self.holes = tuple(holes)
+		self.depth = 0 if op == "table_ref" else children[0].depth + 1
+		self._str = None
+		self._node = None
+
+	def __hash__(self):
+		return self._hash
+
+	def __eq__(self, other):
+		# programs of the same table are interned, the structural check is only needed across tables
+		if self is other:
+			return True
+		return isinstance(other, Program) and self._hash == other._hash and self.key == other.key
+
+	def __repr__(self):
+		return self.stmt_string()
+
+	@staticmethod
+	def from_dict(ast, table=None):
+		"""load a dictionary represented AST into the given table (a new one if not given)"""
+		if table is None:
+			table = ProgramTable()
+		if ast["op"] == "table_ref":
+			return table.make("table_ref", (ast["children"][0]["value"],))
+		return table.make(ast["op"],
+			(Program.from_dict(ast["children"][0], table),) + tuple(arg["value"] for arg in ast["children"][1:]))
+
+	@staticmethod
+	def from_node(node, table=None):
+		return Program.from_dict(node.to_dict(), table)
+
+	def to_node(self):
+		"""the Node form of the program (shared, it should not be modified)"""
+		if self._node is None:
+			if self.op == "table_ref":
+				node = Table(self.children[0])
+			else:
+				node = OP_CONSTRUCTORS[self.op](self.children[0].to_node(), *self.children[1:])
+			node._canonical_form = self.key
+			self._node = node
+		return self._node
+
+	def is_abstract(self):
+		return len(self.holes) > 0
+
+	def get(self, path):
+		"""get the subprogram (or argument value) at the given path"""
+		prog = self
+		for k in path:
+			prog = prog.children[k]
+		return prog
+
+	def fill(self, path, val):
+		"""return a new program with the value at the given path replaced by val,
+			subtrees outside of the path are shared with the current program"""
+		k = path[0]
+		new_val = val if len(path) == 1 else self.children[k].fill(path[1:], val)
+		return self.table.make(self.op, self.children[:k] + (new_val,) + self.children[k + 1:])
+
+	def context_key(self, path):
+		"""the key of the program with the subprogram at the given path replaced by a hole"""
+		if len(path) == 0:
+			return HOLE
+		k = path[0]
+		return self.key[:k + 1] + (self.children[k].context_key(path[1:]),) + self.key[k + 2:]
+
+	def sketch(self):
+		"""the sketch of the program: all arguments replaced by holes"""
+		if self.op == "table_ref":
+			return self
+		return self.table.make(self.op, (self.children[0].sketch(),) + tuple(HOLE for _ in self.children[1:]))
+
+	def stmt_string(self):
+		"""the same as Node.stmt_string"""
+		if self._str is None:
+			if self.op == "table_ref":
+				self._str = f"t0 <- table_ref({self.children[0]})"
+			else:
+				args = ", ".join([f"t{self.depth - 1}"] + [str(x) for x in self.children[1:]])
+				self._str = f"{self.children[0].stmt_string()}; t{self.depth} <- {self.op}({args})"
+		return self._str
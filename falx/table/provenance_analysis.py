@@ -1,24 +1,48 @@
 import pandas as pd
+import numpy as np
 import sys
+from collections import OrderedDict
+
+from falx.table.value_index import table_index, value_key
 
 # predicate language definition
 
+# each predicate has a key, predicates with the same key are equivalent (see simplify)
+
 class PredTrue(object):
 	def __init__(self):
-		pass
+		self.key = ("true",)
 
-	def check(self, row):
+	def check(self, row, row_keys=None):
 		return True
 
+	def mask(self, view, memo=None):
+		return np.ones(view.num_rows, dtype=bool)
+
 	def print_str(self, indent="", multi_line=True):
 		return f"{indent}True()"
 
 class PredDisj(object):
 	def __init__(self, preds):
-		self.preds = preds		
+		self.preds = preds
+		self.key = ("or", frozenset([p.key for p in preds]))
 
-	def check(self, row):
-		return any([p.check(row) for p in self.preds])
+	def check(self, row, row_keys=None):
+		if row_keys is None:
+			row_keys = value_keys(row)
+		return any([p.check(row, row_keys) for p in self.preds])
+
+	def mask(self, view, memo=None):
+		if memo is not None and self.key in memo:
+			return memo[self.key]
+		ret = np.zeros(view.num_rows, dtype=bool)
+		for p in self.preds:
+			ret |= p.mask(view, memo)
+			if ret.all():
+				break
+		if memo is not None:
+			memo[self.key] = ret
+		return ret
 
 	def print_str(self, indent="", multi_line=True):
 
@@ -34,9 +58,24 @@ class PredDisj(object):
 class PredConj(object):
 	def __init__(self, preds):
 		self.preds = preds
+		self.key = ("and", frozenset([p.key for p in preds]))
 
-	def check(self, row):
-		return all([p.check(row) for p in self.preds])
+	def check(self, row, row_keys=None):
+		if row_keys is None:
+			row_keys = value_keys(row)
+		return all([p.check(row, row_keys) for p in self.preds])
+
+	def mask(self, view, memo=None):
+		if memo is not None and self.key in memo:
+			return memo[self.key]
+		ret = np.ones(view.num_rows, dtype=bool)
+		for p in self.preds:
+			ret &= p.mask(view, memo)
+			if not ret.any():
+				break
+		if memo is not None:
+			memo[self.key] = ret
+		return ret
 
 	def print_str(self, indent="", multi_line=True):
 		out = f"{indent if multi_line else ''}Conjunction[ " + ", ".join([p.print_str("", False) for p in self.preds])  + " ]"
@@ -47,23 +86,151 @@ class PredContainsSubstr(object):
 	"""check if there exists any value in the row contains the substring"""
 	def __init__(self, val):
 		self.val = val
+		self.key = ("substr", val)
 
-	def check(self, row):
+	def check(self, row, row_keys=None):
 		return any([(self.val in v) for v in row if isinstance(v, str)])
 
+	def mask(self, view, memo=None):
+		return view.substr_mask(self.val)
+
 	def print_str(self, indent="", multi_line=True):
 		return f"{indent}substr({self.val})"
 
 class PredContainsVal(object):
+	"""check if there exists any value in the row that equals to the value (or its string representation)"""
 	def __init__(self, val):
 		self.val = val
+		self.keys = value_keys([val])
+		# values with the same keys match the same values
+		self.key = ("val", frozenset(self.keys))
+
+	def check(self, row, row_keys=None):
+		if row_keys is None:
+			row_keys = value_keys(row)
+		return not self.keys.isdisjoint(row_keys)
 
-	def check(self, row):
-		return self.val in row or any([str(self.val) == str(v) for v in row])
+	def mask(self, view, memo=None):
+		return view.value_mask(self.keys)
 
 	def print_str(self, indent="", multi_line=True):
 		return f"{indent}{self.val}"
 
+def value_keys(row):
+	"""keys of values in the row and their string representations (see value_index.value_key),
+		two values match if they share a key. Values matched in the original check 
+		(v1 == v2 or str(v1) == str(v2)) always share a key, numbers are also matched after rounding 
+		and numeric strings are matched with the numbers they represent (see test_value_match)"""
+	return set([value_key(v) for v in row] + [value_key(str(v)) for v in row])
+
+def simplify(pred, consed=None):
+	"""normalize a predicate: nested conjunctions (disjunctions) are flattened, True is propagated,
+		duplicate and absorbed clauses are removed (x | (x & y) = x), and leaves shared by all clauses are factored out
+		((x & y) | (x & z) = x & (y | z)). Equivalent sub-predicates are hash-consed, i.e., consed maps keys to
+		predicates and all occurrences of a key share one predicate."""
+	if consed is None:
+		consed = {}
+	if pred.key in consed:
+		return consed[pred.key]
+	if isinstance(pred, (PredConj, PredDisj)):
+		ret = simplify_clauses(pred.__class__, [simplify(p, consed) for p in pred.preds], consed)
+	else:
+		ret = consed.setdefault(pred.key, pred)
+	consed[pred.key] = ret
+	return ret
+
+def simplify_clauses(cls, preds, consed):
+	"""build the conjunction (disjunction) of simplified predicates"""
+	dual = PredDisj if cls == PredConj else PredConj
+	flat = [q for p in preds for q in (p.preds if isinstance(p, cls) else [p])]
+	if cls == PredDisj and any([isinstance(p, PredTrue) for p in flat]):
+		return consed.setdefault(("true",), PredTrue())
+	clauses = list(dict([(p.key, p) for p in flat if not isinstance(p, PredTrue)]).values())
+
+	# leaves of clauses (a clause that is not a dual predicate is its own leaf)
+	parts = [frozenset([q.key for q in p.preds]) if isinstance(p, dual) else frozenset([p.key]) for p in clauses]
+	# a clause is absorbed by another clause with a subset of its leaves
+	kept = []
+	for i in sorted(range(len(clauses)), key=lambda i: len(parts[i])):
+		if not any([parts[j] < parts[i] for j in kept]):
+			kept.append(i)
+	kept.sort()
+	clauses, parts = [clauses[i] for i in kept], [parts[i] for i in kept]
+
+	if len(clauses) == 1:
+		return clauses[0]
+
+	shared = frozenset.intersection(*parts) if len(clauses) > 0 else frozenset()
+	if len(shared) > 0:
+		# no clause only has shared leaves (it would absorb other clauses)
+		leaves = [q for p in clauses for q in (p.preds if isinstance(p, dual) else [p])]
+		shared_leaves = list(dict([(q.key, q) for q in leaves if q.key in shared]).values())
+		rest = [simplify_clauses(dual, [q for q in (p.preds if isinstance(p, dual) else [p]) if q.key not in shared], consed)
+				for p in clauses]
+		return simplify_clauses(dual, shared_leaves + [simplify_clauses(cls, rest, consed)], consed)
+
+	if len(clauses) == 0 and cls == PredConj:
+		return consed.setdefault(("true",), PredTrue())
+	ret = cls(clauses)
+	return consed.setdefault(ret.key, ret)
+
+
+class RecordView(object):
+	"""Row masks of input records, predicates are evaluated on all rows at once by their mask methods
+		(the same as calling check on every row). Rows containing values and substrings are looked up 
+		in the inverted index of the records (see value_index.TableValueIndex), and their masks are cached in the view.
+	"""
+	def __init__(self, records):
+		self.index = table_index(records)
+		self.num_rows = len(records)
+		self.value_masks = {}
+		self.substr_masks = {}
+
+	def value_mask(self, keys):
+		"""rows containing a value with one of the keys (see value_index.value_key)"""
+		key = frozenset(keys)
+		if key not in self.value_masks:
+			self.value_masks[key] = self.rows_mask(self.index.value_row_ids(key))
+		return self.value_masks[key]
+
+	def substr_mask(self, val):
+		"""rows containing a string value with the substring"""
+		if val not in self.substr_masks:
+			self.substr_masks[val] = self.rows_mask(self.index.substring_row_ids(val))
+		return self.substr_masks[val]
+
+	def rows_mask(self, rows):
+		ret = np.zeros(self.num_rows, dtype=bool)
+		ret[rows] = True
+		return ret
+
+
+# views of the most recently analyzed inputs, indexed by id of records
+RECORD_VIEW_CACHE_SIZE = 16
+RECORD_VIEWS = OrderedDict()
+
+def record_view(records):
+	"""the (cached) view of input records, views share the index of records (see value_index.table_index)"""
+	entry = RECORD_VIEWS.get(id(records))
+	if entry is not None and entry[0] is records and entry[1].index is table_index(records):
+		RECORD_VIEWS.move_to_end(id(records))
+		return entry[1]
+	view = RecordView(records)
+	RECORD_VIEWS[id(records)] = (records, view)
+	if len(RECORD_VIEWS) > RECORD_VIEW_CACHE_SIZE:
+		RECORD_VIEWS.popitem(last=False)
+	return view
+
+def trim_records(pred, records):
+	"""records satisfying the predicate, masks of (hash-consed) sub-predicates are computed once"""
+	mask = pred.mask(record_view(records), {})
+	return [r for r, keep in zip(records, mask) if keep]
+
+def trim_records_by_check(pred, records):
+	"""the same as trim_records, but the predicate is checked on each row (the reference implementation)"""
+	rows = [[r[x] for x in r] for r in records]
+	return [r for r, row in zip(records, rows) if pred.check(row, value_keys(row))]
+
 # analysis functions
 
 def provenance_analysis(node, output, inputs):
@@ -75,28 +242,79 @@ def provenance_analysis(node, output, inputs):
 		inputs: the list of input table, represented as input tuples
 	"""
 
-	# convert it into a dataframe
-	if isinstance(output, pd.DataFrame):
-		out_records = output.to_dict(orient="records")
-	else:
-		out_records = output
-	
-	current_exp = PredDisj([(PredConj([PredContainsVal(val) for key, val in r.items()])) for r in out_records])
+	current_exp = output_pred(output)
 
 	#print(current_exp.print_str())
 
 	current_node = node
 	while current_node["op"] != "table_ref":
-		current_exp = provenance_analysis_one_step(current_node["op"], current_exp, inputs)
+		# the predicate is normalized after each step, so its size follows the number of distinct constraints
+		current_exp = simplify(provenance_analysis_one_step(current_node["op"], current_exp, inputs))
 		current_node = current_node["children"][0]
 
 	#print("==>")
 	#print(current_exp.print_str())
 
-	trimmed_inputs = [[r for r in input_records if current_exp.check([r[x] for x in r])] for input_records in inputs]
+	trimmed_inputs = [trim_records(current_exp, input_records) for input_records in inputs]
 
 	return current_exp, trimmed_inputs
 
+def output_pred(output):
+	"""the predicate satisfied by rows of the output (records dictionary or a pandas dataframe)"""
+	if isinstance(output, pd.DataFrame):
+		out_records = output.to_dict(orient="records")
+	else:
+		out_records = output
+	# missing values (None or NaN) are not constrained, missing cells of input records become NaN or None in tables
+	return simplify(PredDisj([(PredConj([PredContainsVal(val) for key, val in r.items() if val is not None and val == val])) 
+								for r in out_records]))
+
+
+class ProvenanceTrie(object):
+	"""memoized provenance analysis of programs on the same inputs and output.
+		The analysis only depends on operators of a program, so predicates are stored in a trie of operator sequences
+		(from the last operator of the program to the first): programs (sketches) with the same operators share their 
+		predicate and trimmed inputs, and the predicate of a program extends the predicate of its operator suffix.
+	"""
+	def __init__(self, inputs, output):
+		self.inputs = inputs
+		self.output = output
+		self.consed = {}
+		self.root = {"pred": None, "trimmed_inputs": None, "children": {}}
+		self.hits = 0
+		self.misses = 0
+
+	def matches(self, inputs, output):
+		return self.inputs is inputs and self.output is output
+
+	def analyze(self, node):
+		"""the same as provenance_analysis(node, self.output, self.inputs)"""
+		entry = self.root
+		if entry["pred"] is None:
+			entry["pred"] = output_pred(self.output)
+		current_node = node
+		while current_node["op"] != "table_ref":
+			op = current_node["op"]
+			child = entry["children"].get(op)
+			if child is None:
+				pred = simplify(provenance_analysis_one_step(op, entry["pred"], self.inputs), self.consed)
+				child = entry["children"][op] = {"pred": pred, "trimmed_inputs": None, "children": {}}
+			entry = child
+			current_node = current_node["children"][0]
+
+		if entry["trimmed_inputs"] is None:
+			self.misses += 1
+			entry["trimmed_inputs"] = [trim_records(entry["pred"], input_records) for input_records in self.inputs]
+		else:
+			self.hits += 1
+		return entry["pred"], entry["trimmed_inputs"]
+
+	def stats(self):
+		return {"hits": self.hits, "misses": self.misses}
+
+
+# names of columns created by operators, which may become keys of gather
+GENERATED_COLUMN_NAMES = ["KEY", "VALUE", "cumsum"] + ["COL_{}".format(i) for i in range(10)]
 
 def provenance_analysis_one_step(op, pred, inputs):
 	""" perform one_step backward provenance analysis"""
@@ -138,7 +356,8 @@ def provenance_analysis_one_step(op, pred, inputs):
 
 	if op == "gather":
 
-		headers = list(set([k for t in inputs for k in t[0].keys()]))
+		# keys are column names of inputs or columns named by earlier operators (see language.get_fresh_col)
+		headers = list(set([k for t in inputs for k in t[0].keys()] + GENERATED_COLUMN_NAMES))
 
 		if isinstance(pred, PredConj) or isinstance(pred, PredDisj):
 			return pred.__class__([provenance_analysis_one_step(op, p, inputs) for p in pred.preds])
@@ -157,10 +376,10 @@ def provenance_analysis_one_step(op, pred, inputs):
 		if isinstance(pred, PredConj) or isinstance(pred, PredDisj):
 			return pred.__class__([provenance_analysis_one_step(op, p, inputs) for p in pred.preds])
 		if isinstance(pred, PredContainsVal) or isinstance(pred, PredContainsSubstr):
-			if isinstance(pred.val, str):
+			if isinstance(value_key(pred.val), str):
 				return pred
 			else:
-				# number could be a derived value
+				# number (or a string representing a number) could be a derived value
 				return PredTrue()
 
 	if isinstance(pred, PredTrue):
@@ -0,0 +1,73 @@
+import re
+
+import numpy as np
+import pandas as pd
+
+# separators considered when inferring the domain of separate
+SEPARATORS = [" ", "-", "_", "/"]
+# separate splits values at the first match of this pattern (but only split once)
+SPLIT_PATTERN = re.compile(r"\s|_|-|/")
+
+
+class ColumnSplitIndex(object):
+	"""Separators and split positions of the values of a column.
+		Values are rendered with astype(str) (as in unite), and each distinct value is scanned only once
+		to find the separators it contains and the position of its first split (as in separate).
+	"""
+	def __init__(self, series):
+		self.index = series.index
+		self.strs = series.astype(str)
+		# separate only splits columns of strings (the .str accessor turns other values into NaN)
+		self.all_str = pd.api.types.infer_dtype(series, skipna=False) == "string"
+		codes, uniques = pd.factorize(self.strs)
+		self.codes = codes
+		self.uniques = list(uniques)
+		self.contains = {sep: all([sep in v for v in self.uniques]) for sep in SEPARATORS}
+		# (start, end) of the first separator of each distinct value, None if the value has no separator
+		self.splits = []
+		for v in self.uniques:
+			m = SPLIT_PATTERN.search(v)
+			self.splits.append(None if m is None else (m.start(), m.end()))
+
+	def contains_separator(self):
+		"""check if some separator occurs in every value"""
+		return any([self.contains[sep] for sep in SEPARATORS])
+
+	def split(self):
+		"""the two parts of the values split at their first separators, the same as
+			series.str.split(SPLIT_PATTERN, n=1, expand=True), or None if they cannot be obtained from the index
+			(the column does not only contain strings, or no value is split)"""
+		if not self.all_str or all([s is None for s in self.splits]):
+			return None
+		first = object_array([v if s is None else v[:s[0]] for v, s in zip(self.uniques, self.splits)])
+		second = object_array([None if s is None else v[s[1]:] for v, s in zip(self.uniques, self.splits)])
+		return pd.Series(first[self.codes], index=self.index), pd.Series(second[self.codes], index=self.index)
+
+
+class TableSplitIndex(object):
+	"""split indexes of the columns of a table, built on demand"""
+	def __init__(self, df):
+		self.df = df
+		self.columns = [None] * len(df.columns)
+
+	def column(self, i):
+		if self.columns[i] is None:
+			self.columns[i] = ColumnSplitIndex(self.df.iloc[:, i])
+		return self.columns[i]
+
+
+def split_column(series, index=None):
+	"""split a column at the first separator of each value (into two series)"""
+	if index is None:
+		index = ColumnSplitIndex(series)
+	ret = index.split()
+	if ret is None:
+		splitted = series.str.split(SPLIT_PATTERN.pattern, n=1, expand=True)
+		ret = splitted[0], splitted[1]
+	return ret
+
+
+def object_array(values):
+	arr = np.empty(len(values), dtype=object)
+	arr[:] = values
+	return arr
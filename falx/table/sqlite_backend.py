@@ -0,0 +1,467 @@
+import os
+import sqlite3
+import itertools
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from falx.table.language import Table, Unite, canonical_value, get_fresh_col
+from falx.table.columnar import object_array, reset_index_name
+from falx.table.compiler import compile_program
+from falx.table.split_index import SPLIT_PATTERN
+from falx.logger import get_logger
+
+logger = get_logger("sqlite_backend")
+
+# number of materialized subprogram results kept in a session
+SQLITE_CACHE_SIZE = 64
+# sqlite limits the number of columns of a table (2000 by default) and the number of selects in a union
+SQLITE_MAX_COLUMNS = 1000
+SQLITE_MAX_UNION = 500
+
+# kinds of column values, which determine how values are converted back into pandas and rendered as strings:
+#   "int", "float", "bool": numbers (stored as integers and reals, missing values are NaN in pandas)
+#   "str": strings (missing values are None)
+#   "object": other values (missing values are NaN), they are never rendered or compared by order
+COMPARABLE_KINDS = ["int", "float", "bool", "str"]
+NUMBER_KINDS = ["int", "float"]
+
+
+class UnsupportedProgram(Exception):
+	"""the program (or the data it runs on) cannot be evaluated in sqlite with the same semantics as pandas"""
+	pass
+
+
+class Relation(object):
+	"""a materialized table: sql columns c0 .. ck hold columns of the pandas table (names and kinds),
+		and _rid is the position of each row (0 .. num_rows - 1)"""
+	def __init__(self, table, names, kinds, num_rows):
+		self.table = table
+		self.names = names
+		self.kinds = kinds
+		self.num_rows = num_rows
+
+	def cols(self, ids=None):
+		return ", ".join([col(i) for i in (range(len(self.names)) if ids is None else ids)])
+
+
+class SQLiteSession(object):
+	"""Input tables loaded into an in-memory sqlite database (once, on first use),
+		programs are translated statement by statement (see Node.to_stmt_dict), and the result of each statement
+		is materialized as a table. Results are keyed by their subprograms, so that candidate programs
+		sharing a subprogram only evaluate it once (least recently used results are dropped).
+	"""
+	def __init__(self, inputs, cache_size=SQLITE_CACHE_SIZE):
+		self.inputs = inputs
+		self.pid = os.getpid()
+		self.cache_size = cache_size
+		self.conn = sqlite3.connect(":memory:")
+		self.conn.create_function("falx_str", 2, render_value, deterministic=True)
+		self.conn.create_function("falx_split", 2, split_value, deterministic=True)
+		self.conn.create_function("falx_round", 2, round_value, deterministic=True)
+		self.table_ids = itertools.count()
+		self.input_relations = {}
+		self.relations = OrderedDict()
+
+	def close(self):
+		self.conn.close()
+
+	def eval(self, p):
+		"""evaluate a concrete program, the result is converted into a dataframe"""
+		node = p
+		while not isinstance(node, Table):
+			if isinstance(node, Unite) and node.sep != "_":
+				# separators of unite are not kept in statements
+				raise UnsupportedProgram("[unite] custom separator")
+			node = node.q
+		return self.fetch(self.translate(p.to_stmt_dict()))
+
+	def translate(self, stmts):
+		"""materialize statements in order, and return the relation of the last one"""
+		env = {}
+		for stmt in stmts:
+			if stmt["op"] == "table_ref":
+				data_id = stmt["children"][0]["value"]
+				key, rel = ("table_ref", data_id), self.input_relation(data_id)
+			else:
+				child_key, src = env[stmt["children"][0]["value"]]
+				args = [arg["value"] for arg in stmt["children"][1:]]
+				key = (stmt["op"], child_key) + tuple([canonical_value(arg) for arg in args])
+				rel = self.relations.get(key)
+				if rel is not None:
+					self.relations.move_to_end(key)
+				else:
+					rel = STMT_TRANSLATORS[stmt["op"]](self, src, *args)
+					self.relations[key] = rel
+					if len(self.relations) > self.cache_size:
+						_, evicted = self.relations.popitem(last=False)
+						self.conn.execute("DROP TABLE {}".format(evicted.table))
+			env[stmt["return_as"]] = (key, rel)
+		return rel
+
+	def input_relation(self, data_id):
+		if data_id not in self.input_relations:
+			try:
+				self.input_relations[data_id] = self.load(Table(data_id).load(self.inputs))
+			except UnsupportedProgram:
+				self.input_relations[data_id] = None
+		if self.input_relations[data_id] is None:
+			raise UnsupportedProgram("input table {} cannot be loaded".format(data_id))
+		return self.input_relations[data_id]
+
+	def load(self, df):
+		"""load a dataframe into a new table"""
+		if not df.columns.is_unique or not df.index.equals(pd.RangeIndex(len(df))):
+			raise UnsupportedProgram("the table has duplicate column names or a custom index")
+		kinds = [column_kind(df.iloc[:, i]) for i in range(len(df.columns))]
+		columns = [to_sql_values(df.iloc[:, i].tolist(), kind) for i, kind in enumerate(kinds)]
+		table = self.create_table(len(kinds))
+		try:
+			self.conn.executemany("INSERT INTO {} VALUES ({})".format(table, ", ".join(["?"] * (len(kinds) + 1))),
+								  zip(range(len(df)), *columns))
+		except (sqlite3.Error, OverflowError) as e:
+			self.conn.execute("DROP TABLE {}".format(table))
+			raise UnsupportedProgram(str(e))
+		return Relation(table, list(df.columns), kinds, len(df))
+
+	def create_table(self, num_cols):
+		if num_cols == 0 or num_cols > SQLITE_MAX_COLUMNS:
+			raise UnsupportedProgram("unsupported number of columns: {}".format(num_cols))
+		table = "t{}".format(next(self.table_ids))
+		# columns are declared without types, so that values are stored as they are
+		self.conn.execute("CREATE TABLE {} (_rid INTEGER PRIMARY KEY, {})".format(table, col_list(num_cols)))
+		return table
+
+	def materialize(self, sql, names, kinds, params=()):
+		"""store the result of a query (that selects the row id followed by columns) into a new table"""
+		if len(set(names)) < len(names):
+			raise UnsupportedProgram("duplicate column names")
+		table = self.create_table(len(names))
+		cursor = self.conn.execute("INSERT INTO {} (_rid, {}) {}".format(table, col_list(len(names)), sql), params)
+		return Relation(table, names, kinds, cursor.rowcount)
+
+	def query(self, sql, params=()):
+		return self.conn.execute(sql, params).fetchall()
+
+	def fetch(self, rel):
+		"""convert a relation into a dataframe"""
+		rows = self.query("SELECT {} FROM {} ORDER BY _rid".format(rel.cols(), rel.table))
+		columns = list(zip(*rows)) if len(rows) > 0 else [()] * len(rel.names)
+		df = pd.DataFrame({i: from_sql_values(list(vals), kind) for i, (vals, kind) in enumerate(zip(columns, rel.kinds))},
+						  columns=list(range(len(rel.names))))
+		df.columns = rel.names
+		return df
+
+
+# translation of statements: each takes the session, the relation of the child and arguments of the operator,
+# and returns the materialized result; the semantics follow Node.transform in table/language.py
+
+def sql_select(s, src, cols):
+	return s.materialize("SELECT _rid, {} FROM {}".format(src.cols(cols), src.table),
+						 [src.names[i] for i in cols], [src.kinds[i] for i in cols])
+
+
+def sql_unite(s, src, col1, col2, sep="_"):
+	if not isinstance(sep, str) or src.kinds[col1] not in COMPARABLE_KINDS or src.kinds[col2] not in COMPARABLE_KINDS:
+		raise UnsupportedProgram("[unite] values cannot be rendered as strings")
+	new_col = get_fresh_col(src.names)[0]
+	keep = [i for i, c in enumerate(src.names) if c not in [src.names[col1], src.names[col2]]]
+	united = "falx_str({}, ?) || ? || falx_str({}, ?)".format(col(col1), col(col2))
+	sql = "SELECT _rid, {} FROM {}".format(", ".join([col(i) for i in keep] + [united]), src.table)
+	return s.materialize(sql, [src.names[i] for i in keep] + [new_col], [src.kinds[i] for i in keep] + ["str"],
+						 (src.kinds[col1], sep, src.kinds[col2]))
+
+
+def sql_filter(s, src, col_index, op, const):
+	if op not in ["==", "!="] or not is_constant(const):
+		raise UnsupportedProgram("[filter] unsupported predicate")
+	try:
+		index_name = reset_index_name(src.names)
+	except ValueError as e:
+		raise UnsupportedProgram(str(e))
+	# rows are renumbered, the old row ids become the "index" column (by reset_index)
+	sql = "SELECT ROW_NUMBER() OVER (ORDER BY _rid) - 1, _rid, {} FROM {} WHERE {} {} ?".format(
+			src.cols(), src.table, col(col_index), "IS" if op == "==" else "IS NOT")
+	return s.materialize(sql, [index_name] + src.names, ["int"] + src.kinds, (to_sql_constant(const),))
+
+
+def sql_separate(s, src, col_index):
+	c = col(col_index)
+	if src.kinds[col_index] != "str":
+		raise UnsupportedProgram("[separate] not a column of strings")
+	num_nulls, num_split = s.query("SELECT COUNT(*) - COUNT({c}), COUNT(falx_split({c}, 1)) FROM {t}".format(
+									c=c, t=src.table))[0]
+	if num_nulls > 0 or num_split == 0:
+		# missing values become NaN, and pandas fails if no value is split
+		raise UnsupportedProgram("[separate] the column has missing values or no value is split")
+	new_cols = get_fresh_col(src.names, n=2)
+	keep = [i for i in range(len(src.names)) if i != col_index]
+	sql = "SELECT _rid, {} FROM {}".format(
+			", ".join([col(i) for i in keep] + ["falx_split({}, 0)".format(c), "falx_split({}, 1)".format(c)]), src.table)
+	return s.materialize(sql, [src.names[i] for i in keep] + new_cols, [src.kinds[i] for i in keep] + ["str", "str"])
+
+
+def sql_spread(s, src, key, val):
+	index_ids = [i for i in range(len(src.names)) if i not in [key, val]]
+	if (src.num_rows == 0 or key == val or len(index_ids) == 0 or src.kinds[key] == "bool"
+			or any([src.kinds[i] not in COMPARABLE_KINDS for i in index_ids + [key]])):
+		# (boolean column names are taken as masks in pandas)
+		raise UnsupportedProgram("[spread] unsupported key or index columns")
+	index_cols = src.cols(index_ids)
+	nullable = index_ids + [key] + ([] if src.kinds[val] == "float" else [val])
+	if s.query("SELECT COUNT(*) FROM {} WHERE {}".format(
+				src.table, " OR ".join(["{} IS NULL".format(col(i)) for i in nullable])))[0][0] > 0:
+		raise UnsupportedProgram("[spread] missing values in index or key columns")
+	if len(s.query("SELECT 1 FROM {} GROUP BY {}, {} HAVING COUNT(*) > 1 LIMIT 1".format(
+				src.table, index_cols, col(key)))) > 0:
+		# pandas fails on duplicate entries
+		raise UnsupportedProgram("[spread] duplicate entries")
+
+	keys = [r[0] for r in s.query("SELECT DISTINCT {c} FROM {t} ORDER BY {c}".format(c=col(key), t=src.table))]
+	num_groups = s.query("SELECT COUNT(*) FROM (SELECT 1 FROM {} GROUP BY {})".format(src.table, index_cols))[0][0]
+	# cells without values are NaN
+	has_missing = num_groups * len(keys) > src.num_rows
+	val_kind = src.kinds[val]
+	if has_missing and val_kind != "float":
+		val_kind = "float" if val_kind == "int" else "object"
+
+	index_kinds = [src.kinds[i] for i in index_ids]
+	if set(index_kinds) == set(NUMBER_KINDS):
+		# index columns are cast to their common type (see pivot.spread_table)
+		index_kinds = ["float"] * len(index_ids)
+
+	cells = ["MAX(CASE WHEN {} IS ? THEN {} END)".format(col(key), col(val)) for _ in keys]
+	sql = "SELECT ROW_NUMBER() OVER (ORDER BY {idx}) - 1, {cols} FROM {t} GROUP BY {idx}".format(
+			idx=index_cols, cols=", ".join([index_cols] + cells), t=src.table)
+	names = [src.names[i] for i in index_ids] + from_sql_values(keys, src.kinds[key]).tolist()
+	return s.materialize(sql, names, index_kinds + [val_kind] * len(keys), keys)
+
+
+def sql_gather(s, src, value_columns):
+	value_ids = list(value_columns)
+	value_vars = [src.names[i] for i in value_ids]
+	if len(value_ids) == 0 or len(set(value_ids)) < len(value_ids) or len(value_ids) > SQLITE_MAX_UNION:
+		raise UnsupportedProgram("[gather] unsupported value columns")
+	key_ids = [i for i in range(len(src.names)) if i not in value_ids]
+	if all([isinstance(v, str) for v in value_vars]):
+		key_kind = "str"
+	elif all([isinstance(v, (int, np.integer)) and not isinstance(v, bool) for v in value_vars]):
+		# names are kept as objects
+		key_kind = "object"
+	else:
+		raise UnsupportedProgram("[gather] mixed column names")
+	value_kinds = set([src.kinds[i] for i in value_ids])
+	if len(value_kinds) > 1 and not value_kinds.issubset(NUMBER_KINDS):
+		raise UnsupportedProgram("[gather] mixed value columns")
+	value_kind = value_kinds.pop() if len(value_kinds) == 1 else "float"
+
+	# rows of value columns are stacked in order (by melt)
+	sql = " UNION ALL ".join(["SELECT {} + _rid, {} FROM {}".format(
+			k * src.num_rows, ", ".join([col(j) for j in key_ids] + ["?", col(i)]), src.table) for k, i in enumerate(value_ids)])
+	return s.materialize(sql, [src.names[i] for i in key_ids] + ["KEY", "VALUE"],
+						 [src.kinds[i] for i in key_ids] + [key_kind, value_kind],
+						 [to_sql_constant(v) for v in value_vars])
+
+
+def sql_group_summary(s, src, group_cols, aggr_col, aggr_func):
+	group_ids = list(group_cols)
+	if (len(group_ids) == 0 or len(set(group_ids)) < len(group_ids) or aggr_col in group_ids
+			or any([src.kinds[i] not in COMPARABLE_KINDS for i in group_ids])):
+		raise UnsupportedProgram("[group_sum] unsupported group columns")
+	keys = src.cols(group_ids)
+	target, kind = col(aggr_col), src.kinds[aggr_col]
+	new_name = f"{aggr_func}_{src.names[aggr_col]}"
+
+	if aggr_func == "cumsum":
+		if kind not in NUMBER_KINDS:
+			raise UnsupportedProgram("[group_sum] cumsum of non-numbers")
+		names = [new_name if i == aggr_col else c for i, c in enumerate(src.names)]
+		try:
+			index_name = reset_index_name(names)
+		except ValueError as e:
+			raise UnsupportedProgram(str(e))
+		null_keys = " OR ".join(["{} IS NULL".format(col(i)) for i in group_ids])
+		if kind == "int" and s.query("SELECT COUNT(*) FROM {} WHERE {}".format(src.table, null_keys))[0][0] > 0:
+			# rows with missing keys are not grouped, their results are NaN
+			kind = "float"
+		cumsum = ("CASE WHEN {keys_null} OR {c} IS NULL THEN NULL "
+				  "ELSE SUM({c}) OVER (PARTITION BY {keys} ORDER BY _rid ROWS UNBOUNDED PRECEDING) END").format(
+					keys_null=null_keys, c=target, keys=keys)
+		exprs = [cumsum if i == aggr_col else col(i) for i in range(len(src.names))]
+		names = [index_name] + names
+		kinds = ["int"] + [kind if i == aggr_col else k for i, k in enumerate(src.kinds)]
+		return s.materialize("SELECT _rid, _rid, {} FROM {}".format(", ".join(exprs), src.table), names, kinds)
+
+	if aggr_func == "count":
+		aggr, kind = "COUNT({})".format(target), "int"
+	elif aggr_func == "sum" and kind in NUMBER_KINDS + ["bool"]:
+		# the sum of an empty group is 0
+		aggr, kind = "COALESCE(SUM({}), {})".format(target, "0.0" if kind == "float" else "0"), "float" if kind == "float" else "int"
+	elif aggr_func == "mean" and kind in NUMBER_KINDS + ["bool"]:
+		aggr, kind = "falx_round(AVG({}), 2)".format(target), "float"
+	elif aggr_func in ["max", "min"] and kind in NUMBER_KINDS:
+		aggr = "{}({})".format(aggr_func.upper(), target)
+	else:
+		raise UnsupportedProgram("[group_sum] unsupported aggregation {} of {} values".format(aggr_func, kind))
+
+	# groups with missing keys are dropped, groups are sorted by keys
+	sql = "SELECT ROW_NUMBER() OVER (ORDER BY {keys}) - 1, {keys}, {aggr} FROM {t} WHERE {not_null} GROUP BY {keys}".format(
+			keys=keys, aggr=aggr, t=src.table, not_null=" AND ".join(["{} IS NOT NULL".format(col(i)) for i in group_ids]))
+	return s.materialize(sql, [src.names[i] for i in group_ids] + [new_name], [src.kinds[i] for i in group_ids] + [kind])
+
+
+def sql_cumsum(s, src, target):
+	if src.kinds[target] not in NUMBER_KINDS:
+		raise UnsupportedProgram("[cumsum] cumsum of non-numbers")
+	cumsum = "CASE WHEN {c} IS NULL THEN NULL ELSE SUM({c}) OVER (ORDER BY _rid ROWS UNBOUNDED PRECEDING) END".format(
+				c=col(target))
+	exprs, names, kinds = [col(i) for i in range(len(src.names))], list(src.names), list(src.kinds)
+	if "cumsum" in names:
+		# the existing cumsum column is replaced
+		k = names.index("cumsum")
+		exprs[k], kinds[k] = cumsum, src.kinds[target]
+	else:
+		exprs, names, kinds = exprs + [cumsum], names + ["cumsum"], kinds + [src.kinds[target]]
+	return s.materialize("SELECT _rid, {} FROM {}".format(", ".join(exprs), src.table), names, kinds)
+
+
+def sql_mutate(s, src, col1, op, col2):
+	if op not in ["+", "-"] or src.kinds[col1] not in NUMBER_KINDS or src.kinds[col2] not in NUMBER_KINDS:
+		raise UnsupportedProgram("[mutate] unsupported operator or operands")
+	kind = "int" if src.kinds[col1] == src.kinds[col2] == "int" else "float"
+	sql = "SELECT _rid, {}, {} {} {} FROM {}".format(src.cols(), col(col1), op, col(col2), src.table)
+	return s.materialize(sql, src.names + get_fresh_col(src.names), src.kinds + [kind])
+
+
+def sql_mutate_custom(s, src, col_index, op, const):
+	if op != "==" or not is_constant(const):
+		raise UnsupportedProgram("[mutate_custom] unsupported predicate")
+	sql = "SELECT _rid, {}, {} IS ? FROM {}".format(src.cols(), col(col_index), src.table)
+	return s.materialize(sql, src.names + get_fresh_col(src.names), src.kinds + ["bool"], (to_sql_constant(const),))
+
+
+# translators of statements, indexed by operator names (see language.OP_CONSTRUCTORS)
+STMT_TRANSLATORS = {
+	"select": sql_select,
+	"unite": sql_unite,
+	"filter": sql_filter,
+	"separate": sql_separate,
+	"spread": sql_spread,
+	"gather": sql_gather,
+	"group_sum": sql_group_summary,
+	"cumsum": sql_cumsum,
+	"mutate": sql_mutate,
+	"mutate_custom": sql_mutate_custom,
+}
+
+# the session of the most recent inputs of each thread (sqlite connections cannot be shared by threads)
+_THREAD_STATE = threading.local()
+
+def get_session(inputs):
+	"""the session of the inputs in the current thread, the database is only built once for the same inputs"""
+	session = getattr(_THREAD_STATE, "session", None)
+	if session is None or session.inputs is not inputs or session.pid != os.getpid():
+		if session is not None and session.pid == os.getpid():
+			session.close()
+		# connections are not shared with forked workers
+		session = _THREAD_STATE.session = SQLiteSession(inputs)
+	return session
+
+
+def eval_sqlite(p, inputs):
+	"""evaluate a concrete program in sqlite,
+		programs that cannot be evaluated with the same semantics as pandas are evaluated by pandas"""
+	try:
+		return get_session(inputs).eval(p)
+	except UnsupportedProgram as e:
+		logger.debug("[sqlite] evaluated by pandas ({}): {}".format(e, p.stmt_string()))
+	except (sqlite3.Error, OverflowError) as e:
+		logger.warning("[sqlite] evaluated by pandas after an error ({}): {}".format(e, p.stmt_string()))
+	return compile_program(p)(inputs)
+
+
+# utility functions
+
+def col(i):
+	return "c{}".format(i)
+
+def col_list(num_cols):
+	return ", ".join([col(i) for i in range(num_cols)])
+
+def column_kind(series):
+	if pd.api.types.is_bool_dtype(series.dtype):
+		return "bool"
+	if pd.api.types.is_integer_dtype(series.dtype):
+		return "int"
+	if pd.api.types.is_float_dtype(series.dtype):
+		return "float"
+	if all([v is None or isinstance(v, str) for v in series.tolist()]):
+		return "str"
+	return "object"
+
+def is_constant(val):
+	return isinstance(val, (int, float, str, np.number, np.bool_)) and not (isinstance(val, (float, np.floating)) and np.isnan(val))
+
+def to_sql_constant(val):
+	val = val.item() if isinstance(val, np.generic) else val
+	return int(val) if isinstance(val, bool) else val
+
+def to_sql_values(values, kind):
+	"""convert values of a column (of the given kind) into values stored in sqlite"""
+	if kind == "int":
+		return [int(v) for v in values]
+	if kind == "bool":
+		return [int(v) for v in values]
+	if kind == "float":
+		return [None if np.isnan(v) else float(v) for v in values]
+	if kind == "str":
+		return values
+	res = []
+	for v in values:
+		v = v.item() if isinstance(v, np.generic) else v
+		if isinstance(v, float) and np.isnan(v):
+			res.append(None)
+		elif isinstance(v, (int, float, str)) and not isinstance(v, bool):
+			res.append(v)
+		else:
+			raise UnsupportedProgram("unsupported value {}".format(v))
+	return res
+
+def from_sql_values(values, kind):
+	"""convert values stored in sqlite into a numpy array (with the same dtype as pandas)"""
+	has_nulls = any([v is None for v in values])
+	if kind == "int" and not has_nulls:
+		return np.array(values, dtype=np.int64)
+	if kind in ["int", "float"]:
+		return np.array([np.nan if v is None else v for v in values], dtype=np.float64)
+	if kind == "bool" and not has_nulls:
+		return np.array(values, dtype=bool)
+	if kind == "bool":
+		return object_array([np.nan if v is None else bool(v) for v in values])
+	if kind == "str":
+		return object_array(values)
+	return object_array([np.nan if v is None else v for v in values])
+
+def render_value(val, kind):
+	"""render a value as a string (the same as astype(str) in pandas)"""
+	if val is None:
+		return "None" if kind == "str" else "nan"
+	if kind == "float":
+		return str(float(val))
+	if kind == "bool":
+		return str(bool(val))
+	return str(val)
+
+def split_value(val, part):
+	"""the first (part = 0) or the second part (part = 1) of the value split at the first separator"""
+	if val is None:
+		return None
+	m = SPLIT_PATTERN.search(val)
+	if part == 0:
+		return val if m is None else val[:m.start()]
+	return None if m is None else val[m.end():]
+
+def round_value(val, decimals):
+	return None if val is None else float(np.round(val, decimals))
@@ -4,13 +4,38 @@ import copy
 from pprint import pprint
 import pandas as pd
 import time
+import concurrent.futures
+import heapq
+import itertools
+import multiprocessing
 
 from falx.table.language import (HOLE, Node, Table, Select, Unite, Filter, Separate, Spread, 
-	Gather, GroupSummary, CumSum, Mutate, MutateCustom)
+	Gather, GroupSummary, CumSum, Mutate, MutateCustom, canonical_value)
+from falx.table.program import Program, ProgramTable
+from falx.table.columnar import eval_columnar
+from falx.table.sqlite_backend import eval_sqlite
 from falx.table import enum_strategies
 from falx.table import abstract_eval
-from falx.utils.synth_utils import remove_duplicate_columns, check_table_inclusion, align_table_schema, construct_value_dict
-from falx.table.provenance_analysis import provenance_analysis
+from falx.utils.synth_utils import (remove_duplicate_columns, align_table_schema, table_dims, 
+	build_column_index, check_index_inclusion, table_fingerprint)
+from falx.table.provenance_analysis import ProvenanceTrie
+from falx.table.value_index import table_index
+from falx.logger import get_logger
+
+# search traces (partial programs, pruned programs and evaluation errors) are logged at the debug level,
+# and verification statistics at the info level
+logger = get_logger("synthesizer")
+
+# operators that map each input row to output rows independently (without exposing row positions),
+# and whose provenance analysis keeps every input row that can produce a value of the output:
+# on the sample of rows kept by the analysis, programs with only these operators produce exactly the output rows 
+# they produce on the full inputs, so candidates are accepted or rejected on the sample
+# (unite and separate are excluded, their analysis guesses how values are split by separators)
+SAMPLE_SAFE_OPS = ["select", "gather", "mutate", "mutate_custom"]
+# samples are only used if they have at most this fraction of input rows
+SAMPLE_MAX_RATIO = 0.5
+# number of domain values deduced at a time (see Synthesizer.iter_deduce_domain)
+DEDUCE_BATCH_SIZE = 256
 
 abstract_combinators = {
 	"select": lambda q: Select(q, cols=HOLE),
@@ -25,17 +50,33 @@ abstract_combinators = {
 	"mutate_custom": lambda q: MutateCustom(q, col=HOLE, op=HOLE, const=HOLE), 
 }
 
-def update_tree_value(node, path, new_val):
-	"""from a given ast node, locate the refence to the arg,
-	   and update the value"""
-	for k in path:
-		node = node["children"][k]
-	node["value"] = new_val
+class SynthesisTimeout(Exception):
+	"""raised from inside the search when the deadline is passed or the search is cancelled"""
+	pass
+
+class Deadline(object):
+	"""deadline / cancellation token shared by all stages of a search 
+		(instantiation, domain inference, premise check and verification)"""
+	def __init__(self, time_limit_sec=None, is_cancelled=None):
+		"""
+		Args:
+			time_limit_sec: time budget starting from now (None for no limit)
+			is_cancelled: an optional function, the search is cancelled once it returns True
+		"""
+		self.expire_at = time.time() + time_limit_sec if time_limit_sec is not None else None
+		self.is_cancelled = is_cancelled
+
+	def remaining(self):
+		return self.expire_at - time.time() if self.expire_at is not None else None
+
+	def expired(self):
+		return ((self.expire_at is not None and time.time() > self.expire_at) 
+				or (self.is_cancelled is not None and self.is_cancelled()))
+
+	def check(self):
+		if self.expired():
+			raise SynthesisTimeout()
 
-def get_node(node, path):
-	for k in path:
-		node = node["children"][k]
-	return node
 
 class Synthesizer(object):
 
@@ -51,10 +92,20 @@ class Synthesizer(object):
 				"gather_max_val_list_size": 3,
 				"gather_max_key_list_size": 3,
 				"consider_non_consecutive_gather_keys": False,
-				"allow_comp_without_new_val": False
+				"allow_comp_without_new_val": False,
+				"param_deduction": "prioritize",
+				"eval_backend": "pandas",
+				"sample_verification": True
 			}
 		else:
 			self.config = config
+		self.verify_stats = new_verify_stats()
+		# samples of inputs used in verification, indexed by operators of programs (see sample_inputs)
+		self.sample_cache = {}
+		# provenance analysis results of sketches on the current inputs and output (see provenance_trie)
+		self.prov_trie = None
+		# premise chains of sketches on the current output (see premise_chains)
+		self.premise_cache = None
 
 	def enum_sketches(self, inputs, output, size):
 		"""enumerate program sketches up to the given size"""
@@ -62,7 +113,9 @@ class Synthesizer(object):
 		# check if output contains a new value 
 		# (this decides if we should use ops that generates new vals)
 		
-		inp_val_set = set([v for t in inputs for r in t for k, v in r.items()] + [k for t in inputs for k in t[0]])
+		# values and strings of inputs are looked up in their indexes (shared with provenance analysis)
+		indexes = [table_index(t) for t in inputs]
+		inp_val_set = set([v for index in indexes for v in index.values] + [k for t in inputs for k in t[0]])
 		out_val_set = set([v for r in output for k, v in r.items()])
 		new_vals = out_val_set - inp_val_set
 		
@@ -72,8 +125,8 @@ class Synthesizer(object):
 
 		# check if there are seperators in column names
 		sep_in_col_names = [key for t in inputs for key in t[0] if ('-' in key or '_' in key or '/' in key)]
-		sep_in_content = [v for t in inputs for r in t for k, v in r.items() if (isinstance(v, str) and ('-' in v or '_' in v or '/' in v))]
-		has_sep = (len(sep_in_col_names) > 0) or (len(sep_in_content) > 0)
+		sep_in_content = any([index.contains_substring(['-', '_', '/']) for index in indexes])
+		has_sep = (len(sep_in_col_names) > 0) or sep_in_content
 
 		candidates = {}
 		for level in range(0, size + 1):
@@ -98,36 +151,112 @@ class Synthesizer(object):
 		return candidates
 
 	def pick_vars(self, ast, inputs):
-		"""list paths to all holes in the given ast"""
-		def get_paths_to_all_holes(node):
-			results = []
-			for i, child in enumerate(node["children"]):
-				if child["type"] == "node":
-					# try to find a variable to infer
-					paths = get_paths_to_all_holes(child)
-					for path in paths:
-						results.append([i] + path)
-				elif child["value"] == HOLE:
-					# we find a variable to infer
-					results.append([i])
-			return results
-		return get_paths_to_all_holes(ast)
+		"""list paths to all holes in the given ast (a Program)"""
+		return [list(path) for path in ast.holes]
+
+	def infer_domain(self, ast, var_path, inputs, deadline=None, premises=None):
+		"""infer the domain of the hole at var_path,
+			premises of the sketch (see compile_premises) are output examples used to deduce the argument"""
+		prog = ast.get(var_path[:-1])
+		domain = prog.to_node().infer_domain(arg_id=var_path[-1], inputs=inputs, config=self.config, deadline=deadline)
+		if premises is None:
+			return domain
+		return self.deduce_domain(prog, var_path[-1], domain, inputs, premises.examples(len(var_path) - 1))
+
+	def iter_domain(self, ast, var_path, inputs, deadline=None, premises=None):
+		"""lazily generate the domain of the hole at var_path (see infer_domain),
+			values deduced from premises are generated first (see iter_deduce_domain)"""
+		prog = ast.get(var_path[:-1])
+		node = prog.to_node()
+		def domain():
+			return node.iter_domain(arg_id=var_path[-1], inputs=inputs, config=self.config, deadline=deadline)
+		if (premises is None or self.config.get("param_deduction", "prioritize") == "off" 
+				or prog.op not in abstract_eval.ARG_INVERSES):
+			return domain()
+		return self.iter_deduce_domain(prog, var_path[-1], domain, inputs, premises.examples(len(var_path) - 1))
+
+	def deduce_domain(self, prog, arg_id, domain, inputs, examples):
+		"""deduce values of the argument from output examples (see abstract_eval.infer_args_one_step), 
+			depending on config["param_deduction"], the deduced values are either tried first ("prioritize"), 
+			or the only ones tried when there are any ("restrict", which may miss solutions), or ignored ("off")
+		"""
+		return list(self.iter_deduce_domain(prog, arg_id, lambda: iter(domain), inputs, examples))
+
+	def iter_deduce_domain(self, prog, arg_id, domain, inputs, examples):
+		"""the generator version of deduce_domain, domain is a function that lazily generates the domain: 
+			values are deduced in batches as the domain is generated, and the values that are not deduced 
+			are generated from a second pass over the domain afterwards ("prioritize")"""
+		mode = self.config.get("param_deduction", "prioritize")
+		values = domain()
+		batch = list(itertools.islice(values, DEDUCE_BATCH_SIZE))
+		if mode == "off" or len(examples) == 0 or len(batch) <= 1:
+			yield from batch
+			yield from values
+			return
+
+		try:
+			in_df = prog.children[0].to_node().eval(inputs)
+		except Exception as e:
+			logger.debug("[eval error in deduce_domain] {}".format(e))
+			yield from batch
+			yield from values
+			return
+
+		deduced = abstract_eval.infer_args_one_step(prog.op, arg_id, prog.children[1:], batch, in_df, examples)
+		if deduced is None:
+			# nothing can be deduced from the examples (whatever the values are)
+			yield from batch
+			yield from values
+			return
+
+		deduced_keys = set()
+		while True:
+			for v in deduced:
+				deduced_keys.add(canonical_value(v))
+				yield v
+			batch = list(itertools.islice(values, DEDUCE_BATCH_SIZE))
+			if len(batch) == 0:
+				break
+			deduced = abstract_eval.infer_args_one_step(prog.op, arg_id, prog.children[1:], batch, in_df, examples) or []
+
+		if mode == "restrict":
+			return
+		for v in domain():
+			if canonical_value(v) not in deduced_keys:
+				yield v
+
+	def instantiate(self, ast, var_path, inputs, deadline=None, premises=None):
+		"""instantiate one hole in the program sketch"""
+		return list(self.iter_instantiate(ast, var_path, inputs, deadline, premises))
 
-	def infer_domain(self, ast, var_path, inputs):
-		node = Node.load_from_dict(get_node(ast, var_path[:-1]))
-		return node.infer_domain(arg_id=var_path[-1], inputs=inputs, config=self.config)
+	def iter_instantiate(self, ast, var_path, inputs, deadline=None, premises=None):
+		"""lazily instantiate one hole in the program sketch"""
+		for val in self.iter_domain(ast, var_path, inputs, deadline, premises):
+			yield ast.fill(var_path, val)
 
-	def instantiate(self, ast, var_path, inputs):
-		"""instantiate one hole in the program sketch"""
-		domain = self.infer_domain(ast, var_path, inputs)
-		candidates = []
-		for val in domain:
-			new_ast = copy.deepcopy(ast)
-			update_tree_value(new_ast, var_path, val)
-			candidates.append(new_ast)
-		return candidates
+	def iter_instantiate_one_level(self, ast, inputs, deadline=None, premises=None):
+		"""lazily generate programs instantiated from the most recent level (see instantiate_one_level),
+			domains are inferred only when the generator reaches the corresponding hole"""
+		var_paths = self.pick_vars(ast, inputs)
+		if var_paths == []:
+			return
+
+		# find all variables at the innermost level
+		innermost_level = max([len(p) for p in var_paths])
+		target_vars = [p for p in var_paths if len(p) == innermost_level]
 
-	def instantiate_one_level(self, ast, inputs):
+		def instantiate_from(partial_prog, k):
+			if k == len(target_vars):
+				yield partial_prog
+				return
+			if deadline is not None:
+				deadline.check()
+			for c in self.iter_instantiate(partial_prog, target_vars[k], inputs, deadline, premises):
+				yield from instantiate_from(c, k + 1)
+
+		yield from instantiate_from(ast, 0)
+
+	def instantiate_one_level(self, ast, inputs, deadline=None):
 		"""generate program instantitated from the most recent level
 			i.e., given an abstract program, it will enumerate all possible abstract programs that concretize
 		"""
@@ -137,128 +266,160 @@ class Synthesizer(object):
 		if var_paths == []:
 			return [], []
 
-		# find all variables at the innermost level
-		innermost_level = max([len(p) for p in var_paths])
-		target_vars = [p for p in var_paths if len(p) == innermost_level]
-
-		recent_candidates = [ast]
-		for var_path in target_vars:
-			temp_candidates = []
-			for partial_prog in recent_candidates:
-				temp_candidates += self.instantiate(partial_prog, var_path, inputs)
-			recent_candidates = temp_candidates
+		recent_candidates = list(self.iter_instantiate_one_level(ast, inputs, deadline))
 
-		# for c in recent_candidates:
-		# 	nd = Node.load_from_dict(c)
-		# 	print(f"{' | '}{nd.stmt_string()}")
-		
 		# this show how do we trace to the most recent program level
-		concrete_program_level = innermost_level - 1
+		concrete_program_level = max([len(p) for p in var_paths]) - 1
 
 		return recent_candidates, concrete_program_level
 
 	def iteratively_instantiate_and_print(self, p, inputs, level, print_programs=False):
 		"""iteratively instantiate a program (for the purpose of debugging)"""
+		if isinstance(p, Node):
+			p = Program.from_node(p)
 		if print_programs:
 			print(f"{'  '.join(['' for _ in range(level)])}{p.stmt_string()}")
 		results = []
 		if p.is_abstract():
-			ast = p.to_dict()
-			var_path = self.pick_vars(ast, inputs)[0]
+			var_path = self.pick_vars(p, inputs)[0]
 			#domain = self.infer_domain(ast, path, inputs)
-			candidates = self.instantiate(ast, var_path, inputs)
+			candidates = self.instantiate(p, var_path, inputs)
 			for c in candidates:
-				nd = Node.load_from_dict(c)
-				results += self.iteratively_instantiate_and_print(nd, inputs, level + 1, print_programs)
+				results += self.iteratively_instantiate_and_print(c, inputs, level + 1, print_programs)
 			return results
 		else:
-			return [p]
+			return [p.to_node()]
 
-	def iteratively_instantiate_with_premises_check(self, p, inputs, premise_chains, trimmed_inputs, time_limit_sec=None):
+	def iteratively_instantiate_with_premises_check(self, p, inputs, premise_chains, trimmed_inputs, deadline=None, equiv_table=None, output_dims=None):
 		"""iteratively instantiate abstract programs w/ promise check 
 		Args:
-			p: partial program
+			p: partial program (a Node or a Program)
 			inputs: input tables
 			premise_chains: backward analysis chains
 			trimmed inputs: input obtained from provenance analysis used to perform checks
-			time_limit_sec: remaining time limit
+			deadline: a Deadline shared by the search (or the remaining time limit in seconds), 
+				SynthesisTimeout is raised once it is passed
+			equiv_table: observational equivalence table of the current search (see is_observationally_redundant), 
+				it is shared by all sketches of the search
+			output_dims: (number of distinct columns, number of rows) of the output, 
+				partial programs whose shapes cannot contain the output are dropped (see check_shape)
 		returns:
-			a list of candidate programs
+			a list of candidate programs (as Nodes)
 		"""
+		return list(self.iter_instantiate_with_premises_check(
+						p, inputs, premise_chains, trimmed_inputs, deadline, equiv_table, output_dims))
 
-		def instantiate_with_premises_check(p, inputs, premise_chains, trimmed_inputs):
-			"""instantiate programs and then check each one of them against the premise """
-			results = []
-			if p.is_abstract():
-				print(p.stmt_string())
-				ast = p.to_dict()
-
-				
-				next_level_programs, level = self.instantiate_one_level(ast, inputs)
-				#next_level_programs, level = self.instantiate_one_level(ast, trimmed_inputs)
-
-				for _ast in next_level_programs:
-
-					# force terminate if the remaining time is running out
-					if time_limit_sec is not None and time.time() - start_time > time_limit_sec:
-						return results
+	def iter_instantiate_with_premises_check(self, p, inputs, premise_chains, trimmed_inputs, deadline=None, equiv_table=None, output_dims=None):
+		"""the generator version of iteratively_instantiate_with_premises_check,
+			it expands the search tree depth first and yields each candidate program (as a Node) once it is found
+		"""
+		if equiv_table is None:
+			equiv_table = {}
 
-					premises_at_level = [[pm for pm in premise_chain if len(pm[1]) == level][0] for premise_chain in premise_chains]
+		if not isinstance(deadline, Deadline):
+			deadline = Deadline(deadline)
 
-					subquery_res = None # cache subquery result to avoid re-computation overhead
-					for premise, subquery_path in premises_at_level:
+		premises = self.compile_premises(premise_chains)
 
-						if subquery_res is None:
-							# check if the subquery result contains the premise
-							subquery_node = get_node(_ast, subquery_path)
-							print("  {}".format(Node.load_from_dict(subquery_node).stmt_string()))
+		def search(p):
+			if not p.is_abstract():
+				yield p.to_node()
+				return
 
-							#subquery_res = Node.load_from_dict(subquery_node).eval(inputs)
-							subquery_res = Node.load_from_dict(subquery_node).eval(trimmed_inputs)
+			logger.debug(p.stmt_string())
+			level = max([len(path) for path in p.holes]) - 1
 
-						# an optimization: compute the dictionary represented table here to reduce time spent later on to check table inclusion.
-						subquery_res_table = subquery_res.to_dict(orient="records")
-						subquery_res_dict = {}
-						for k2 in subquery_res_table[0].keys():
-							subquery_res_dict[k2] = construct_value_dict([r[k2] for r in subquery_res_table if k2 in r])
+			for _ast in self.iter_instantiate_one_level(p, inputs, deadline, premises):
+				# force terminate if the remaining time is running out
+				deadline.check()
 
-						#print(subquery_res)
-						if check_table_inclusion(premise.to_dict(orient="records"), subquery_res_table, subquery_res_dict):
+				if output_dims is not None and not self.check_shape(_ast, inputs, output_dims):
+					continue
 
-							# # debug
-							# p = Node.load_from_dict(_ast)
-							# if not p.is_abstract():
-							# 	print(f"{' - '}{p.stmt_string()}")
-							# 	print(subquery_res)
-							# 	print(premise)
-							# 	print( check_table_inclusion(premise.to_dict(orient="records"), subquery_res.to_dict(orient="records")))
+				if self.check_premises(_ast, level, inputs, premises, trimmed_inputs, equiv_table)[0]:
+					yield from search(_ast)
 
-							results.append(Node.load_from_dict(_ast))
-							break
+		logger.debug("time limit: {}".format(deadline.remaining()))
 
-				return results
-			else:
-				return []
+		if isinstance(p, Node):
+			p = Program.from_node(p)
 
-		print("time limit: {}".format(time_limit_sec))
-
-		results = []
 		if p.is_abstract():
-			
-			if time_limit_sec < 0:
-				return []
-			start_time = time.time()
-
-			candidates = instantiate_with_premises_check(p, inputs, premise_chains, trimmed_inputs)
-			for _p in candidates:
-				# if time_limit_sec is not None and time.time() - start_time > time_limit_sec:
-				# 	return results
-				remaining_time_limit = time_limit_sec - (time.time() - start_time) if time_limit_sec is not None else None
-				results += self.iteratively_instantiate_with_premises_check(_p, inputs, premise_chains, trimmed_inputs, remaining_time_limit)
-			return results
+			deadline.check()
+			yield from search(p)
 		else:
 			# handling concrete programs won't take long, allow them to proceed
-			return [p]
+			yield p.to_node()
+
+	def compile_premises(self, premise_chains):
+		"""index premises of a sketch by level (see SketchPremises), 
+			premise chains are only generated when a check or a deduction at some level needs them"""
+		return SketchPremises(premise_chains)
+
+	def check_premises(self, p, level, inputs, premises, trimmed_inputs, equiv_table):
+		"""check the program (instantiated up to the given level) against premises at the level
+		Args:
+			premises: premises compiled by compile_premises, 
+				premise chains are generated until one of them is satisfied at the level
+		Returns:
+			whether the program should be kept, and the subquery result (None if it is not evaluated)
+		"""
+		subquery_res = None # cache subquery result to avoid re-computation overhead
+		for premise_index, subquery_path in premises.iter_indexes(level):
+
+			if subquery_res is None:
+				# check if the subquery result contains the premise
+				subquery = p.get(subquery_path)
+				logger.debug("  {}".format(subquery.stmt_string()))
+				subquery_res = subquery.to_node().eval(trimmed_inputs)
+
+				# index the subquery result once, it is shared by all premises at the level
+				subquery_res_index = build_column_index(subquery_res.to_dict(orient="records"))
+
+			if check_index_inclusion(premise_index, subquery_res_index):
+				# drop partial programs whose completions are covered by an earlier program
+				# (concrete programs are kept, they are verified against the output later)
+				redundant = p.is_abstract() and self.is_observationally_redundant(p, subquery_path, subquery_res, 
+																				   inputs, equiv_table)
+				return not redundant, subquery_res
+		return False, subquery_res
+
+	def check_shape(self, p, inputs, output_dims):
+		"""check if the (partial) program may produce a table containing the output, 
+			using the shape analysis only (no table is evaluated)"""
+		node = p.to_node() if isinstance(p, Program) else p
+		if node.infer_shape(inputs).may_contain(*output_dims):
+			return True
+		logger.debug("  [pruned] shape of {} cannot contain the output".format(node.stmt_string()))
+		return False
+
+	def is_observationally_redundant(self, p, subquery_path, subquery_res, inputs, equiv_table):
+		"""check if a partial program computes the same subquery result as a program seen earlier in the search
+			(in the same context, i.e., the same program outside of the subquery), its completions would then be 
+			the same as the completions of the earlier one. Programs are looked up by the fingerprint of 
+			subquery_res (the subquery result on trimmed inputs computed by check_premises), and the result on 
+			full inputs (where domains of the remaining holes are inferred) is only compared when fingerprints collide.
+		"""
+		subquery = p.get(subquery_path)
+		key = (p.context_key(subquery_path), table_fingerprint(subquery_res))
+		entries = equiv_table.get(key)
+		if entries is None:
+			# [subquery, fingerprint of its result on full inputs (computed on the first collision)]
+			equiv_table[key] = [[subquery, None]]
+			return False
+		try:
+			fingerprint = table_fingerprint(subquery.to_node().eval(inputs))
+			for entry in entries:
+				if entry[1] is None:
+					entry[1] = table_fingerprint(entry[0].to_node().eval(inputs))
+				if entry[1] == fingerprint:
+					logger.debug("  [pruned] equivalent to {}".format(entry[0].stmt_string()))
+					return True
+		except Exception as e:
+			logger.debug("[eval error in equivalence check] {}".format(e))
+			return False
+		entries.append([subquery, fingerprint])
+		return False
 
 	def enumerative_all_programs(self, inputs, output, max_prog_size, print_progs=True):
 		"""Given inputs and output, enumerate all programs in the search space until 
@@ -307,61 +468,488 @@ class Synthesizer(object):
 		print(f"number of programs: {len(candidates)}")
 		return candidates
 
+	def explore_sketch(self, s, inputs, output, deadline=None, disable_provenance_analysis=False, equiv_table=None):
+		"""run provenance analysis and backward evaluation for the sketch, 
+			and then instantiate it with premise check
+			(equiv_table is the observational equivalence table of the search, see is_observationally_redundant)
+		Returns:
+			candidate programs that should be verified against the output
+		"""
+		return list(self.iter_explore_sketch(s, inputs, output, deadline, disable_provenance_analysis, equiv_table))
+
+	def iter_explore_sketch(self, s, inputs, output, deadline=None, disable_provenance_analysis=False, equiv_table=None):
+		"""the generator version of explore_sketch, candidates are yielded as soon as they are instantiated"""
+		if deadline is not None:
+			deadline.check()
+
+		analysis_result = self.analyze_sketch(s, inputs, output, disable_provenance_analysis)
+		if analysis_result is None:
+			return
+		premise_chains, trimmed_inputs = analysis_result
+
+		yield from self.iter_instantiate_with_premises_check(s, inputs, premise_chains, trimmed_inputs, deadline, 
+																equiv_table, output_dims=table_dims(output))
+
+	def analyze_sketch(self, s, inputs, output, disable_provenance_analysis=False):
+		"""run provenance analysis and backward evaluation for the sketch
+		Returns:
+			(premise_chains, trimmed_inputs), or None if the sketch cannot produce the output
+		"""
+		if not self.check_shape(s, inputs, table_dims(output)):
+			return None
+
+		ast = s.to_dict()
+
+		if disable_provenance_analysis:
+			# disable provenance analysis
+			trimmed_inputs = inputs
+		else:
+			pred, trimmed_inputs = self.provenance_trie(inputs, output).analyze(ast)
+			self.cache_sample_inputs(ast, inputs, output, trimmed_inputs)
+
+		if len(trimmed_inputs[0]) == 0:
+			return None
+
+		# all premise chains for the given ast (generated lazily)
+		premise_chains = self.premise_chains(ast, output)
+
+		return premise_chains, trimmed_inputs
+
+	def premise_chains(self, ast, output):
+		"""premise chains of the sketch (see abstract_eval.backward_eval), 
+			chains are cached by operators of sketches and shared by all sketches of the output"""
+		if self.premise_cache is None or self.premise_cache[0] is not output:
+			out_df = remove_duplicate_columns(pd.DataFrame.from_dict(output))
+			self.premise_cache = (output, out_df, abstract_eval.PremiseCache())
+		_, out_df, cache = self.premise_cache
+		return cache.chains(ast, out_df)
+
+	def verify_program(self, p, inputs, output, deadline=None, use_sample=True):
+		"""check table consistensy: whether the output is contained in p(inputs) 
+			(the program is checked on a sample of inputs instead if possible and use_sample is set, see sample_inputs,
+			 it is only evaluated on the full inputs if the result on the sample is inconclusive, 
+			 the outcome of each stage is counted in verify_stats)"""
+		if deadline is not None:
+			deadline.check()
+		self.verify_stats["candidates"] += 1
+
+		sample = None
+		if use_sample and self.config.get("sample_verification", True):
+			sample = self.sample_inputs(p, inputs, output)
+		if sample is not None:
+			try:
+				records = p.eval(sample).to_dict(orient="records")
+			except Exception:
+				# the result on the sample is inconclusive (e.g., no value is separated)
+				records = None
+			if records is not None:
+				if align_table_schema(output, records) != None:
+					self.verify_stats["sample_accepted"] += 1
+					return True
+				self.verify_stats["sample_rejected"] += 1
+				return False
+
+		if self.config.get("eval_backend", "pandas") == "columnar":
+			records = eval_columnar(p, inputs).to_records()
+		elif self.config.get("eval_backend", "pandas") == "sqlite":
+			records = eval_sqlite(p, inputs).to_dict(orient="records")
+		else:
+			records = p.eval(inputs).to_dict(orient="records")
+		if align_table_schema(output, records) == None:
+			self.verify_stats["full_rejected"] += 1
+			return False
+		return True
+
+	def sample_inputs(self, p, inputs, output):
+		"""the sample of inputs to check the program on before the full inputs: rows of inputs that are 
+			relevant to the output according to provenance analysis, 
+			None if the program is not safe to check on samples (see SAMPLE_SAFE_OPS) or the sample is not small"""
+		ast = p.to_dict()
+		ops = []
+		while ast["op"] != "table_ref":
+			ops.append(ast["op"])
+			ast = ast["children"][0]
+		if any([op not in SAMPLE_SAFE_OPS for op in ops]):
+			return None
+
+		entry = self.sample_cache.get(tuple(ops))
+		if entry is None or entry[0] is not inputs or entry[1] is not output:
+			_, trimmed_inputs = self.provenance_trie(inputs, output).analyze(p.to_dict())
+			entry = self.cache_sample_inputs(p.to_dict(), inputs, output, trimmed_inputs)
+		return entry[2]
+
+	def provenance_trie(self, inputs, output):
+		"""the provenance analysis cache of the inputs and output, shared by all sketches of a synthesis task"""
+		if self.prov_trie is None or not self.prov_trie.matches(inputs, output):
+			self.prov_trie = ProvenanceTrie(inputs, output)
+		return self.prov_trie
+
+	def cache_sample_inputs(self, ast, inputs, output, trimmed_inputs):
+		"""build the sample from the result of provenance analysis of a program (or its sketch), 
+			samples only depend on operators of programs"""
+		ops = []
+		while ast["op"] != "table_ref":
+			ops.append(ast["op"])
+			ast = ast["children"][0]
+		entry = self.sample_cache.get(tuple(ops))
+		if entry is not None and entry[0] is inputs and entry[1] is output:
+			# sketches with the same operators share their sample
+			return entry
+		entry = (inputs, output, build_sample_inputs(inputs, trimmed_inputs))
+		self.sample_cache[tuple(ops)] = entry
+		return entry
+
+	def iter_synthesis(self, inputs, output, max_prog_size, time_limit_sec=None, disable_provenance_analysis=False):
+		"""Given inputs and output, lazily enumerate programs with premise check, 
+			and yield each program p such that output ⊆ subseteq p(inputs) as soon as it is verified.
+			(the caller can stop the search at any time by not asking for more programs)
+		"""
+		deadline = Deadline(time_limit_sec)
+		equiv_table = {}
+
+		all_sketches = self.enum_sketches(inputs, output, size=max_prog_size)
+		try:
+			for level, sketches in all_sketches.items():
+				for s in sketches:
+					for p in self.iter_explore_sketch(s, inputs, output, deadline, disable_provenance_analysis, equiv_table):
+						if self.verify_program(p, inputs, output, deadline,
+											use_sample=not disable_provenance_analysis):
+							yield p
+		except SynthesisTimeout:
+			print("[timeout] synthesis stopped at the time limit")
+
 	def enumerative_synthesis(self, 
 			inputs, output, max_prog_size, 
 			time_limit_sec=None, 
 			solution_sketch_limit=None, 
 			solution_limit=None,
-			disable_provenance_analysis=False):
+			disable_provenance_analysis=False,
+			num_workers=1,
+			search_strategy="enumerative"):
 		"""Given inputs and output, enumerate all programs with premise check until 
-			find a solution p such that output ⊆ subseteq p(inputs) """
+			find a solution p such that output ⊆ subseteq p(inputs) 
+			(sketches are explored in a process pool if num_workers > 1, 
+			 and in best-first order if search_strategy is "best_first")
+			the search returns programs found so far once time_limit_sec is passed"""
+		self.verify_stats = new_verify_stats()
+
+		if search_strategy == "best_first":
+			candidates = self.best_first_synthesis(inputs, output, max_prog_size, 
+						time_limit_sec, solution_sketch_limit, solution_limit, 
+						disable_provenance_analysis)
+		elif num_workers is not None and num_workers > 1:
+			candidates = self.parallel_enumerative_synthesis(inputs, output, max_prog_size, 
+						time_limit_sec, solution_sketch_limit, solution_limit, 
+						disable_provenance_analysis, num_workers)
+		else:
+			candidates = self.sequential_enumerative_synthesis(inputs, output, max_prog_size, 
+						time_limit_sec, solution_sketch_limit, solution_limit, 
+						disable_provenance_analysis)
 
-		start_time = time.time()
+		stats = self.verify_stats
+		logger.info("[verification] {} candidates, {} accepted and {} rejected on samples, {} rejected on full inputs".format(
+			stats["candidates"], stats["sample_accepted"], stats["sample_rejected"], stats["full_rejected"]))
+		return candidates
+
+	def sequential_enumerative_synthesis(self, 
+			inputs, output, max_prog_size, 
+			time_limit_sec=None, 
+			solution_sketch_limit=None, 
+			solution_limit=None,
+			disable_provenance_analysis=False):
+		"""The sequential search of enumerative_synthesis: sketches are explored one by one"""
+		deadline = Deadline(time_limit_sec)
 
 		all_sketches = self.enum_sketches(inputs, output, size=max_prog_size)
 		
 		candidates = []
 		solution_sketches = set() # records sketches of candidate programs
+		equiv_table = {}
+
+		try:
+			for level, sketches in all_sketches.items():
+				for s in sketches:
+					programs = self.iter_explore_sketch(s, inputs, output, deadline, disable_provenance_analysis, equiv_table)
+					
+					for p in programs:
+						if self.verify_program(p, inputs, output, deadline,
+											use_sample=not disable_provenance_analysis):
+							candidates.append(p)
+							solution_sketches.add(s.stmt_string())
+					
+						if ((solution_sketch_limit is not None and len(solution_sketches) >= solution_sketch_limit) or 
+							(solution_limit is not None and len(candidates) >= solution_limit)):
+							return candidates
+		except SynthesisTimeout:
+			# early return if the time limit is exceeded
+			print("[timeout] return {} candidates found within the time limit".format(len(candidates)))
 
-		for level, sketches in all_sketches.items():
-			for s in sketches:
-				ast = s.to_dict()
-				out_df = pd.DataFrame.from_dict(output)
+		return candidates
 
-				if disable_provenance_analysis:
-					# disable provenance analysis
-					trimmed_inputs = inputs
-				else:
-					pred, trimmed_inputs = provenance_analysis(ast, out_df, inputs)
+	def iter_best_first_synthesis(self, inputs, output, max_prog_size, time_limit_sec=None, 
+			disable_provenance_analysis=False, cost_model=None):
+		"""Best-first version of iter_synthesis: sketches and partial programs of all sketches are kept 
+			in one priority queue, and the cheapest one (according to cost_model) is expanded first,
+			so that promising deeper sketches are explored without exhausting all shallower ones.
+		Args:
+			cost_model: a function (program, context) -> cost, see enum_strategies.default_cost_model
+		"""
+		if cost_model is None:
+			cost_model = enum_strategies.default_cost_model
+
+		deadline = Deadline(time_limit_sec)
 
-					# print(pred.print_str())
-					# print(pd.DataFrame(trimmed_inputs[0]))
+		# queue entries are (cost, tie breaker, program, sketch state), 
+		# sketch state is None if the sketch is not analyzed yet
+		queue = []
+		counter = itertools.count()
 
-				if len(trimmed_inputs[0]) == 0:
+		def push(p, state, subquery_res=None):
+			context = {"output": output, 
+					   "premise_chains": state["premise_chains"] if state is not None else None, 
+					   "subquery_result": subquery_res}
+			heapq.heappush(queue, (cost_model(p, context), next(counter), p, state))
+
+		output_dims = table_dims(output)
+
+		# partial programs of this search are interned in their own table
+		programs = ProgramTable()
+		equiv_table = {}
+		all_sketches = self.enum_sketches(inputs, output, size=max_prog_size)
+		for level in sorted(all_sketches.keys()):
+			for s in all_sketches[level]:
+				push(Program.from_node(s, programs), None)
+
+		try:
+			while len(queue) > 0:
+				deadline.check()
+				cost, _, p, state = heapq.heappop(queue)
+
+				if state is None:
+					analysis_result = self.analyze_sketch(p.to_node(), inputs, output, disable_provenance_analysis)
+					if analysis_result is None:
+						continue
+					premise_chains, trimmed_inputs = analysis_result
+					state = {"premise_chains": premise_chains, "premises": self.compile_premises(premise_chains), 
+							 "trimmed_inputs": trimmed_inputs}
+					push(p, state)
 					continue
 
-				out_df = remove_duplicate_columns(out_df)
-				# all premise chains for the given ast
-				premise_chains = abstract_eval.backward_eval(ast, out_df)
-
-				remaining_time_limit = time_limit_sec - (time.time() - start_time) if time_limit_sec is not None else None
-				programs = self.iteratively_instantiate_with_premises_check(s, inputs, premise_chains, trimmed_inputs, remaining_time_limit)
-				
-				for p in programs:
-					# check table consistensy
-					t = p.eval(inputs)
-					alignment_result = align_table_schema(output, t.to_dict(orient="records"))
-					if alignment_result != None:
-						candidates.append(p)
-						solution_sketches.add(s.stmt_string())
-				
-					if ((solution_sketch_limit is not None and len(solution_sketches) >= solution_sketch_limit) or 
-						(solution_limit is not None and len(candidates) >= solution_limit)):
-						return candidates
-				
-				# early return if the termination condition is met
-				# TODO: time_limit may be exceeded if the synthesizer is stuck on iteratively instantiation
-				if time_limit_sec is not None and time.time() - start_time > time_limit_sec:
-					return candidates
+				if not p.is_abstract():
+					node = p.to_node()
+					if self.verify_program(node, inputs, output, deadline,
+											use_sample=not disable_provenance_analysis):
+						yield node
+					continue
+
+				logger.debug(p.stmt_string())
+				level = max([len(path) for path in p.holes]) - 1
+				for _p in self.iter_instantiate_one_level(p, inputs, deadline, state["premises"]):
+					deadline.check()
+					if not self.check_shape(_p, inputs, output_dims):
+						continue
+					keep, subquery_res = self.check_premises(_p, level, inputs, state["premises"], 
+															 state["trimmed_inputs"], equiv_table)
+					if keep:
+						push(_p, state, subquery_res)
+		except SynthesisTimeout:
+			print("[timeout] synthesis stopped at the time limit")
+
+	def best_first_synthesis(self, 
+			inputs, output, max_prog_size, 
+			time_limit_sec=None, 
+			solution_sketch_limit=None, 
+			solution_limit=None,
+			disable_provenance_analysis=False,
+			cost_model=None):
+		"""The same as enumerative_synthesis, but the search space is explored in best-first order 
+			(see iter_best_first_synthesis)"""
+		candidates = []
+		solution_sketches = set()
+
+		programs = self.iter_best_first_synthesis(inputs, output, max_prog_size, time_limit_sec, 
+												  disable_provenance_analysis, cost_model)
+		for p in programs:
+			candidates.append(p)
+			solution_sketches.add(Program.from_node(p).sketch().stmt_string())
+			if ((solution_sketch_limit is not None and len(solution_sketches) >= solution_sketch_limit) or 
+				(solution_limit is not None and len(candidates) >= solution_limit)):
+				break
+		return candidates
+
+	def parallel_enumerative_synthesis(self, 
+			inputs, output, max_prog_size, 
+			time_limit_sec=None, 
+			solution_sketch_limit=None, 
+			solution_limit=None,
+			disable_provenance_analysis=False,
+			num_workers=None):
+		"""The same as enumerative_synthesis, but sketches are explored in parallel by a process pool.
+			Workers share the deadline and the solution counters, they stop once the limits are reached,
+			sketches that are not yet started are cancelled.
+			(solutions are collected in the order they are found, which may differ from the sequential order)
+		"""
+		start_time = time.time()
+		deadline = start_time + time_limit_sec if time_limit_sec is not None else None
+
+		all_sketches = self.enum_sketches(inputs, output, size=max_prog_size)
+		sketches = [s for level in sorted(all_sketches.keys()) for s in all_sketches[level]]
+
+		candidates = []
+		solution_sketches = set()
+
+		def limits_reached():
+			return ((solution_sketch_limit is not None and len(solution_sketches) >= solution_sketch_limit) or 
+					(solution_limit is not None and len(candidates) >= solution_limit))
+
+		shared_state = SharedSearchState(solution_sketch_limit, solution_limit)
+		executor = concurrent.futures.ProcessPoolExecutor(max_workers=num_workers, 
+						initializer=_init_worker, initargs=(shared_state,))
+		try:
+			futures = {}
+			for s in sketches:
+				f = executor.submit(_explore_sketch_in_worker, self.config, s, inputs, output, 
+									deadline, disable_provenance_analysis)
+				futures[f] = s
+
+			remaining_time = deadline - time.time() if deadline is not None else None
+			for f in concurrent.futures.as_completed(futures, timeout=remaining_time):
+				results, stats = f.result()
+				for key in stats:
+					self.verify_stats[key] += stats[key]
+				for p in results:
+					candidates.append(p)
+					solution_sketches.add(futures[f].stmt_string())
+					if limits_reached():
+						break
+				if limits_reached():
+					break
+		except concurrent.futures.TimeoutError:
+			pass
+		finally:
+			shared_state.stop()
+			executor.shutdown(wait=False, cancel_futures=True)
 
 		return candidates
+
+
+def new_verify_stats():
+	"""counters of candidates checked by verify_program, the ones accepted / rejected on samples and rejected on full inputs"""
+	return {"candidates": 0, "sample_accepted": 0, "sample_rejected": 0, "full_rejected": 0}
+
+
+def build_sample_inputs(inputs, trimmed_inputs):
+	"""the rows of inputs kept in trimmed_inputs (records of provenance analysis), as dataframes 
+		(with original dtypes and row labels), None if the sample is not much smaller than inputs"""
+	if any([not isinstance(inp, list) for inp in inputs]):
+		return None
+	if len(trimmed_inputs) != len(inputs):
+		return None
+	total_size = sum([len(inp) for inp in inputs])
+	sample_size = sum([len(inp) for inp in trimmed_inputs])
+	if total_size == 0 or sample_size > total_size * SAMPLE_MAX_RATIO:
+		return None
+
+	sample = []
+	for i, (inp, trimmed) in enumerate(zip(inputs, trimmed_inputs)):
+		kept = set([id(r) for r in trimmed])
+		positions = [k for k, r in enumerate(inp) if id(r) in kept]
+		sample.append(Table(i).eval(inputs).iloc[positions])
+	return sample
+
+
+class SketchPremises(object):
+	"""premises of a sketch indexed by level, built on demand: premise chains (e.g., a LazyChains) are only 
+		generated as far as a check or a deduction at some level needs them, 
+		and each premise is compiled into a column index (see build_column_index) once"""
+	def __init__(self, premise_chains):
+		self.premise_chains = premise_chains
+		# id(premise) -> (premise, column index of the premise)
+		self.indexes = {}
+		# level -> distinct premises at the level
+		self.level_examples = {}
+
+	def iter_level(self, level):
+		"""(premise, subquery path) of each premise chain at the level, chains are generated when they are reached"""
+		for premise_chain in self.premise_chains:
+			for premise, subquery_path in premise_chain:
+				if len(subquery_path) == level:
+					yield premise, subquery_path
+					break
+
+	def iter_indexes(self, level):
+		"""(premise index, subquery path) of each premise chain at the level"""
+		for premise, subquery_path in self.iter_level(level):
+			entry = self.indexes.get(id(premise))
+			if entry is None:
+				entry = self.indexes[id(premise)] = (premise, build_column_index(premise.to_dict(orient="records")))
+			yield entry[1], subquery_path
+
+	def examples(self, level):
+		"""distinct premises at the level (all premise chains are generated), 
+			a premise at a level is an output example of the operator at the level"""
+		if level not in self.level_examples:
+			examples = []
+			for premise, _ in self.iter_level(level):
+				if not any([premise is e for e in examples]):
+					examples.append(premise)
+			self.level_examples[level] = examples
+		return self.level_examples[level]
+
+
+class SharedSearchState(object):
+	"""solution counters and the cancellation flag shared by worker processes of the parallel synthesis"""
+	def __init__(self, solution_sketch_limit=None, solution_limit=None):
+		self.solution_sketch_limit = solution_sketch_limit
+		self.solution_limit = solution_limit
+		self.solution_count = multiprocessing.Value("i", 0)
+		self.solution_sketch_count = multiprocessing.Value("i", 0)
+		self.stopped = multiprocessing.Value("b", False)
+
+	def stop(self):
+		self.stopped.value = True
+
+	def add_solution(self, is_first_of_sketch):
+		with self.solution_count.get_lock():
+			self.solution_count.value += 1
+		if is_first_of_sketch:
+			with self.solution_sketch_count.get_lock():
+				self.solution_sketch_count.value += 1
+
+	def should_stop(self):
+		return (self.stopped.value or 
+				(self.solution_sketch_limit is not None and self.solution_sketch_count.value >= self.solution_sketch_limit) or 
+				(self.solution_limit is not None and self.solution_count.value >= self.solution_limit))
+
+
+# the shared state of the current worker process (set by the process pool initializer),
+# and the observational equivalence table of sketches explored by the worker
+_worker_state = None
+_worker_equiv_table = None
+
+def _init_worker(shared_state):
+	global _worker_state, _worker_equiv_table
+	_worker_state = shared_state
+	_worker_equiv_table = {}
+
+def _explore_sketch_in_worker(config, s, inputs, output, deadline, disable_provenance_analysis):
+	"""explore one sketch in a worker process and return its verified programs (with verification stats)"""
+	if _worker_state.should_stop() or (deadline is not None and time.time() > deadline):
+		return [], new_verify_stats()
+
+	synthesizer = Synthesizer(config=config)
+	time_limit_sec = deadline - time.time() if deadline is not None else None
+	worker_deadline = Deadline(time_limit_sec, is_cancelled=_worker_state.should_stop)
+
+	results = []
+	try:
+		programs = synthesizer.iter_explore_sketch(s, inputs, output, worker_deadline, disable_provenance_analysis, 
+												   _worker_equiv_table)
+		for p in programs:
+			if synthesizer.verify_program(p, inputs, output, worker_deadline,
+											use_sample=not disable_provenance_analysis):
+				_worker_state.add_solution(is_first_of_sketch=(len(results) == 0))
+				results.append(p)
+	except SynthesisTimeout:
+		pass
+	return results, synthesizer.verify_stats
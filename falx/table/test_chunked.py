@@ -0,0 +1,91 @@
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from falx.table.language import *
+from falx.table.chunked import eval_chunked, iter_chunks, iter_records
+
+
+class TestChunked(unittest.TestCase):
+
+	def setUp(self):
+		self.inputs = [[
+			{"region": "north-east", "year": 2018, "q1": 1.5, "q2": 2},
+			{"region": "south_west", "year": 2018, "q1": 0.5, "q2": 3},
+			{"region": "north-east", "year": 2019, "q1": 2.0, "q2": 1},
+			{"region": "south_west", "year": 2019, "q1": None, "q2": 4},
+			{"region": "north", "year": 2020, "q1": 0.1, "q2": 5}]]
+
+	def test_operators(self):
+		programs = [
+			Select(Table(0), [1, 0]),
+			Unite(Table(0), 0, 2),
+			Filter(Table(0), 1, "==", 2019),
+			Separate(Table(0), 0),
+			Spread(Select(Table(0), [0, 1, 3]), 1, 2),
+			GroupSummary(Table(0), [0], 2, "mean"),
+			GroupSummary(Table(0), [0, 1], 3, "sum"),
+			GroupSummary(Table(0), [0], 2, "count"),
+			GroupSummary(Table(0), [0], 3, "cumsum"),
+			CumSum(Table(0), 2),
+			CumSum(Filter(Table(0), 1, "!=", 2018), 3),
+			Mutate(Table(0), 2, "+", 3),
+			MutateCustom(Table(0), 0, "==", "north-east"),
+		]
+		for p in programs:
+			expected = p.eval(self.inputs)
+			for chunk_size in [1, 2, 3, 10]:
+				pd.testing.assert_frame_equal(eval_chunked(p, self.inputs, chunk_size), expected)
+
+	def test_gather(self):
+		p = GroupSummary(Gather(Table(0), [2, 3]), [1, 2], 3, "sum")
+		pd.testing.assert_frame_equal(eval_chunked(p, self.inputs, 2), p.eval(self.inputs))
+
+		# rows of gather follow the melt order, so later order-dependent operators are the same
+		inputs = [[{"a": "x", "q1": 1, "q2": 10}, {"a": "y", "q1": 2, "q2": 20}, {"a": "z", "q1": 3, "q2": 30}]]
+		programs = [
+			Gather(Table(0), [1, 2]),
+			CumSum(Gather(Table(0), [1, 2]), 2),
+			Filter(Gather(Table(0), [1, 2]), 1, "==", "q2"),
+			GroupSummary(Gather(Table(0), [1, 2]), [0], 2, "cumsum"),
+			CumSum(Gather(Filter(Table(0), 0, "!=", "y"), [1, 2]), 2),
+		]
+		for p in programs:
+			for chunk_size in [1, 2, 10]:
+				pd.testing.assert_frame_equal(eval_chunked(p, inputs, chunk_size), p.eval(inputs))
+		p = Gather(Table(0), [2, 3])
+		pd.testing.assert_frame_equal(eval_chunked(p, self.inputs, 2), p.eval(self.inputs))
+
+		# inputs that can only be consumed once are evaluated once
+		df = pd.DataFrame.from_dict(inputs[0])
+		p = CumSum(Gather(Table(0), [1, 2]), 2)
+		chunks = iter_chunks(p, [iter([df.iloc[:1], df.iloc[1:]])], 2)
+		pd.testing.assert_frame_equal(pd.concat(list(chunks)), p.eval([df]))
+
+	def test_records(self):
+		p = Gather(Table(0), [2, 3])
+		records = list(iter_records(p, self.inputs, 2))
+		pd.testing.assert_frame_equal(pd.DataFrame.from_records(records), p.eval(self.inputs))
+
+	def test_iterator_input(self):
+		df = pd.DataFrame.from_dict(self.inputs[0])
+		p = GroupSummary(Filter(Table(0), 0, "!=", "north"), [1], 4, "sum")
+		inputs = [iter([df.iloc[:2], df.iloc[2:4], df.iloc[4:]])]
+		chunks = list(iter_chunks(p, inputs, 2))
+		self.assertEqual(len(chunks), 1)
+		pd.testing.assert_frame_equal(chunks[0], p.eval([df]))
+
+		# no row is left
+		p = Filter(Table(0), 0, "==", "west")
+		chunks = list(iter_chunks(p, [df], 2))
+		self.assertEqual(len(chunks), 1)
+		pd.testing.assert_frame_equal(chunks[0], p.eval([df]))
+
+		# no value is separated
+		with self.assertRaises(KeyError):
+			eval_chunked(Separate(Table(0), 0), [[{"a": "x", "b": 1}, {"a": "y", "b": 2}]], 1)
+
+
+if __name__ == '__main__':
+	unittest.main()
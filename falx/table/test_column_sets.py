@@ -0,0 +1,61 @@
+import unittest
+import itertools
+
+from falx.table.column_sets import iter_gather_value_columns, count_lex_smaller, tuple_to_bits
+
+
+def gather_candidates(schema, config):
+	"""build the gather domain by enumerating all column combinations (the reference implementation)"""
+	col_num = len(schema)
+	max_val_list_size = min(col_num - 1, config["gather_max_val_list_size"])
+	max_key_list_size = min(col_num - 2, col_num - config["gather_max_val_list_size"] - 1,
+							config["gather_max_key_list_size"])
+	fw = [l for size in range(2, max_val_list_size + 1) for l in itertools.combinations(range(col_num), size)
+			if len(set([schema[i] for i in l])) == 1]
+	bw = [tuple([x for x in range(col_num) if x not in l])
+			for size in range(1, max_key_list_size + 1) for l in itertools.combinations(range(col_num), size)
+			if len(set([schema[i] for i in range(col_num) if i not in l])) == 1]
+	candidates = []
+	for i in range(max(len(fw), len(bw))):
+		candidates += bw[i:i + 1] + fw[i:i + 1]
+	if not config["consider_non_consecutive_gather_keys"]:
+		candidates = [l for l in candidates if l[-1] - l[0] == len(l) - 1]
+	return candidates
+
+
+class TestColumnSets(unittest.TestCase):
+
+	def test_count_lex_smaller(self):
+		cols = (1, 3, 4)
+		allowed = tuple_to_bits([0, 1, 3, 4, 5])
+		expected = [l for l in itertools.combinations([0, 1, 3, 4, 5], 3) if l < cols]
+		self.assertEqual(count_lex_smaller(cols, allowed, 0), len(expected))
+
+		mandatory = tuple_to_bits([1])
+		expected = [l for l in itertools.combinations(range(6), 3) if l < cols and 1 in l]
+		self.assertEqual(count_lex_smaller(cols, tuple_to_bits(range(6)), mandatory), len(expected))
+
+	def test_gather_candidates(self):
+		schemas = [
+			["string", "number", "number", "number", "number"],
+			["number", "string", "number", "number", "string", "number", "number", "number"],
+			["string"] * 3 + ["number"] * 6,
+			["number"] * 3,
+		]
+		for schema in schemas:
+			for max_val, max_key in [(3, 3), (6, 6), (2, 1)]:
+				for non_consecutive in [False, True]:
+					config = {"gather_max_val_list_size": max_val, "gather_max_key_list_size": max_key,
+							  "consider_non_consecutive_gather_keys": non_consecutive}
+					self.assertEqual(list(iter_gather_value_columns(schema, config)), gather_candidates(schema, config))
+
+	def test_lazy(self):
+		config = {"gather_max_val_list_size": 6, "gather_max_key_list_size": 6,
+				  "consider_non_consecutive_gather_keys": False}
+		# only consecutive runs are generated, even for wide tables
+		candidates = iter_gather_value_columns(["string"] + ["number"] * 200, config)
+		self.assertEqual(next(candidates), tuple(range(1, 201)))
+
+
+if __name__ == '__main__':
+	unittest.main()
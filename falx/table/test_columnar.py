@@ -0,0 +1,103 @@
+import unittest
+import math
+import copy
+
+import numpy as np
+
+from falx.table.language import *
+from falx.table.synthesizer import Synthesizer, abstract_combinators
+from falx.table.columnar import eval_columnar, ColumnTable, Column
+
+
+def normalize(df):
+	"""column names, column types and rows of a dataframe (nan replaced by None, floats rounded)"""
+	rows = []
+	for i in range(len(df)):
+		row = []
+		for j in range(len(df.columns)):
+			v = df.iloc[i, j]
+			if v is None or (isinstance(v, float) and math.isnan(v)):
+				v = None
+			elif isinstance(v, (float, np.floating)):
+				v = round(float(v), 6)
+			row.append(v)
+		rows.append(tuple(row))
+	return list(df.columns), extract_table_schema(df), rows
+
+
+class TestColumnar(unittest.TestCase):
+
+	def check_same_as_pandas(self, p, inputs):
+		try:
+			expected = p.eval(inputs)
+		except Exception:
+			# programs that fail in pandas are discarded by the synthesizer anyway
+			return False
+		self.assertEqual(normalize(eval_columnar(p, inputs).to_dataframe()), normalize(expected), p.stmt_string())
+		return True
+
+	def test_column_encoding(self):
+		col = Column.from_values(["b", "a", "b"])
+		self.assertTrue(col.is_encoded())
+		self.assertEqual(list(col.dictionary), ["a", "b"])
+		self.assertEqual(col.codes.tolist(), [1, 0, 1])
+
+		col = Column.from_values(["b", "a", None, "b"])
+		self.assertEqual(col.values().tolist(), ["b", "a", None, "b"])
+		self.assertEqual(col.is_null().tolist(), [False, False, True, False])
+
+		col = Column.from_values([1, 2.5, None])
+		self.assertFalse(col.is_encoded())
+		self.assertEqual(col.data.dtype, np.float64)
+
+		records = [{"a": "x", "b": 1}, {"a": "y", "b": 2}]
+		self.assertEqual(ColumnTable.from_records(records).to_records(), records)
+
+	def test_operators(self):
+		inputs = [[
+			{"id": 1, "k": "a", "v": 1, "w": "p-1"},
+			{"id": 1, "k": "b", "v": 2, "w": "q-2"},
+			{"id": 2, "k": "a", "v": 3, "w": "r-3"},
+			{"id": 3, "k": "c", "v": None, "w": "s-4"}
+		]]
+		progs = [
+			Spread(Select(Table(0), [0, 1, 2]), 1, 2),
+			Gather(Table(0), [1, 3]),
+			Separate(Table(0), 3),
+			Unite(Table(0), 1, 3),
+			Filter(Table(0), 1, "==", "a"),
+			GroupSummary(Table(0), [1], 2, "mean"),
+			GroupSummary(Table(0), [0], 2, "cumsum"),
+			CumSum(Table(0), 2),
+			Mutate(Table(0), 0, "-", 2),
+			MutateCustom(Table(0), 1, "==", "b"),
+		]
+		for p in progs:
+			self.assertTrue(self.check_same_as_pandas(p, inputs), p.stmt_string())
+
+	def test_enumerated_programs(self):
+		tables = [
+			[{"Bucket": "Bucket_E", "Budgeted": 100, "Actual": 115},
+			 {"Bucket": "Bucket_D", "Budgeted": 100, "Actual": 90},
+			 {"Bucket": "Bucket_C", "Budgeted": 125, "Actual": 115}],
+			[{"Value": "A", "variable": "alpha", "value": 2},
+			 {"Value": "B", "variable": "alpha", "value": 2.5},
+			 {"Value": "A", "variable": "beta", "value": None}],
+		]
+		config = dict(Synthesizer().config)
+		config["constants"] = ["A", 100]
+		config["aggr_func"] = ["mean", "sum", "count", "cumsum"]
+		synthesizer = Synthesizer(config)
+
+		num_checked = 0
+		for t in tables:
+			inputs = [t]
+			for op in abstract_combinators:
+				sketch = abstract_combinators[op](copy.copy(Table(0)))
+				for p in synthesizer.iteratively_instantiate_and_print(sketch, inputs, 1):
+					num_checked += self.check_same_as_pandas(p, inputs)
+		self.assertTrue(num_checked > 0)
+
+
+if __name__ == '__main__':
+	unittest.main()
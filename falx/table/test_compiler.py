@@ -0,0 +1,54 @@
+import unittest
+
+import pandas as pd
+
+from falx.table.language import *
+from falx.table.program import Program
+from falx.table.compiler import compile_program
+
+
+class TestCompiler(unittest.TestCase):
+
+	def setUp(self):
+		self.inputs = [[
+			{"id": 1, "k": "a", "v": 1, "w": "p-1", "cumsum": 0.5},
+			{"id": 1, "k": "b", "v": 2, "w": "q-2", "cumsum": 1.5},
+			{"id": 2, "k": "a", "v": 3, "w": "r-3", "cumsum": 2.5},
+			{"id": 3, "k": "c", "v": None, "w": "s-4", "cumsum": 3.5}
+		]]
+
+	def test_fused_stages(self):
+		p = Mutate(Mutate(Select(Table(0), [0, 2, 4]), 0, "+", 1), 3, "-", 2)
+		self.assertEqual(repr(compile_program(p)), "Select+Mutate+Mutate")
+
+		# gather stacks the united column in the same stage
+		p = Gather(Unite(Table(0), 1, 3), [0, 2])
+		self.assertEqual(repr(compile_program(p)), "Unite+Gather")
+		self.assertEqual(repr(compile_program(CumSum(Gather(Filter(Table(0), 1, "==", "a"), [0, 2]), 3))), "Filter | Gather+CumSum")
+		self.assertIs(compile_program(p), compile_program(Program.from_node(p)))
+
+	def test_same_as_eval(self):
+		progs = [
+			Table(0),
+			Mutate(Mutate(Table(0), 0, "+", 2), 5, "-", 4),
+			Gather(Unite(Table(0), 1, 3), [0, 2]),
+			Gather(Filter(Table(0), 1, "!=", "b"), [0, 2, 4]),
+			Unite(Gather(Table(0), [1, 3]), 0, 4),
+			Gather(MutateCustom(Table(0), 1, "==", "a"), [2, 5]),
+			Gather(Gather(Table(0), [1, 3]), [3]),
+			Separate(Select(Table(0), [1, 3]), 1),
+			CumSum(Table(0), 2),
+			CumSum(Filter(Table(0), 1, "==", "a"), 0),
+			MutateCustom(GroupSummary(Table(0), [1], 2, "sum"), 0, "==", "a"),
+			Spread(Select(Table(0), [0, 1, 2]), 1, 2),
+		]
+		for p in progs:
+			pd.testing.assert_frame_equal(compile_program(p)(self.inputs), p.eval(self.inputs))
+
+		# errors are the same as eval
+		with self.assertRaises(KeyError):
+			compile_program(Separate(Table(0), 1))(self.inputs)
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,46 @@
+import unittest
+import itertools
+
+import pandas as pd
+
+from falx.table.language import *
+from falx.table.dependencies import KeyProfile
+
+
+class TestDependencies(unittest.TestCase):
+
+	def setUp(self):
+		self.df = pd.DataFrame.from_dict([
+			{"id": 1, "product": "A", "category": "x", "quarter": "Q1", "sales": 10},
+			{"id": 2, "product": "A", "category": "x", "quarter": "Q2", "sales": 12},
+			{"id": 3, "product": "B", "category": "y", "quarter": "Q1", "sales": 10},
+			{"id": 4, "product": "B", "category": "y", "quarter": "Q2", "sales": 15},
+			{"id": 5, "product": "C", "category": "y", "quarter": "Q1", "sales": None}])
+
+	def test_keys(self):
+		profile = KeyProfile(self.df)
+		expected = [cols for size in range(1, 5) for cols in itertools.combinations(range(5), size)
+						if self.df[[self.df.columns[k] for k in cols]].duplicated().any()]
+		self.assertEqual(profile.non_unique_column_sets(4), expected)
+		self.assertIn((0,), profile.keys)
+		self.assertIn((1, 3), profile.keys)
+		self.assertFalse(profile.has_duplicates([0, 2]))
+		self.assertTrue(profile.has_duplicates([2, 3]))
+
+	def test_functional_dependencies(self):
+		profile = KeyProfile(self.df)
+		profile.non_unique_column_sets(2)
+		# product determines category
+		self.assertIn(((1,), 2), profile.functional_dependencies())
+		self.assertNotIn(((2,), 1), profile.functional_dependencies())
+
+	def test_group_summary_domain(self):
+		inputs = [self.df]
+		domain = GroupSummary(Table(0), HOLE, HOLE, HOLE).infer_domain(1, inputs, {})
+		self.assertIn((2,), domain)
+		self.assertNotIn((0,), domain)
+		self.assertNotIn((0, 1), domain)
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,74 @@
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from falx.table.language import *
+from falx.table.pivot import spread_table, spread_schema, table_profile, num_distinct_rows
+
+
+class TestPivot(unittest.TestCase):
+
+	def test_spread_table(self):
+		df = pd.DataFrame.from_dict([
+			{"id": 2, "g": "u", "k": "b", "v": 1},
+			{"id": 1, "g": "u", "k": "a", "v": 2},
+			{"id": 2, "g": "u", "k": "a", "v": 3}])
+		ret = spread_table(df, 2, 3)
+		self.assertEqual(list(ret.columns), ["id", "g", "a", "b"])
+		self.assertEqual(ret.columns.name, "k")
+		self.assertEqual(ret["id"].tolist(), [1, 2])
+		self.assertEqual(ret["a"].tolist(), [2.0, 3.0])
+		self.assertTrue(np.isnan(ret["b"][0]))
+
+		# a key named the same as an index column: only keys are kept
+		ret = spread_table(df.assign(k=["g", "id", "id"]), 2, 3)
+		self.assertEqual(list(ret.columns), ["g", "id"])
+
+		with self.assertRaises(ValueError):
+			spread_table(df.assign(k="a"), 2, 3)
+
+		# missing values in index columns are handled by multi-index pivoting
+		self.assertIsNone(spread_table(df.assign(g=[None, "u", "u"]), 2, 3))
+
+	def test_spread_schema(self):
+		df = pd.DataFrame.from_dict([
+			{"id": 2, "g": "u", "k": "b", "v": 1, "f": True},
+			{"id": 1, "g": "u", "k": "a", "v": 2, "f": False},
+			{"id": 2, "g": "u", "k": "a", "v": 3, "f": True}])
+		cases = [(df[["id", "g", "k", "v"]], 2, 3), (df[["id", "k", "f"]], 1, 2), (df[["k", "id", "f"]], 1, 2),
+				 (df[["id", "g", "k", "v"]].assign(k=["g", "id", "id"]), 2, 3)]
+		for table, key, val in cases:
+			self.assertEqual(spread_schema(table, key, val, table_profile(table)), 
+							 extract_table_schema(spread_table(table, key, val)))
+		# boolean values of the key "b" are missing in one row
+		self.assertEqual(spread_schema(df[["id", "k", "f"]], 1, 2, table_profile(df[["id", "k", "f"]])), 
+						 ["number", "bool", "string"])
+
+		with self.assertRaises(ValueError):
+			spread_schema(df.assign(k="a"), 2, 3, table_profile(df.assign(k="a")))
+		# tables pivoted through a multi-index are not supported
+		table = df.assign(g=[None, "u", "u"])
+		self.assertIsNone(spread_schema(table, 2, 3, table_profile(table)))
+
+		inputs = [df.to_dict(orient="records")]
+		p = Spread(Select(Table(0), [0, 1, 2, 3]), 2, 3)
+		self.assertEqual(p.infer_output_info(inputs), ["number", "string", "number", "number"])
+
+	def test_profile(self):
+		df = pd.DataFrame({"a": [1, 1, 2, 2], "b": [np.nan, np.nan, 1.0, 1.0], "c": ["x", None, None, "x"]})
+		profiles = table_profile(df)
+		self.assertEqual(profiles[0].counts.tolist(), [2, 2])
+		# NaN is a distinct value, None equals None
+		self.assertEqual(profiles[1].counts.tolist(), [2, 1, 1])
+		self.assertEqual(profiles[2].counts.tolist(), [2, 2])
+		self.assertEqual(num_distinct_rows([profiles[0], profiles[2]]), 4)
+		self.assertEqual(num_distinct_rows([profiles[0], profiles[0]]), 2)
+
+		inputs = [[{"id": i // 2, "k": "ab"[i % 2], "v": i} for i in range(6)]]
+		self.assertEqual(Spread(Table(0), HOLE, HOLE).infer_domain(1, inputs, {}), [0, 1])
+		self.assertEqual(Spread(Table(0), 1, HOLE).infer_domain(2, inputs, {}), [2])
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,57 @@
+import unittest
+
+from falx.table.language import *
+from falx.table.program import Program, ProgramTable
+
+inputs = [[
+	{ "Bucket": "Bucket_E", "Budgeted": 100, "Actual": 115 },
+	{ "Bucket": "Bucket_D", "Budgeted": 100, "Actual": 90 },
+	{ "Bucket": "Bucket_C", "Budgeted": 125, "Actual": 115 }
+]]
+
+class TestProgram(unittest.TestCase):
+
+	def test_interning(self):
+		table = ProgramTable()
+		p1 = Program.from_node(Gather(Table(0), (1, 2)), table)
+		p2 = Program.from_node(Gather(Table(0), [1, 2]), table)
+		self.assertTrue(p1 is p2)
+		self.assertTrue(p1.children[0] is Program.from_node(Table(0), table))
+		self.assertFalse(p1 is Program.from_node(Gather(Table(0), (0, 2)), table))
+
+		# programs of different tables are not shared, but they are still equal
+		p3 = Program.from_node(Gather(Table(0), (1, 2)))
+		self.assertFalse(p3 is p1)
+		self.assertEqual(p3, p1)
+		self.assertEqual(hash(p3), hash(p1))
+		self.assertFalse(p3.to_node() is p1.to_node())
+		self.assertNotEqual(p3, Program.from_node(Gather(Table(0), (0, 2)), table))
+
+	def test_fill_holes(self):
+		table = ProgramTable()
+		sketch = Unite(Gather(Table(0), HOLE), HOLE, HOLE)
+		p = Program.from_node(sketch, table)
+		self.assertEqual(p.holes, ((0, 1), (1,), (2,)))
+		self.assertTrue(p.is_abstract())
+
+		p1 = p.fill([0, 1], (1, 2))
+		self.assertEqual(p1.holes, ((1,), (2,)))
+		# untouched subtrees are shared
+		self.assertTrue(p1.children[0].children[0] is p.children[0].children[0])
+
+		p2 = p1.fill([1], 0).fill([2], 1)
+		self.assertFalse(p2.is_abstract())
+		self.assertTrue(p2 is Program.from_node(Unite(Gather(Table(0), (1, 2)), 0, 1), table))
+		self.assertEqual(p2.context_key([0, 0]), Program.from_node(Unite(Gather(Table(1), (1, 2)), 0, 1)).context_key([0, 0]))
+		self.assertEqual(p2.context_key([0]), ("unite", HOLE, 0, 1))
+
+	def test_node_conversion(self):
+		node = Mutate(Gather(Table(0), (1, 2)), 2, "+", 2)
+		p = Program.from_node(node)
+		self.assertEqual(p.stmt_string(), node.stmt_string())
+		self.assertEqual(p.key, node.canonical_form())
+		self.assertEqual(p.to_node().stmt_string(), node.stmt_string())
+		self.assertTrue(p.to_node().eval(inputs).equals(node.eval(inputs)))
+
+if __name__ == '__main__':
+	unittest.main()
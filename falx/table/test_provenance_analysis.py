@@ -4,6 +4,9 @@ from falx.table.language import *
 from falx.table.provenance_analysis import *
 import os
 import pandas as pd
+import numpy as np
+
+from falx.utils.synth_utils import value_interner_scope
 
 from pprint import pprint
 
@@ -215,5 +218,113 @@ class TestProvenanceAnalysis(unittest.TestCase):
 		print(pred.print_str())
 		print(pd.DataFrame(trimmed_inputs[0]))
 
+	def test_mask(self):
+		inputs = [[
+			{ "Bucket": "Bucket_E", "Budgeted": 100, "Actual": 115.0, "Flag": True },
+			{ "Bucket": "Bucket_D", "Budgeted": 100, "Actual": 90, "Flag": False },
+			{ "Bucket": "Bucket C", "Budgeted": "125", "Actual": None, "Flag": True },
+			{ "Bucket": "Bucket_B", "Budgeted": 125, "Flag": 1 },
+		]]
+
+		preds = [
+			PredContainsVal(115),
+			PredContainsVal("100.0"),
+			PredContainsVal(125),
+			PredContainsVal("True"),
+			PredContainsVal(1),
+			PredContainsVal(None),
+			PredContainsSubstr("et_"),
+			PredConj([PredContainsSubstr("Bucket"), PredContainsVal(100)]),
+			PredDisj([PredContainsVal("Bucket C"), PredConj([PredContainsVal(1), PredTrue()])]),
+			PredConj([]),
+			PredDisj([])
+		]
+		for pred in preds:
+			self.assertEqual(trim_records(pred, inputs[0]), trim_records_by_check(pred, inputs[0]))
+
+		# masks of values are looked up in the index of the records, and cached in the view
+		view = record_view(inputs[0])
+		self.assertIs(record_view(inputs[0]), view)
+		self.assertEqual(view.value_mask(PredContainsVal(100).keys).tolist(), [True, True, False, False])
+		self.assertIs(PredContainsVal(100.0).mask(view), view.value_mask(PredContainsVal(100).keys))
+		self.assertEqual(view.substr_mask("et_").tolist(), [True, True, False, True])
+
+		q = Unite(Gather(Table(0), [1, 2]), 0, 3)
+		output = [{ "x": "Bucket C_True", "y": 125 }]
+		pred, trimmed_inputs = provenance_analysis(q.to_dict(), output, inputs)
+		self.assertEqual(trimmed_inputs[0], [inputs[0][2]])
+		self.assertEqual(trimmed_inputs[0], trim_records_by_check(pred, inputs[0]))
+
+	def test_value_match(self):
+		def original_check(val, row):
+			# the value check before values are compared by keys
+			return val in row or any([str(val) == str(v) for v in row])
+
+		values = [1, 1.0, True, False, 0, "1", "1.0", 2.5, "2.50", float("nan"), np.nan, "nan", None, "None",
+				  0.1234567, 0.123457, 1000, "1e3", "Bucket_E", "bucket_e", [1, 2], "[1, 2]"]
+		for val in values:
+			for v in values:
+				# every match of the original check is kept
+				if original_check(val, [v]):
+					self.assertTrue(PredContainsVal(val).check([v]), (val, v))
+
+		# matches that differ from the original check
+		new_matches = [(1.0, "1"), (2.5, "2.50"), (0.1234567, 0.123457), (1000, "1e3")]
+		for val, v in new_matches:
+			self.assertFalse(original_check(val, [v]))
+			self.assertTrue(PredContainsVal(val).check([v]))
+			self.assertTrue(PredContainsVal(v).check([val]))
+		for val, v in [(1, 2), ("Bucket_E", "bucket_e"), (None, 0), (False, 0.1), ("nan", 1)]:
+			self.assertFalse(PredContainsVal(val).check([v]), (val, v))
+
+		# the check does not depend on the value interner of the session
+		with value_interner_scope():
+			self.assertEqual(PredContainsVal(1).keys, value_keys([1.0]))
+
+	def test_simplify(self):
+		a, b, c = PredContainsVal("a"), PredContainsVal("b"), PredContainsVal("c")
+
+		pred = simplify(PredDisj([PredConj([a, b]), PredConj([PredContainsVal("a"), b, PredTrue()]), PredDisj([PredConj([a, b, c])])]))
+		self.assertEqual(pred.print_str(multi_line=False), "Conjunction[ a, b ]")
+		# shared leaves are factored out
+		pred = simplify(PredDisj([PredConj([a, b]), PredConj([a, c])]))
+		self.assertEqual(pred.key, PredConj([a, PredDisj([b, c])]).key)
+		self.assertIsInstance(simplify(PredDisj([a, PredConj([b, PredTrue()]), PredTrue()])), PredTrue)
+		self.assertIsInstance(simplify(PredConj([PredTrue()])), PredTrue)
+		# 1 and 1.0 (and "1") are the same constraint
+		self.assertEqual(len(simplify(PredDisj([PredContainsVal(1), PredContainsVal(1.0), PredContainsVal("1"), a])).preds), 2)
+
+		# equal sub-predicates are shared
+		consed = {}
+		p1 = simplify(PredConj([PredDisj([a, b]), c]), consed)
+		p2 = simplify(PredConj([PredDisj([b, a]), PredContainsVal("d")]), consed)
+		self.assertIs(p1.preds[0], p2.preds[0])
+
+		inputs = [[{"x": "a", "y": "b"}, {"x": "a", "y": "c"}, {"x": "b", "y": "c"}, {"x": "1", "y": "d"}]]
+		for pred in [PredDisj([PredConj([a, b]), PredConj([a, c]), PredContainsVal(1)]), PredConj([PredDisj([a, b]), PredDisj([a, c])])]:
+			self.assertEqual(trim_records(simplify(pred), inputs[0]), trim_records_by_check(pred, inputs[0]))
+
+	def test_trie(self):
+		inputs = [[
+			{ "Bucket": "Bucket_E", "Budgeted": 100, "Actual": 115 },
+			{ "Bucket": "Bucket_D", "Budgeted": 100, "Actual": 90 },
+			{ "Bucket": "Bucket_C", "Budgeted": 125, "Actual": 115 }
+		]]
+		output = [{"x": "Actual", "y": 115, "column": "Bucket_E"}, {"x": "Budgeted", "y": 100, "column": "Bucket_D"}]
+
+		trie = ProvenanceTrie(inputs, output)
+		programs = [Gather(Table(0), [1, 2]), Gather(Table(0), [HOLE, HOLE]), Unite(Gather(Table(0), [1, 2]), 0, 1), 
+					Unite(Separate(Table(0), 0), 0, 1), Table(0)]
+		for q in programs:
+			pred, trimmed_inputs = trie.analyze(q.to_dict())
+			expected_pred, expected_trimmed = provenance_analysis(q.to_dict(), output, inputs)
+			self.assertEqual(pred.key, expected_pred.key)
+			self.assertEqual(trimmed_inputs, expected_trimmed)
+		# the second gather sketch shares the result of the first one
+		self.assertEqual(trie.stats(), {"hits": 1, "misses": 4})
+		self.assertIs(trie.analyze(programs[1].to_dict())[1], trie.analyze(programs[0].to_dict())[1])
+		self.assertTrue(trie.matches(inputs, output))
+		self.assertFalse(trie.matches(inputs, list(output)))
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,49 @@
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from falx.table.language import *
+from falx.table.split_index import ColumnSplitIndex, TableSplitIndex, split_column
+
+
+class TestSplitIndex(unittest.TestCase):
+
+	def test_column_index(self):
+		s = pd.Series(["a-b", "c_d e", "a-b", "f/g"])
+		index = ColumnSplitIndex(s)
+		self.assertEqual(index.uniques, ["a-b", "c_d e", "f/g"])
+		self.assertEqual(index.splits, [(1, 2), (1, 2), (1, 2)])
+		self.assertFalse(index.contains["-"])
+		self.assertFalse(index.contains_separator())
+		self.assertTrue(ColumnSplitIndex(pd.Series(["a b", "c d-e"])).contains_separator())
+
+	def test_split_column(self):
+		for values in [["a-b", "c_d e", "a-b", "fg"], ["a\tb", "c//d", "-e"], ["a-b", None, "c d"], ["a-b", 1, np.nan]]:
+			s = pd.Series(values)
+			expected = s.str.split(r"\s|_|-|/", n=1, expand=True)
+			first, second = split_column(s)
+			self.assertEqual(first.tolist(), expected[0].tolist())
+			self.assertEqual(second.isna().tolist(), expected[1].isna().tolist())
+			self.assertEqual(second.dropna().tolist(), expected[1].dropna().tolist())
+
+		# no value is split
+		with self.assertRaises(KeyError):
+			split_column(pd.Series(["a", "b"]))
+
+	def test_operators(self):
+		inputs = [[{"a": "x-1", "b": "y z", "c": 1}, {"a": "x-2", "b": "y", "c": 2}]]
+		self.assertEqual(Separate(Table(0), HOLE).infer_domain(1, inputs, {}), [0])
+		ret = Separate(Table(0), 0).eval(inputs)
+		self.assertEqual(ret.iloc[:, -2].tolist(), ["x", "x"])
+		self.assertEqual(ret.iloc[:, -1].tolist(), ["1", "2"])
+		ret = Unite(Table(0), 2, 0, "_").eval(inputs)
+		self.assertEqual(ret.iloc[:, -1].tolist(), ["1_x-1", "2_x-2"])
+
+		df = pd.DataFrame.from_records(inputs[0])
+		index = TableSplitIndex(df)
+		self.assertTrue(Unite(Table(0), 0, 1).transform(df, index).equals(Unite(Table(0), 0, 1).transform(df)))
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,91 @@
+import threading
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from falx.table.language import *
+from falx.table.sqlite_backend import SQLiteSession, UnsupportedProgram, eval_sqlite, get_session
+
+
+class TestSQLiteBackend(unittest.TestCase):
+
+	def setUp(self):
+		self.inputs = [[
+			{"region": "north-east", "year": 2018, "q1": 1.5, "q2": 2, "flag": True},
+			{"region": "south_west", "year": 2018, "q1": 0.5, "q2": 3, "flag": False},
+			{"region": "north-east", "year": 2019, "q1": 2.0, "q2": 1, "flag": True},
+			{"region": "south_west", "year": 2019, "q1": None, "q2": 4, "flag": True}]]
+
+	def assert_same(self, p, inputs):
+		expected = p.eval(inputs)
+		ret = SQLiteSession(inputs).eval(p)
+		pd.testing.assert_frame_equal(expected.reset_index(drop=True), ret, check_names=False)
+
+	def test_operators(self):
+		programs = [
+			Select(Table(0), [1, 0]),
+			Unite(Table(0), 0, 2),
+			Unite(Table(0), 4, 1),
+			Filter(Table(0), 1, "==", 2019),
+			Filter(Table(0), 0, "!=", "north-east"),
+			Separate(Table(0), 0),
+			Spread(Select(Table(0), [0, 1, 3]), 1, 2),
+			Spread(Select(Table(0), [0, 1, 2]), 0, 2),
+			Gather(Table(0), [2, 3]),
+			GroupSummary(Table(0), [0], 2, "mean"),
+			GroupSummary(Table(0), [1, 4], 3, "sum"),
+			GroupSummary(Table(0), [0], 2, "count"),
+			GroupSummary(Table(0), [0], 2, "cumsum"),
+			CumSum(Table(0), 2),
+			Mutate(Table(0), 2, "+", 3),
+			Mutate(Table(0), 1, "-", 3),
+			MutateCustom(Table(0), 0, "==", "north-east"),
+			GroupSummary(Gather(Separate(Table(0), 0), [1, 2]), [2], 5, "sum"),
+		]
+		for p in programs:
+			self.assert_same(p, self.inputs)
+
+	def test_unsupported(self):
+		session = SQLiteSession(self.inputs)
+		# pandas fails on duplicate entries
+		with self.assertRaises(UnsupportedProgram):
+			session.eval(Spread(Select(Table(0), [0, 4, 2]), 0, 2))
+		# only columns of strings are separated
+		with self.assertRaises(UnsupportedProgram):
+			session.eval(Separate(Table(0), 2))
+
+		inputs = [[{"a": "x", "b": [1, 2]}]]
+		with self.assertRaises(UnsupportedProgram):
+			SQLiteSession(inputs).eval(Select(Table(0), [0]))
+		# fall back to pandas
+		with self.assertLogs("sqlite_backend", level="DEBUG") as logs:
+			self.assertEqual(eval_sqlite(Select(Table(0), [0]), inputs).to_dict(orient="records"), [{"a": "x"}])
+		self.assertIn("evaluated by pandas", logs.output[0])
+
+	def test_session(self):
+		session = get_session(self.inputs)
+		self.assertIs(get_session(self.inputs), session)
+		eval_sqlite(Gather(Table(0), [2, 3]), self.inputs)
+		eval_sqlite(Select(Gather(Table(0), [2, 3]), [0, 4]), self.inputs)
+		# the shared subprogram is materialized once
+		self.assertEqual(len(session.relations), 2)
+
+		# each thread has its own session (connections cannot be used by other threads)
+		results = []
+		def run():
+			with self.assertRaises(AssertionError):
+				# nothing falls back to pandas
+				with self.assertLogs("sqlite_backend", level="DEBUG"):
+					results.append(eval_sqlite(Gather(Table(0), [2, 3]), self.inputs))
+			results.append(get_session(self.inputs))
+		thread = threading.Thread(target=run)
+		thread.start()
+		thread.join()
+		self.assertIsNot(results[1], session)
+		self.assertTrue(results[0].equals(eval_sqlite(Gather(Table(0), [2, 3]), self.inputs)))
+		self.assertIs(get_session(self.inputs), session)
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -2,9 +2,11 @@ import unittest
 
 from falx.table.language import *
 from falx.table.synthesizer import *
+from falx.utils.synth_utils import check_table_inclusion, ValueInterner, value_interner, value_interner_scope
 import os
 
 import time
+import threading
 
 class TestSynthesizer(unittest.TestCase):
 
@@ -428,5 +430,373 @@ class TestSynthesizer(unittest.TestCase):
 		# 	print(p.stmt_string())
 		# 	print(p.eval(inputs))
 
+	def test_observational_equivalence(self):
+		# unite(T, 0, 1) and unite(T, 1, 0) produce the same table since column A and B are identical
+		inputs = [[
+			{"A": "x", "B": "x", "C": 1, "D": 2},
+			{"A": "y", "B": "y", "C": 3, "D": 4}]]
+
+		output = [
+			{"k": "C", "v": 1, "id": "x_x"},
+			{"k": "D", "v": 4, "id": "y_y"}]
+
+		sketch = Gather(Unite(Table(0), HOLE, HOLE), HOLE)
+		out_df = pd.DataFrame.from_dict(output)
+		premise_chains = abstract_eval.backward_eval(sketch.to_dict(), out_df)
+
+		equiv_table = {}
+		programs = Synthesizer().iteratively_instantiate_with_premises_check(
+						sketch, inputs, premise_chains, inputs, 100, equiv_table)
+
+		self.assertTrue(len(equiv_table) > 0)
+		# no two programs should be completions of observationally equivalent partial programs
+		results = [table_fingerprint(p.eval(inputs)) for p in programs]
+		self.assertEqual(len(results), len(set(results)))
+		self.assertTrue(any([p.eval(inputs).shape == (4, 3) for p in programs]))
+
+	def test_shared_equivalence_table(self):
+		inputs = [[
+			{"A": "x", "B": "x", "C": 1, "D": 2},
+			{"A": "y", "B": "y", "C": 3, "D": 4}]]
+		trimmed_inputs = [inputs[0][:1]]
+		synthesizer = Synthesizer()
+
+		def check(node, equiv_table, inputs=inputs):
+			p = Program.from_node(node)
+			subquery_res = p.get([0]).to_node().eval(trimmed_inputs)
+			return synthesizer.is_observationally_redundant(p, [0], subquery_res, inputs, equiv_table)
+
+		equiv_table = {}
+		# the first result is recorded without evaluating it on full inputs
+		self.assertFalse(check(Gather(Select(Table(0), (0, 1, 2, 3)), HOLE), equiv_table, inputs=None))
+		# programs of another sketch in the same context are compared with it
+		self.assertTrue(check(Gather(Table(0), HOLE), equiv_table))
+		# the same result on trimmed inputs, but not on full inputs
+		self.assertFalse(check(Gather(Filter(Table(0), 0, "==", "x"), HOLE), equiv_table))
+		self.assertFalse(check(Gather(Filter(Table(0), 0, "!=", "z"), HOLE), equiv_table))
+		self.assertTrue(check(Gather(Filter(Table(0), 1, "==", "x"), HOLE), equiv_table))
+		# the same result in a different context
+		self.assertFalse(check(Unite(Table(0), HOLE, HOLE), equiv_table))
+		self.assertEqual(len(equiv_table), 3)
+
+	def test_parallel_synthesis(self):
+		inputs = [[
+			{ "Bucket": "Bucket_E", "Budgeted": 100, "Actual": 115 },
+			{ "Bucket": "Bucket_D", "Budgeted": 100, "Actual": 90 },
+			{ "Bucket": "Bucket_C", "Budgeted": 125, "Actual": 115 }]]
+
+		output = [
+			{ "x": "Actual", "y": 115, "column": "Bucket_E"},
+			{ "x": "Budgeted","y": 100, "column": "Bucket_D"}]
+
+		sequential = Synthesizer().enumerative_synthesis(inputs, output, 2, time_limit_sec=60)
+		parallel = Synthesizer().enumerative_synthesis(inputs, output, 2, time_limit_sec=60, num_workers=2)
+		self.assertEqual(sorted([p.stmt_string() for p in sequential]), sorted([p.stmt_string() for p in parallel]))
+		self.assertTrue(len(parallel) > 0)
+
+		limited = Synthesizer().enumerative_synthesis(inputs, output, 2, time_limit_sec=60, solution_limit=1, num_workers=2)
+		self.assertEqual(len(limited), 1)
+
+	def test_deadline(self):
+		inputs = [[
+		   {"product":"Product1_2011","Q4":3,"Q3":5,"Q2":5,"Q1":10},
+		   {"product":"Product2_2011","Q4":5,"Q3":7,"Q2":5,"Q1":2},
+		   {"product":"Product3_2011","Q4":3,"Q3":9,"Q2":10,"Q1":7},
+		   {"product":"Product4_2011","Q4":3,"Q3":2,"Q2":8,"Q1":1},
+		   {"product":"Product5_2011","Q4":1,"Q3":7,"Q2":1,"Q1":6},
+		   {"product":"Product1_2012","Q4":3,"Q3":3,"Q2":6,"Q1":4},
+		   {"product":"Product2_2012","Q4":4,"Q3":3,"Q2":6,"Q1":4},
+		   {"product":"Product3_2012","Q4":3,"Q3":6,"Q2":6,"Q1":4},
+		   {"product":"Product4_2012","Q4":4,"Q3":10,"Q2":6,"Q1":1},
+		   {"product":"Product5_2012","Q4":8,"Q3":5,"Q2":4,"Q1":7}
+		]]
+
+		output = [
+			{'c_x': 'Q1', 'c_y': 'Product3', 'c_color': 7, 'c_column': '2011'}, 
+			{'c_x': 'Q2', 'c_y': 'Product4', 'c_color': 8, 'c_column': '2011'}, 
+			{'c_x': 'Q2', 'c_y': 'Product5', 'c_color': 1, 'c_column': '2011'}]
+
+		start_time = time.time()
+		candidates = Synthesizer().enumerative_synthesis(inputs, output, 3, time_limit_sec=1)
+		self.assertTrue(time.time() - start_time < 2)
+
+		deadline = Deadline(0)
+		time.sleep(0.01)
+		self.assertRaises(SynthesisTimeout, deadline.check)
+		self.assertFalse(Deadline(None).expired())
+		self.assertTrue(Deadline(None, is_cancelled=lambda: True).expired())
+
+	def test_iter_synthesis(self):
+		inputs = [[
+			{ "Bucket": "Bucket_E", "Budgeted": 100, "Actual": 115 },
+			{ "Bucket": "Bucket_D", "Budgeted": 100, "Actual": 90 },
+			{ "Bucket": "Bucket_C", "Budgeted": 125, "Actual": 115 }]]
+
+		output = [
+			{ "x": "Actual", "y": 115, "column": "Bucket_E"},
+			{ "x": "Budgeted","y": 100, "column": "Bucket_D"}]
+
+		candidates = Synthesizer().enumerative_synthesis(inputs, output, 2, time_limit_sec=60)
+		
+		# stop after the first program
+		first = next(Synthesizer().iter_synthesis(inputs, output, 2, time_limit_sec=60))
+		self.assertEqual(first.stmt_string(), candidates[0].stmt_string())
+
+		streamed = list(Synthesizer().iter_synthesis(inputs, output, 2, time_limit_sec=60))
+		self.assertEqual([p.stmt_string() for p in streamed], [p.stmt_string() for p in candidates])
+
+	def test_best_first_synthesis(self):
+		inputs = [[
+			{ "Bucket": "Bucket_E", "Budgeted": 100, "Actual": 115 },
+			{ "Bucket": "Bucket_D", "Budgeted": 100, "Actual": 90 },
+			{ "Bucket": "Bucket_C", "Budgeted": 125, "Actual": 115 }]]
+
+		output = [
+			{ "x": "Actual", "y": 115, "column": "Bucket_E"},
+			{ "x": "Budgeted","y": 100, "column": "Bucket_D"}]
+
+		candidates = Synthesizer().enumerative_synthesis(inputs, output, 2, time_limit_sec=60)
+		best_first = Synthesizer().best_first_synthesis(inputs, output, 2, time_limit_sec=60)
+		# the same programs are found, possibly in a different order
+		self.assertEqual(sorted([p.stmt_string() for p in best_first]), sorted([p.stmt_string() for p in candidates]))
+
+		# a cost model that prefers deeper programs finds them first
+		deep_first = Synthesizer().best_first_synthesis(inputs, output, 3, time_limit_sec=60, 
+							solution_limit=1, cost_model=lambda p, context: -p.depth)
+		self.assertEqual(len(deep_first), 1)
+		self.assertEqual(Program.from_node(deep_first[0]).depth, 3)
+
+	def test_interleaved_synthesis(self):
+		inputs = [[
+			{ "Bucket": "Bucket_E", "Budgeted": 100, "Actual": 115 },
+			{ "Bucket": "Bucket_D", "Budgeted": 100, "Actual": 90 },
+			{ "Bucket": "Bucket_C", "Budgeted": 125, "Actual": 115 }]]
+		tasks = [
+			(inputs, [{ "x": "Actual", "y": 115, "column": "Bucket_E"}, { "x": "Budgeted","y": 100, "column": "Bucket_D"}]),
+			(inputs, [{ "a": "Bucket_E", "b": 115 }, { "a": "Bucket_C", "b": 115 }])]
+
+		def run(task):
+			return [p.stmt_string() for p in Synthesizer().iter_best_first_synthesis(task[0], task[1], 2, time_limit_sec=60)]
+
+		expected = [run(task) for task in tasks]
+		self.assertTrue(all(len(programs) > 0 for programs in expected))
+
+		# two searches stepped alternately in the same thread
+		searches = [Synthesizer().iter_best_first_synthesis(task[0], task[1], 2, time_limit_sec=60) for task in tasks]
+		results = [[], []]
+		active = [0, 1]
+		while len(active) > 0:
+			for i in list(active):
+				p = next(searches[i], None)
+				if p is None:
+					active.remove(i)
+				else:
+					results[i].append(p.stmt_string())
+		self.assertEqual(results, expected)
+
+		# two searches running in different threads
+		results = [None, None]
+		def run_in_thread(i):
+			results[i] = run(tasks[i])
+		threads = [threading.Thread(target=run_in_thread, args=(i,)) for i in range(2)]
+		for thread in threads:
+			thread.start()
+		for thread in threads:
+			thread.join()
+		self.assertEqual(results, expected)
+
+	def test_shape_pruning(self):
+		inputs = [[
+			{ "Bucket": "Bucket_E", "Budgeted": 100, "Actual": 115 },
+			{ "Bucket": "Bucket_D", "Budgeted": 100, "Actual": 90 },
+			{ "Bucket": "Bucket_C", "Budgeted": 125, "Actual": 115 }]]
+
+		output = [
+			{ "a": "Bucket_E", "b": 100, "c": 115, "d": "E"},
+			{ "a": "Bucket_D", "b": 100, "c": 90, "d": "D"}]
+
+		synthesizer = Synthesizer()
+		# selecting columns cannot produce 4 columns, separate can
+		self.assertEqual(synthesizer.analyze_sketch(Select(Table(0), HOLE), inputs, output, True), None)
+		self.assertNotEqual(synthesizer.analyze_sketch(Separate(Table(0), HOLE), inputs, output, True), None)
+
+		# the selected columns are known after instantiation
+		self.assertFalse(synthesizer.check_shape(Separate(Select(Table(0), (0, 1)), HOLE), inputs, (4, 2)))
+		self.assertTrue(synthesizer.check_shape(Separate(Select(Table(0), (0, 1, 2)), HOLE), inputs, (4, 2)))
+
+	def test_value_interner(self):
+		interner = ValueInterner()
+		self.assertEqual(interner.intern(115), interner.intern(115.0))
+		self.assertEqual(interner.intern(115), interner.intern("115"))
+		self.assertEqual(interner.intern(0.1234567), interner.intern(0.123457))
+		self.assertNotEqual(interner.intern("Bucket_E"), interner.intern("Bucket_D"))
+		self.assertEqual(interner.intern(float("nan")), interner.intern(np.nan))
+		self.assertEqual(interner.intern_values([1, 2.5, 1]), 
+						 [interner.intern(1), interner.intern(2.5), interner.intern(1)])
+		self.assertEqual(interner.value(interner.intern("2.50")), 2.5)
+		self.assertEqual(len(interner), 7)
+
+	def test_value_interner_scope(self):
+		# each session (and each thread) has its own interner
+		outer = value_interner()
+		with value_interner_scope() as interner:
+			self.assertIs(value_interner(), interner)
+			self.assertIsNot(interner, outer)
+			interners = []
+			thread = threading.Thread(target=lambda: interners.append(value_interner()))
+			thread.start()
+			thread.join()
+			self.assertIsNot(interners[0], interner)
+		self.assertIs(value_interner(), outer)
+
+	def test_premise_index(self):
+		table = [
+			{ "Bucket": "Bucket_E", "Budgeted": 100, "Actual": 115 },
+			{ "Bucket": "Bucket_D", "Budgeted": 100, "Actual": 90 },
+			{ "Bucket": "Bucket_C", "Budgeted": 125, "Actual": 115 }]
+		premises = [
+			[{ "x": 115.0, "y": "Bucket_E" }],
+			[{ "x": 100, "y": 90 }],
+			[{ "x": 100, "y": 116 }],
+			[]]
+		table_index = build_column_index(table)
+		for premise in premises:
+			self.assertEqual(check_index_inclusion(build_column_index(premise), table_index),
+							 check_table_inclusion(premise, table))
+
+		sketch = Gather(Table(0), HOLE)
+		premise_chains = abstract_eval.backward_eval(sketch.to_dict(), pd.DataFrame.from_dict(premises[0]))
+		compiled = Synthesizer().compile_premises(premise_chains)
+		self.assertEqual(len(list(compiled.iter_indexes(0))), len(premise_chains))
+		self.assertEqual(len(list(compiled.iter_indexes(1))), len(premise_chains))
+		self.assertEqual(list(compiled.iter_indexes(2)), [])
+
+	def test_lazy_premises(self):
+		inputs = [[
+			{ "Bucket": "Bucket_E", "Budgeted": 100, "Actual": 115 },
+			{ "Bucket": "Bucket_D", "Budgeted": 100, "Actual": 90 }]]
+		output = [
+			{ "x": "Actual", "y": 115, "column": "Bucket_E"},
+			{ "x": "Actual", "y": 90, "column": "Bucket_D"}]
+		sketch = Select(Gather(Table(0), HOLE), HOLE)
+		config = copy.copy(Synthesizer().config)
+		config["param_deduction"] = "off"
+
+		# premise chains are generated until a premise at the level of the check is satisfied
+		synthesizer = Synthesizer(config)
+		chains = synthesizer.premise_chains(sketch.to_dict(), output)
+		programs = synthesizer.explore_sketch(sketch, inputs, output)
+		self.assertEqual(len(chains.items), 1)
+
+		# the same programs are found with all chains
+		all_chains = abstract_eval.backward_eval(sketch.to_dict(), pd.DataFrame.from_dict(output))
+		self.assertEqual(len(all_chains), 4)
+		programs_with_all_chains = Synthesizer(config).iteratively_instantiate_with_premises_check(
+			sketch, inputs, all_chains, inputs, output_dims=table_dims(output))
+		self.assertEqual([p.stmt_string() for p in programs], [p.stmt_string() for p in programs_with_all_chains])
+
+	def test_premise_cache(self):
+		output = [
+			{ "x": "Actual", "y": 115, "column": "Bucket_E"},
+			{ "x": "Actual", "y": 90, "column": "Bucket_D"}]
+		out_df = pd.DataFrame.from_dict(output)
+
+		# premises that only differ in row order are the same
+		self.assertEqual(abstract_eval.premise_key(out_df), abstract_eval.premise_key(out_df.iloc[::-1]))
+		self.assertNotEqual(abstract_eval.premise_key(pd.DataFrame({"a": [1]})), abstract_eval.premise_key(pd.DataFrame({"a": [True]})))
+
+		cache = abstract_eval.PremiseCache()
+		sketch = Unite(Gather(Table(0), HOLE), HOLE, HOLE)
+		chains = cache.chains(sketch.to_dict(), out_df)
+		self.assertEqual(len(chains), len(abstract_eval.backward_eval(sketch.to_dict(), out_df)))
+		self.assertEqual(len(set([tuple([abstract_eval.premise_key(pm[0]) for pm in c]) for c in chains])), len(chains))
+
+		# sketches with the same operators share chains, and the unite step is shared with other sketches
+		self.assertIs(cache.chains(Unite(Gather(Table(0), [1, 2]), 0, 1).to_dict(), out_df), chains)
+		len(cache.chains(Unite(Spread(Table(0), HOLE, HOLE), HOLE, HOLE).to_dict(), out_df.copy()))
+		self.assertEqual(len([k for k in cache.steps if k[1] == "unite"]), 1)
+
+		synthesizer = Synthesizer()
+		self.assertIs(synthesizer.premise_chains(sketch.to_dict(), output), synthesizer.premise_chains(sketch.to_dict(), output))
+
+	def test_param_deduction(self):
+		inputs = [[
+			{ "Bucket": "Bucket_E", "Budgeted": 100, "Actual": 115 },
+			{ "Bucket": "Bucket_D", "Budgeted": 100, "Actual": 90 },
+			{ "Bucket": "Bucket_C", "Budgeted": 125, "Actual": 115 }]]
+		in_df = Table(0).eval(inputs)
+
+		out_df = pd.DataFrame.from_dict([{ "x": "Actual", "y": 115, "column": "Bucket_E"}])
+		domain = [(0,), (1,), (2,), (0, 1), (0, 2), (1, 2), (0, 1, 2)]
+		self.assertEqual(abstract_eval.infer_args_one_step("gather", 1, (HOLE,), domain, in_df, [out_df]), 
+						 [(2,), (0, 2), (1, 2), (0, 1, 2)])
+
+		out_df = pd.DataFrame.from_dict([{ "x": "Bucket_E_115"}])
+		self.assertEqual(abstract_eval.infer_args_one_step("unite", 1, (HOLE, HOLE), [0, 1, 2], in_df, [out_df]), [0])
+		self.assertEqual(abstract_eval.infer_args_one_step("unite", 2, (0, HOLE), [1, 2], in_df, [out_df]), [2])
+
+		out_df = pd.DataFrame.from_dict([{ "x": "Bucket_D", "y": -10 }])
+		self.assertEqual(abstract_eval.infer_args_one_step("mutate", 1, (HOLE, HOLE, HOLE), [1, 2], in_df, [out_df]), [2])
+		self.assertEqual(abstract_eval.infer_args_one_step("mutate", 3, (2, "-", HOLE), [1], in_df, [out_df]), [1])
+		self.assertEqual(abstract_eval.infer_args_one_step("filter", 1, (HOLE,), [0, 1], in_df, [out_df]), None)
+
+		# deduced values are generated first, followed by the rest of the (lazily generated) domain
+		quarters = [[{ "Bucket": "E", "Q1": 100, "Q2": 115, "Q3": 120, "Q4": 130 }]]
+		sketch = Gather(Table(0), HOLE)
+		premises = Synthesizer().compile_premises(
+			abstract_eval.backward_eval(sketch.to_dict(), pd.DataFrame.from_dict([{ "x": "Q3", "y": 120 }])))
+		domain = Synthesizer().iter_domain(Program.from_node(sketch), [1], quarters, premises=premises)
+		self.assertEqual(list(domain), [(1, 2, 3, 4), (2, 3), (3, 4), (1, 2, 3), (2, 3, 4), (1, 2)])
+		self.assertEqual(list(Synthesizer().iter_domain(Program.from_node(sketch), [1], quarters, premises=premises)), 
+						 Synthesizer().infer_domain(Program.from_node(sketch), [1], quarters, premises=premises))
+
+		output = [
+			{ "x": "Actual", "y": 115, "column": "Bucket_E"},
+			{ "x": "Budgeted","y": 100, "column": "Bucket_D"}]
+		config = copy.copy(Synthesizer().config)
+		config["param_deduction"] = "restrict"
+		candidates = Synthesizer(config).enumerative_synthesis(inputs, output, 1, time_limit_sec=60)
+		self.assertEqual([p.stmt_string() for p in candidates], ["t0 <- table_ref(0); t1 <- gather(t0, (1, 2))"])
+
+	def test_sample_verification(self):
+		inputs = [[{ "Bucket": "Bucket_{}".format(i), "Budgeted": 100 + i, "Actual": 200 + i } for i in range(10)]]
+		output = [
+			{ "x": "Actual", "y": 201, "column": "Bucket_1"},
+			{ "x": "Budgeted","y": 103, "column": "Bucket_3"}]
+
+		synthesizer = Synthesizer()
+		sample = synthesizer.sample_inputs(Gather(Table(0), [1, 2]), inputs, output)
+		self.assertEqual(list(sample[0].index), [1, 3])
+
+		self.assertTrue(synthesizer.verify_program(Gather(Table(0), [1, 2]), inputs, output))
+		self.assertFalse(synthesizer.verify_program(Gather(Table(0), [0, 2]), inputs, output))
+		self.assertEqual(synthesizer.verify_stats, 
+			{"candidates": 2, "sample_accepted": 1, "sample_rejected": 1, "full_rejected": 0})
+
+		# filter exposes row labels, it is only checked on the full inputs
+		self.assertIsNone(synthesizer.sample_inputs(Filter(Table(0), 1, "==", 103), inputs, output))
+		self.assertFalse(synthesizer.verify_program(Filter(Table(0), 1, "==", 103), inputs, output))
+		self.assertEqual(synthesizer.verify_stats["full_rejected"], 1)
+
+		# the sample keeps rows of derived values (whose values are not in the output)
+		output = [{ "column": "Bucket_2", "total": "304" }, { "column": "Bucket_5", "total": 310 }]
+		sample = synthesizer.sample_inputs(Mutate(Table(0), 1, "+", 2), inputs, output)
+		self.assertEqual(list(sample[0].index), [2, 5])
+		self.assertTrue(synthesizer.verify_program(Mutate(Table(0), 1, "+", 2), inputs, output))
+		self.assertFalse(synthesizer.verify_program(Mutate(Table(0), 2, "-", 1), inputs, output))
+		self.assertEqual(synthesizer.verify_stats["sample_rejected"], 2)
+
+		# samples are not used without provenance analysis (or for unite, which may separate values differently)
+		self.assertIsNone(synthesizer.sample_inputs(Unite(Table(0), 0, 1), inputs, output))
+		inputs = [[{ "B": "Bucket_{}".format(c), "A": 100 + i } for i, c in enumerate("ABCDEFGH")]]
+		output = [{ "x": "Bucket_E_104" }]
+		# statistics are logged (search traces are only logged at the debug level)
+		with self.assertLogs("synthesizer", level="INFO") as logs:
+			candidates = Synthesizer().enumerative_synthesis(inputs, output, 1, time_limit_sec=60, disable_provenance_analysis=True)
+		self.assertEqual(len(logs.output), 1)
+		self.assertIn("[verification]", logs.output[0])
+		self.assertIn("t0 <- table_ref(0); t1 <- unite(t0, 0, 1)", [p.stmt_string() for p in candidates])
+		self.assertTrue(synthesizer.verify_program(Unite(Table(0), 0, 1), inputs, output))
+
 if __name__ == '__main__':
 	unittest.main()
\ No newline at end of file
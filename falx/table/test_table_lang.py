@@ -1,6 +1,7 @@
 import unittest
 
 from falx.table.language import *
+import threading
 import os
 
 test_data = [{"Totals":7,"Value":"A","variable":"alpha","value":2,"cumsum":2},
@@ -125,5 +126,90 @@ class TestTableLang(unittest.TestCase):
         print(q.stmt_string())
         print(q.eval(inputs={0: pd.DataFrame.from_dict(table_data_2)}))
 
+    def test_eval_cache(self):
+        cache = EvalCache(maxsize=2)
+        q = Table(data_id=0)
+        cache.get_or_eval(q, inputs, lambda: q.eval(inputs))
+        cache.get_or_eval(Table(data_id=0), inputs, lambda: q.eval(inputs))
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+        # the same program evaluated on a different input set is a miss
+        cache.get_or_eval(q, {0: inputs[0]}, lambda: q.eval(inputs))
+        self.assertEqual((cache.hits, cache.misses), (1, 2))
+
+        # the least recently used entry is evicted
+        cache.get_or_eval(Gather(q, [1, 2]), inputs, lambda: None)
+        self.assertEqual(cache.stats()["size"], 2)
+        cache.get_or_eval(q, inputs, lambda: q.eval(inputs))
+        self.assertEqual(cache.misses, 4)
+
+    def test_eval_cache_shared_prefix(self):
+        EVAL_CACHE.clear()
+        q1 = Gather(Table(data_id=0), [1, 2])
+        q2 = Unite(Gather(Table(data_id=0), [1, 2]), 0, 1)
+        t1 = q1.eval(inputs)
+        t2 = q2.eval(inputs)
+        self.assertEqual(EVAL_CACHE.hits, 1)
+        self.assertEqual(len(t1), len(t2))
+
+    def test_eval_cache_scope(self):
+        q = Gather(Table(data_id=0), [1, 2])
+        q.eval(inputs)
+        size = EVAL_CACHE.stats()["size"]
+        with eval_cache_scope():
+            # the session starts with an empty cache
+            self.assertEqual(EVAL_CACHE.stats()["size"], 0)
+            q.eval(inputs)
+            self.assertEqual(EVAL_CACHE.misses, 2)
+            # other threads have their own caches
+            sizes = []
+            thread = threading.Thread(target=lambda: sizes.append(EVAL_CACHE.stats()["size"]))
+            thread.start()
+            thread.join()
+            self.assertEqual(sizes, [0])
+        self.assertEqual(EVAL_CACHE.stats()["size"], size)
+
+    def test_infer_shape(self):
+        progs = [
+            Select(Table(data_id=0), [0, 2]),
+            Unite(Table(data_id=0), 1, 2),
+            Filter(Table(data_id=0), 1, "==", "A"),
+            Separate(Unite(Table(data_id=0), 1, 2), 3),
+            Spread(Select(Table(data_id=0), [1, 2, 3]), 1, 2),
+            Gather(Table(data_id=0), [3, 4]),
+            GroupSummary(Table(data_id=0), [1], 3, "sum"),
+            CumSum(Table(data_id=0), 3),
+            Mutate(Table(data_id=0), 0, "+", 3),
+            MutateCustom(Table(data_id=0), 1, "==", "A"),
+        ]
+        for p in progs:
+            shape = p.infer_shape(inputs)
+            df = p.eval(inputs)
+            self.assertTrue(shape.num_cols[0] <= len(df.columns) <= shape.num_cols[1])
+            self.assertTrue(shape.num_rows[0] <= len(df) <= shape.num_rows[1])
+
+        # abstract programs over-approximate all their instantiations
+        shape = Gather(Select(Table(data_id=0), HOLE), HOLE).infer_shape(inputs)
+        self.assertEqual(shape.num_cols, (2, 6))
+        self.assertEqual(shape.num_rows, (len(test_data), len(test_data) * 5))
+        self.assertFalse(shape.may_contain(7, 1))
+        self.assertFalse(Select(Table(data_id=0), HOLE).infer_shape(inputs).may_contain(2, len(test_data) + 1))
+
+        # columns of spread are unknown without evaluation, rows are merged
+        shape = Spread(Select(Table(data_id=0), HOLE), HOLE, HOLE).infer_shape(inputs)
+        self.assertEqual(shape.num_cols, (0, UNBOUNDED))
+        self.assertEqual(shape.num_rows, (1, len(test_data)))
+        self.assertTrue(shape.may_contain(100, len(test_data)))
+        self.assertFalse(shape.may_contain(2, len(test_data) + 1))
+        shape = Gather(Spread(Table(data_id=0), HOLE, HOLE), HOLE).infer_shape(inputs)
+        self.assertTrue(shape.may_contain(100, len(test_data) * 100))
+
+    def test_extract_record_schema(self):
+        records = [{"a": 1, "b": "x", "c": True, "d": 1.5, "e": None}, 
+                   {"a": 2, "b": 3, "c": False, "d": None, "e": None}]
+        self.assertEqual(extract_record_schema(records), 
+                         extract_table_schema(pd.DataFrame.from_dict(records)))
+        self.assertEqual(extract_record_schema(test_data), extract_table_schema(inputs[0]))
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,42 @@
+import unittest
+
+import numpy as np
+
+from falx.table.value_index import TableValueIndex, table_index, value_key
+
+
+class TestValueIndex(unittest.TestCase):
+
+	def setUp(self):
+		self.records = [
+			{"a": "north-east", "b": 1, "c": 1.5},
+			{"a": "south_west", "b": 2.0, "c": np.nan},
+			{"a": "north", "b": "1", "c": [1, 2]}]
+
+	def test_values(self):
+		index = TableValueIndex(self.records)
+		self.assertEqual(index.columns, ["a", "b", "c"])
+		# numbers and their string representations share keys
+		self.assertEqual(sorted(set(index.value_row_ids([value_key(1)]))), [0, 2])
+		self.assertEqual(sorted(set(index.value_row_ids([value_key(2)]))), [1])
+		self.assertEqual(sorted(set(index.value_row_ids([value_key(float("nan"))]))), [1])
+		self.assertEqual(sorted(set(index.value_row_ids([value_key("[1, 2]")]))), [2])
+		self.assertEqual(sorted(set(index.value_row_ids([value_key("west")]))), [])
+
+	def test_substrings(self):
+		index = TableValueIndex(self.records)
+		self.assertEqual(sorted(index.substring_row_ids("north")), [0, 2])
+		self.assertEqual(sorted(index.substring_row_ids("th")), [0, 1, 2])
+		self.assertEqual(index.substring_row_ids("h-e"), [0])
+		self.assertEqual(index.substring_row_ids("northwest"), [])
+		self.assertTrue(index.contains_substring(["_", "/"]))
+		self.assertFalse(index.contains_substring(["/"]))
+
+	def test_cache(self):
+		index = table_index(self.records)
+		self.assertIs(table_index(self.records), index)
+		self.assertIsNot(table_index(list(self.records)), index)
+
+
+if __name__ == '__main__':
+	unittest.main()
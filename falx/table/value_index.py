@@ -0,0 +1,100 @@
+from collections import OrderedDict
+
+from falx.utils.synth_utils import normalize_value, ValueInterner
+
+# length of n-grams in the substring index
+NGRAM_SIZE = 3
+
+# indexes of the most recently used input tables
+TABLE_INDEX_CACHE_SIZE = 16
+TABLE_INDEXES = OrderedDict()
+
+
+def value_key(val):
+	"""the key of a value after normalization, values share a key iff they share an id in ValueInterner"""
+	try:
+		hash(val)
+	except TypeError:
+		# unhashable values are compared by their string representation
+		return value_key(str(val))
+	norm = normalize_value(val)
+	return norm if norm == norm else ValueInterner._NAN
+
+
+class TableValueIndex(object):
+	"""Inverted index of an input table (a list of records), built once for all lookups on the table:
+		value_rows maps keys of values and of their string representations (see value_key) to rows containing them,
+		string_rows maps string values to rows containing them, with an n-gram index of strings for substring lookups.
+		values holds distinct (hashable) values of the table, compared as python values.
+	"""
+	def __init__(self, records):
+		self.records = records
+		self.num_rows = len(records)
+		self.columns = list(dict.fromkeys([k for r in records for k in r]))
+		self.values = set()
+
+		# lists of row ids
+		self.value_rows = {}
+		self.string_rows = {}
+		# keys of cells with the same value (and type) are computed once
+		memo = {}
+		for i, r in enumerate(records):
+			for v in r.values():
+				try:
+					cell = (v.__class__, v)
+					keys = memo.get(cell)
+					if keys is None:
+						keys = memo[cell] = (value_key(v), value_key(str(v)))
+					self.values.add(v)
+				except TypeError:
+					keys = (value_key(v), value_key(str(v)))
+				for key in keys:
+					self.value_rows.setdefault(key, []).append(i)
+				if isinstance(v, str):
+					self.string_rows.setdefault(v, []).append(i)
+		self.strings = list(self.string_rows.keys())
+
+		self.ngrams = None
+
+	def value_row_ids(self, keys):
+		"""rows containing a value (or a string representation of a value) with one of the keys (possibly repeated)"""
+		return [i for key in keys for i in self.value_rows.get(key, [])]
+
+	def substring_row_ids(self, val):
+		"""rows containing a string value with the substring (possibly repeated)"""
+		return [i for s in self.strings_containing(val) for i in self.string_rows[s]]
+
+	def strings_containing(self, val):
+		"""string values of the table containing the substring,
+			candidates are the strings sharing all n-grams of the substring (if it is long enough)"""
+		if len(val) < NGRAM_SIZE:
+			return [s for s in self.strings if val in s]
+		if self.ngrams is None:
+			self.ngrams = {}
+			for sid, s in enumerate(self.strings):
+				for g in set([s[k:k + NGRAM_SIZE] for k in range(len(s) - NGRAM_SIZE + 1)]):
+					self.ngrams.setdefault(g, []).append(sid)
+		candidates = None
+		for g in set([val[k:k + NGRAM_SIZE] for k in range(len(val) - NGRAM_SIZE + 1)]):
+			sids = set(self.ngrams.get(g, []))
+			candidates = sids if candidates is None else candidates & sids
+			if len(candidates) == 0:
+				return []
+		return [self.strings[sid] for sid in sorted(candidates) if val in self.strings[sid]]
+
+	def contains_substring(self, subs):
+		"""check if some string value contains one of the substrings"""
+		return any([sub in s for s in self.strings for sub in subs])
+
+
+def table_index(records):
+	"""the (cached) index of an input table, indexes are shared by all analyses of the same inputs"""
+	entry = TABLE_INDEXES.get(id(records))
+	if entry is not None and entry.records is records and entry.num_rows == len(records):
+		TABLE_INDEXES.move_to_end(id(records))
+		return entry
+	index = TableValueIndex(records)
+	TABLE_INDEXES[id(records)] = index
+	if len(TABLE_INDEXES) > TABLE_INDEX_CACHE_SIZE:
+		TABLE_INDEXES.popitem(last=False)
+	return index
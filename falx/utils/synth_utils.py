@@ -1,5 +1,8 @@
 import json
 import itertools
+import threading
+import contextlib
+from collections import Counter
 import numpy as np
 
 import pandas as pd
@@ -39,44 +42,36 @@ def check_table_inclusion(table1, table2, table2_dict=None, wild_card=None):
     if len(table1) == 0:
         return True
 
-    mapping = {}
-    vals2_dicts = {}
-
     #if we already have table2_dict ready, we don't need to re-compute
     if table2_dict is None:
-        vals2_dicts = {}
-        for k2 in table2[0].keys():
-            vals2_dicts[k2] = construct_value_dict([r[k2] for r in table2 if k2 in r])
+        table2_index = build_column_index(table2)
     else:
-        vals2_dicts = table2_dict
-    
-    for k1 in table1[0].keys():
-        mapping[k1] = []
-        vals1_dict = construct_value_dict([r[k1] for r in table1 if k1 in r])
-        for k2 in table2[0].keys():
-            vals2_dict = vals2_dicts[k2]
-            contained = True
-            for x in vals1_dict:
+        interner = value_interner()
+        table2_index = {k2: set(interner.intern_values(list(table2_dict[k2].keys()))) 
+                            for k2 in table2[0].keys()}
 
-                if wild_card != None and x == wild_card:
-                    # we consider this x value matches anything
-                    continue
+    return check_index_inclusion(build_column_index(table1), table2_index, wild_card)
 
-                if x not in vals2_dict:
-                    contained = False
-                if contained == False:
-                    break
-            if contained:
-                mapping[k1].append(k2)
 
-    #print(mapping)
+def build_column_index(table):
+    """index a table (records) for inclusion checks: map each column to the set of ids of its values
+        (values are interned by the interner of the current session, see value_interner)"""
+    if len(table) == 0:
+        return {}
+    interner = value_interner()
+    return {k: set(interner.intern_values([r[k] for r in table if k in r])) for k in table[0].keys()}
 
-    # distill plausible mappings from the table
-    # not all choices generated from the approach above generalize, we need to check consistency
-    t1_schema = list(mapping.keys())
-    mapping_id_lists = [list(range(len(mapping[key]))) for key in t1_schema]
-    check_ok = all([len(l) > 0 for l in mapping_id_lists])
-    return check_ok
+
+def check_index_inclusion(index1, index2, wild_card=None):
+    """the same as check_table_inclusion, on tables indexed by build_column_index:
+        every column of table1 should be contained by some column of table2"""
+    for vals1 in index1.values():
+        if wild_card is not None:
+            # wild card matches anything
+            vals1 = vals1 - set([value_interner().intern(wild_card)])
+        if not any([vals1 <= vals2 for vals2 in index2.values()]):
+            return False
+    return True
 
 
 def align_table_schema(table1, table2, check_equivalence=False, boolean_result=False, find_all_alignments=False):
@@ -91,14 +86,21 @@ def align_table_schema(table1, table2, check_equivalence=False, boolean_result=F
     if boolean_result and len(table1) == 0:
         return True
 
+    # values are compared by their ids (see ValueInterner)
+    interner = value_interner()
+    ids1 = {k1: interner.intern_values([r.get(k1) for r in table1]) for k1 in table1[0].keys()}
+    ids2 = {k2: interner.intern_values([r.get(k2) for r in table2]) for k2 in table2[0].keys()}
+    present1 = {k1: [k1 in r for r in table1] for k1 in table1[0].keys()}
+    present2 = {k2: [k2 in r for r in table2] for k2 in table2[0].keys()}
+
     mapping = {}
     vals2_dicts = {}
     for k2 in table2[0].keys():
-        vals2_dicts[k2] = construct_value_dict([r[k2] for r in table2 if k2 in r])
+        vals2_dicts[k2] = Counter([x for x, present in zip(ids2[k2], present2[k2]) if present])
 
     for k1 in table1[0].keys():
         mapping[k1] = []
-        vals1_dict = construct_value_dict([r[k1] for r in table1 if k1 in r])
+        vals1_dict = Counter([x for x, present in zip(ids1[k1], present1[k1]) if present])
         for k2 in table2[0].keys():
             vals2_dict = vals2_dicts[k2]
             contained = True
@@ -133,26 +135,20 @@ def align_table_schema(table1, table2, check_equivalence=False, boolean_result=F
     #if len(all_choices) == 1:
     #    return {key:mapping[key][0] for key in mapping}
 
+    # the same as table1 represented by value ids, the table does not depend on the mapping
+    frozen_table1 = Counter([tuple([ids1[key][i] for key in t1_schema if present1[key][i]]) 
+                                for i in range(len(table1))])
+
     all_alignments = []
     for mapping_id_choices in all_choices:
         # the following is an instantiation of the the mapping
         inst = { t1_schema[i]:mapping[t1_schema[i]][mapping_id_choices[i]] for i in range(len(t1_schema))}
 
-        def value_handling_func(val):
-            if isinstance(val, (int,)):
-                return val
-            try:
-                val = float(val)
-                val = np.round(val, 5)
-            except:
-                pass
-            return val
-
         # distill the tables for checking
-        frozen_table1 = [tuple([value_handling_func(r[key]) for key in t1_schema if key in r]) for r in table1]
-        frozen_table2 = [tuple([value_handling_func(r[inst[key]]) for key in t1_schema if inst[key] in r]) for r in table2]
+        frozen_table2 = Counter([tuple([ids2[inst[key]][i] for key in t1_schema if present2[inst[key]][i]]) 
+                                    for i in range(len(table2))])
 
-        if all([frozen_table1.count(t) <= frozen_table2.count(t) for t in frozen_table1]):
+        if all([frozen_table1[t] <= frozen_table2[t] for t in frozen_table1]):
             if find_all_alignments:
                 all_alignments.append(inst)
             else:
@@ -164,6 +160,123 @@ def align_table_schema(table1, table2, check_equivalence=False, boolean_result=F
     return None
 
 
+def table_dims(table):
+    """number of distinct columns and number of rows of a table represented as records,
+        columns with the same values (after normalization in align_table_schema) are counted once, 
+        since they can be aligned to the same column"""
+    if len(table) == 0:
+        return 0, 0
+    interner = value_interner()
+    columns = set([tuple(interner.intern_values([r.get(key) for r in table])) for key in table[0]])
+    return len(columns), len(table)
+
+
+def table_fingerprint(df):
+    """compute a hashable fingerprint of a dataframe, two tables with the same fingerprint
+        have the same column names, column types and rows (in the same order)"""
+    header = (tuple(df.columns), tuple(str(t) for t in df.dtypes))
+    try:
+        row_hashes = pd.util.hash_pandas_object(df, index=False).values
+        return header + (row_hashes.tobytes(),)
+    except TypeError:
+        # unhashable cell values, fall back to the (slower) tuple representation
+        return header + (tuple(df.astype(str).itertuples(index=False, name=None)),)
+
+
+def normalize_value(val):
+    """normalize a table value for comparison: numbers (and strings representing numbers) 
+        are compared as floats rounded to 5 decimals"""
+    if isinstance(val, (int,)):
+        return val
+    try:
+        return np.round(float(val), 5)
+    except:
+        return val
+
+
+class ValueInterner(object):
+    """Assign compact integer ids to table values, values that are equal after normalization 
+        (see normalize_value) share the same id. Each distinct value is normalized once, 
+        afterwards tables can be compared, hashed and indexed by value ids.
+        Ids are only meaningful within one interner (and until it is cleared), see value_interner.
+    """
+    # key of all NaN values (NaN is not equal to itself, it cannot be a dictionary key)
+    _NAN = ("nan",)
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        # normalized value -> id
+        self.ids = {}
+        # raw value -> id, to skip normalization of values seen before
+        self.raw_ids = {}
+        # id -> normalized value
+        self.values = []
+
+    def __len__(self):
+        return len(self.values)
+
+    def intern(self, val):
+        """the id of a value"""
+        try:
+            return self.raw_ids[val]
+        except KeyError:
+            pass
+        except TypeError:
+            # unhashable values are compared by their string representation
+            return self.intern(str(val))
+
+        norm = normalize_value(val)
+        key = norm if norm == norm else ValueInterner._NAN
+        vid = self.ids.get(key)
+        if vid is None:
+            vid = len(self.values)
+            self.ids[key] = vid
+            self.values.append(norm)
+        if val == val:
+            self.raw_ids[val] = vid
+        return vid
+
+    def intern_values(self, values):
+        """ids of a list of values, numeric columns are normalized in one pass"""
+        if len(values) > 0 and all([isinstance(v, (int, float, np.number)) for v in values]):
+            arr = np.round(np.array(values, dtype=np.float64), 5)
+            distinct, inverse = np.unique(arr, return_inverse=True)
+            distinct_ids = [self.intern(float(x)) for x in distinct]
+            return [distinct_ids[i] for i in inverse]
+        return [self.intern(v) for v in values]
+
+    def value(self, vid):
+        """the (normalized) value of an id"""
+        return self.values[vid]
+
+
+# the value interner of each thread (see value_interner)
+_THREAD_STATE = threading.local()
+
+
+def value_interner():
+    """the value interner of the current synthesis session, 
+        each thread has its own interner, which is replaced in a session (see value_interner_scope)"""
+    interner = getattr(_THREAD_STATE, "value_interner", None)
+    if interner is None:
+        interner = _THREAD_STATE.value_interner = ValueInterner()
+    return interner
+
+
+@contextlib.contextmanager
+def value_interner_scope():
+    """run a synthesis session with a fresh value interner in the current thread, 
+        ids of the session are not shared with other sessions (the previous interner is restored afterwards)"""
+    previous = getattr(_THREAD_STATE, "value_interner", None)
+    _THREAD_STATE.value_interner = ValueInterner()
+    try:
+        yield _THREAD_STATE.value_interner
+    finally:
+        _THREAD_STATE.value_interner = previous
+
+
 def construct_value_dict(values):
     new_values = []
     values = np.array(values)
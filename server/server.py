@@ -14,6 +14,7 @@ import time
 sys.path.append(os.path.abspath('../falx'))
 
 from falx.interface import FalxInterface
+from falx.table.value_index import table_index
 from falx.utils import vis_utils
 
 def infer_dtype(values):
@@ -37,12 +38,14 @@ def input_preprocessing(raw_input_data, raw_visual_elements):
     input_data = copy.deepcopy(raw_input_data)
     visual_elements = copy.deepcopy(raw_visual_elements)
 
-    all_input_values = list(set([val for r in input_data for key, val in r.items()])) + list(set([key for key in input_data[0]]))
+    # the index of the input table is reused by the synthesizer (input_data is passed to it as is)
+    index = table_index(input_data)
+    all_input_values = list(index.values) + list(set([key for key in input_data[0]]))
     splitted_values = []
-    for v in all_input_values:
-        if isinstance(v, (str,)) and "_" in v:
+    for v in index.strings + list(set([key for key in input_data[0]])):
+        if "_" in v:
             splitted_values += v.split("_")
-        if isinstance(v, (str,)) and "-" in v:
+        if "-" in v:
             splitted_values += v.split("-")
     all_input_values += splitted_values
     all_input_values = set(all_input_values)